@@ -0,0 +1,316 @@
+"""
+Created on 2026-10-18
+
+@author: wf
+"""
+
+import os
+import queue
+import threading
+import time
+from dataclasses import field
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import requests
+from basemkit.yamlable import lod_storable
+from urllib3.exceptions import ConnectTimeoutError, NewConnectionError
+from wikibaseintegrator.wbi_exceptions import MaxRetriesReachedException, MWApiError
+
+
+@lod_storable
+class BulkWriteRow:
+    """
+    the result of writing a single row
+
+    Attributes:
+        row_index(int): the lodRowIndex of the row
+        pk(str): the primary key value of the row (if any)
+        status(str): pending, checked (dry run), done or failed
+        qid(str): the id of the written item (if any)
+        attempts(int): the number of write attempts
+        errors(List[str]): the error messages of the last attempt
+    """
+
+    row_index: int
+    pk: Optional[str] = None
+    status: str = "pending"
+    qid: Optional[str] = None
+    attempts: int = 0
+    errors: List[str] = field(default_factory=list)
+
+
+@lod_storable
+class BulkWriteState:
+    """
+    the resumable state of a bulk write job
+    """
+
+    name: str
+    write: bool = False
+    rows: List[BulkWriteRow] = field(default_factory=list)
+
+    @classmethod
+    def get_yaml_path(cls, name: str) -> str:
+        home = str(Path.home())
+        yaml_path = f"{home}/.ose/bulkWrite/{name}.yaml"
+        return yaml_path
+
+    def save(self, yaml_path: str = None):
+        if yaml_path is None:
+            yaml_path = BulkWriteState.get_yaml_path(self.name)
+        os.makedirs(os.path.dirname(yaml_path), exist_ok=True)
+        self.save_to_yaml_file(yaml_path)
+
+    @classmethod
+    def load(cls, name: str, yaml_path: str = None) -> "BulkWriteState":
+        """
+        load the state of the job with the given name - a new state is
+        returned if there is none yet
+        """
+        if yaml_path is None:
+            yaml_path = BulkWriteState.get_yaml_path(name)
+        if os.path.isfile(yaml_path):
+            state = cls.load_from_yaml_file(yaml_path)
+        else:
+            state = cls(name=name)
+        return state
+
+    def add_rows(self, row_indices: List[int], pks: Dict[int, str] = None):
+        """
+        add the given rows unless they are already part of the job
+        """
+        known = {row.row_index for row in self.rows}
+        for row_index in row_indices:
+            if row_index not in known:
+                pk = pks.get(row_index, None) if pks else None
+                self.rows.append(BulkWriteRow(row_index=row_index, pk=pk))
+
+    def check_rows(self, get_pk: Callable[[int], Optional[str]]):
+        """
+        check that the rows of a resumed job still have their primary keys -
+        the row index is the position of the row in the sheet which changes
+        when rows are inserted or removed
+
+        Args:
+            get_pk(Callable): function to get the current primary key value of the row with the given index
+
+        Raises:
+            ValueError: if a row has a different primary key than when it was added
+        """
+        mismatches = [
+            f"row {row.row_index}: {row.pk!r} != {get_pk(row.row_index)!r}"
+            for row in self.rows
+            if row.pk != get_pk(row.row_index)
+        ]
+        if mismatches:
+            raise ValueError(
+                f"bulk write job {self.name} does not match the sheet any more: "
+                + ", ".join(mismatches)
+            )
+
+    def count(self, status: str) -> int:
+        return sum(1 for row in self.rows if row.status == status)
+
+
+class BulkWriter:
+    """
+    write rows to a wikibase as an unattended job
+
+    the rows are queued and written one after the other by a single worker
+    with a minimum interval between edits and the state is saved after every
+    row so that an interrupted job can be resumed
+
+    each row creates a new item so only errors of writes that are known not
+    to have been applied (connect errors, maxlag, throttling) are retried with
+    exponential backoff - after an ambiguous error e.g. a read timeout the item
+    is looked up by its primary key first to avoid creating a duplicate
+    """
+
+    # HTTP status codes and MediaWiki API error codes of writes that were not applied
+    TRANSIENT_STATUS = (429, 503)
+    TRANSIENT_CODES = ("maxlag", "ratelimited", "readonly")
+    # errors after which the write may or may not have been applied
+    AMBIGUOUS_STATUS = (500, 502, 504)
+    AMBIGUOUS_TYPES = (
+        requests.exceptions.ConnectionError,
+        requests.exceptions.Timeout,
+        ConnectionError,
+        TimeoutError,
+        MaxRetriesReachedException,
+    )
+
+    def __init__(
+        self,
+        write_record: Callable,
+        state: BulkWriteState,
+        yaml_path: str = None,
+        edits_per_minute: float = 30,
+        max_retries: int = 3,
+        backoff_factor: float = 5.0,
+        progress_callback: Callable = None,
+        find_record: Callable = None,
+        debug: bool = False,
+    ):
+        """
+        constructor
+
+        Args:
+            write_record(Callable): function to write the row with a given index returning a WikidataResult
+            state(BulkWriteState): the state of the job
+            yaml_path(str): the path to save the state to - default: ~/.ose/bulkWrite/<name>.yaml
+            edits_per_minute(float): the maximum number of edits per minute
+            max_retries(int): the maximum number of retries of transient errors
+            backoff_factor(float): the backoff factor for the retries in seconds
+            progress_callback(Callable): called with (BulkWriteRow, done, total) after each row
+            find_record(Callable): function to look up the QID of the item of the row with a given index - None if there is none
+            debug(bool): if True show debug information
+        """
+        self.write_record = write_record
+        self.state = state
+        self.find_record = find_record
+        self.yaml_path = yaml_path
+        self.min_interval = 60.0 / edits_per_minute if edits_per_minute else 0
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.progress_callback = progress_callback
+        self.debug = debug
+        self.queue = queue.Queue()
+        self.stopped = threading.Event()
+        self.last_edit = None
+        self.thread = None
+
+    def is_transient(self, error: Exception) -> bool:
+        """
+        check whether the given error is worth a retry since the write has
+        not been applied - by its type, its MediaWiki API error code or the
+        status code of its HTTP response
+        """
+        if isinstance(error, requests.exceptions.ConnectionError):
+            # the connection could not be established - nothing has been sent
+            reason = getattr(error.args[0], "reason", None) if error.args else None
+            return isinstance(error, requests.exceptions.ConnectTimeout) or isinstance(
+                reason, (NewConnectionError, ConnectTimeoutError)
+            )
+        if isinstance(error, ConnectionRefusedError):
+            return True
+        if isinstance(error, MWApiError):
+            return error.code in self.TRANSIENT_CODES
+        transient = self.get_status_code(error) in self.TRANSIENT_STATUS
+        return transient
+
+    def is_ambiguous(self, error: Exception) -> bool:
+        """
+        check whether the write may have been applied in spite of the given error
+        """
+        if self.is_transient(error):
+            return False
+        if isinstance(error, self.AMBIGUOUS_TYPES):
+            return True
+        ambiguous = self.get_status_code(error) in self.AMBIGUOUS_STATUS
+        return ambiguous
+
+    def get_status_code(self, error: Exception) -> Optional[int]:
+        """
+        get the status code of the HTTP response of the given error (if any)
+        """
+        response = getattr(error, "response", None)
+        status_code = getattr(response, "status_code", None)
+        return status_code
+
+    def wait_for_slot(self):
+        """
+        wait until the next edit is allowed by the rate limit
+        """
+        if self.last_edit is not None:
+            wait = self.last_edit + self.min_interval - time.monotonic()
+            if wait > 0:
+                self.stopped.wait(wait)
+        self.last_edit = time.monotonic()
+
+    def write_row(self, row: BulkWriteRow):
+        """
+        write the given row with retries on transient errors
+        """
+        for attempt in range(self.max_retries + 1):
+            if attempt > 0:
+                self.stopped.wait(self.backoff_factor * 2 ** (attempt - 1))
+            self.wait_for_slot()
+            if self.stopped.is_set():
+                return
+            row.attempts += 1
+            try:
+                result = self.write_record(row.row_index)
+                exceptions = list(result.errors.values())
+                errors = [f"{key}: {error}" for key, error in result.errors.items()]
+                row.qid = result.qid
+            except Exception as ex:
+                exceptions = [ex]
+                errors = [str(ex)]
+            if not errors:
+                if not self.state.write:
+                    row.errors = []
+                    row.status = "checked"
+                    return
+                if row.qid is not None:
+                    row.errors = []
+                    row.status = "done"
+                    return
+                errors = ["no item id returned"]
+            row.errors = errors
+            if self.state.write and any(self.is_ambiguous(ex) for ex in exceptions):
+                # the item may have been created - only retry if it has not
+                qid = self.find_record(row.row_index) if self.find_record else None
+                if qid is not None:
+                    row.qid = qid
+                    row.errors = []
+                    row.status = "done"
+                    return
+                if self.find_record is None:
+                    break
+            elif not any(self.is_transient(error) for error in exceptions):
+                break
+        row.status = "failed"
+
+    def run(self):
+        """
+        write all rows of my state that are not done - the rows that failed
+        or have only been checked by a dry run before are tried again
+        """
+        for row in self.state.rows:
+            if row.status != "done":
+                row.status = "pending"
+                self.queue.put(row)
+        self.work()
+
+    def work(self):
+        """
+        write the queued rows until the queue is empty or I am stopped
+        """
+        total = len(self.state.rows)
+        while not self.stopped.is_set():
+            try:
+                row = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            self.write_row(row)
+            self.state.save(self.yaml_path)
+            if self.debug:
+                print(f"row {row.row_index}: {row.status} {row.qid} {row.errors}")
+            if callable(self.progress_callback):
+                done = total - self.state.count("pending")
+                self.progress_callback(row, done, total)
+
+    def start(self) -> threading.Thread:
+        """
+        run the job in a background thread
+        """
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        return self.thread
+
+    def stop(self):
+        """
+        interrupt the job - the pending rows are kept for resuming
+        """
+        self.stopped.set()
@@ -11,6 +11,8 @@ from typing import Dict, Optional
 
 from basemkit.yamlable import lod_storable
 
+from onlinespreadsheet.querycache import QueryCache
+from onlinespreadsheet.restsession import RestSession
 from onlinespreadsheet.tablequery import QueryType, TableQuery
 
 
@@ -37,14 +39,20 @@ class EditConfig:
         self.queries[name] = query
         return self
 
-    def toTableQuery(self) -> TableQuery:
+    def toTableQuery(
+        self, cache: QueryCache = None, session: RestSession = None
+    ) -> TableQuery:
         """
         convert me to a TableQuery
 
+        Args:
+            cache(QueryCache): the cache for query results (if any)
+            session(RestSession): the session for RESTful queries - default: the shared session
+
         Returns:
             TableQuery: the table query for my queries
         """
-        tq = TableQuery()
+        tq = TableQuery(cache=cache, session=session)
         for name, query in self.queries.items():
             queryType = TableQuery.guessQueryType(query)
             if queryType is QueryType.INVALID:
@@ -0,0 +1,251 @@
+"""
+Created on 2026-10-18
+
+@author: wf
+"""
+
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional
+
+from ez_wikidata.wikidata import Wikidata
+from wikibaseintegrator.entities import ItemEntity
+from wikibaseintegrator.wbi_exceptions import MWApiError
+
+from onlinespreadsheet.restsession import RestSession
+
+
+class EntityCache:
+    """
+    in-memory LRU cache of entity JSON keyed by QID and revision
+
+    a given revision never changes - the latest known revision of a QID
+    is only used for the time to live after it has been fetched
+    """
+
+    def __init__(self, max_entries: int = 10000, ttl: float = 3600):
+        """
+        constructor
+
+        Args:
+            max_entries(int): the maximum number of entities to keep
+            ttl(float): the time to live of the latest known revision in seconds
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # entity json by (qid, revision) in least recently used order
+        self.entities = OrderedDict()
+        # (latest known revision, fetch time) by qid
+        self.revisions = {}
+        self.lock = threading.Lock()
+
+    def is_fresh(self, qid: str) -> bool:
+        """
+        check whether the latest revision of the given QID is known and has
+        not expired - to be called with my lock held
+
+        Args:
+            qid(str): the id of the entity
+
+        Returns:
+            bool: True if the latest known revision may be used
+        """
+        _revision, fetched = self.revisions.get(qid, (None, None))
+        fresh = fetched is not None and time.monotonic() - fetched <= self.ttl
+        return fresh
+
+    def get(self, qid: str, revision: int = None) -> Optional[dict]:
+        """
+        get the entity JSON of the given QID
+
+        Args:
+            qid(str): the id of the entity
+            revision(int): the revision - default: the latest known revision if it has not expired
+
+        Returns:
+            dict: the entity JSON or None if it is not cached
+        """
+        entity = None
+        with self.lock:
+            if revision is not None or self.is_fresh(qid):
+                if revision is None:
+                    revision = self.revisions[qid][0]
+                key = (qid, revision)
+                entity = self.entities.get(key, None)
+                if entity is not None:
+                    self.entities.move_to_end(key)
+        return entity
+
+    def put(self, entity: dict):
+        """
+        add the given entity JSON as returned by wbgetentities
+        """
+        qid = entity["id"]
+        revision = entity.get("lastrevid", None)
+        with self.lock:
+            self.entities[(qid, revision)] = entity
+            self.entities.move_to_end((qid, revision))
+            self.revisions[qid] = (revision, time.monotonic())
+            while len(self.entities) > self.max_entries:
+                (old_qid, old_revision), _entity = self.entities.popitem(last=False)
+                if self.revisions.get(old_qid, (None, None))[0] == old_revision:
+                    del self.revisions[old_qid]
+
+    def invalidate(self, qid: str):
+        """
+        forget the latest revision of the given QID e.g. after an edit
+        """
+        with self.lock:
+            revision, _fetched = self.revisions.pop(qid, (None, None))
+            self.entities.pop((qid, revision), None)
+
+    def __contains__(self, qid: str) -> bool:
+        """
+        check whether the latest revision of the given QID is cached and not expired
+        """
+        with self.lock:
+            return self.is_fresh(qid)
+
+    def __len__(self) -> int:
+        return len(self.entities)
+
+
+class EntityPrefetcher:
+    """
+    fetch the entities of many QIDs with wbgetentities in batches
+    """
+
+    QID_PATTERN = re.compile(r"(Q[0-9]+)$")
+
+    def __init__(
+        self,
+        api_url: str = "https://www.wikidata.org/w/api.php",
+        cache: EntityCache = None,
+        session: RestSession = None,
+        batch_size: int = 50,
+        max_workers: int = 4,
+        maxlag: int = None,
+        debug: bool = False,
+    ):
+        """
+        constructor
+
+        Args:
+            api_url(str): the url of the MediaWiki API of the wikibase
+            cache(EntityCache): the cache to fill - default: a new cache
+            session(RestSession): the session to use - default: the shared session
+            batch_size(int): the number of ids per request - 50 is the limit of wbgetentities
+            max_workers(int): the maximum number of concurrent requests
+            maxlag(int): the maxlag parameter of the requests in seconds (if any)
+            debug(bool): if True show debug information
+        """
+        self.api_url = api_url
+        self.cache = cache if cache is not None else EntityCache()
+        self.session = session if session is not None else RestSession.get_instance()
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.maxlag = maxlag
+        self.debug = debug
+        self.errors = []
+
+    @classmethod
+    def to_qid(cls, value) -> Optional[str]:
+        """
+        get the QID of the given item value e.g. Q42 or an entity url
+        """
+        qid = None
+        if isinstance(value, str):
+            match = cls.QID_PATTERN.search(value.strip())
+            if match:
+                qid = match.group(1)
+        return qid
+
+    def fetch_batch(self, qids: List[str]) -> Dict[str, dict]:
+        """
+        fetch the entities of the given QIDs with a single wbgetentities request
+
+        Args:
+            qids(list): at most batch_size QIDs
+
+        Returns:
+            dict: the entity JSON by QID
+
+        Raises:
+            MWApiError: if the API returned an error e.g. maxlag with HTTP status 200
+        """
+        params = {
+            "action": "wbgetentities",
+            "ids": "|".join(qids),
+            "format": "json",
+        }
+        if self.maxlag is not None:
+            params["maxlag"] = self.maxlag
+        response = self.session.get(self.api_url, params=params)
+        response.raise_for_status()
+        content = response.json()
+        if "error" in content:
+            raise MWApiError(content["error"])
+        entities = content.get("entities", {})
+        return entities
+
+    def prefetch(self, values: Iterable) -> int:
+        """
+        fetch the entities of the given item values that are not cached yet
+
+        Args:
+            values(Iterable): QIDs or entity urls - other values are ignored
+
+        Returns:
+            int: the number of fetched entities
+        """
+        qids = []
+        for value in values:
+            qid = self.to_qid(value)
+            if qid is not None and qid not in self.cache:
+                qids.append(qid)
+        qids = list(dict.fromkeys(qids))
+        batches = [
+            qids[start : start + self.batch_size]
+            for start in range(0, len(qids), self.batch_size)
+        ]
+        fetched = 0
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = [executor.submit(self.fetch_batch, batch) for batch in batches]
+            for future in futures:
+                try:
+                    entities = future.result()
+                except Exception as ex:
+                    self.errors.append(ex)
+                    continue
+                for entity in entities.values():
+                    if "missing" not in entity:
+                        self.cache.put(entity)
+                        fetched += 1
+        if self.debug:
+            print(f"prefetched {fetched} of {len(qids)} entities")
+        return fetched
+
+
+class PrefetchingWikidata(Wikidata):
+    """
+    Wikidata access that reads items from the entity cache of a prefetcher
+    if available
+    """
+
+    def __init__(self, baseurl: str = None, debug: bool = False, **kwargs):
+        Wikidata.__init__(self, baseurl, debug=debug, **kwargs)
+        self.prefetcher = EntityPrefetcher(api_url=self.apiurl, debug=debug)
+
+    def get_item(self, item_id: str) -> ItemEntity:
+        """
+        get the given item from the entity cache or read it
+        """
+        entity = self.prefetcher.cache.get(item_id)
+        if entity is not None:
+            item = ItemEntity(api=self.wbi).from_json(entity)
+        else:
+            item = Wikidata.get_item(self, item_id)
+        return item
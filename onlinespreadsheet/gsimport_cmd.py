@@ -60,6 +60,11 @@ class GoogleSheetWikidataCmd(WebserverCmd):
             default="en",
             help="Language to use for labels [default: %(default)s]",
         )
+        parser.add_argument(
+            "--snapshot",
+            action="store_true",
+            help="Show the latest local snapshot at startup while the sheets are downloaded [default: %(default)s]",
+        )
         return parser
 
 
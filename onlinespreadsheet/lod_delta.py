@@ -0,0 +1,181 @@
+"""
+Created on 2026-10-18
+
+@author: wf
+"""
+
+import hashlib
+import json
+from dataclasses import dataclass, field
+from itertools import chain
+from typing import Any, Dict, Iterable, List, Tuple
+
+
+def row_hash(row: dict, exclude: Iterable[str] = ()) -> str:
+    """
+    get a content hash of the given row that does not depend on the order
+    of the columns
+
+    Args:
+        row(dict): the row to hash
+        exclude(Iterable[str]): columns to ignore e.g. the lodRowIndex
+
+    Returns:
+        str: the hex digest of the row content
+    """
+    exclude = set(exclude)
+    content = {key: value for key, value in row.items() if key not in exclude}
+    text = json.dumps(content, sort_keys=True, default=str)
+    digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    return digest
+
+
+def lod_hash(lod: list) -> str:
+    """
+    get a content hash of the given list of dicts
+
+    Args:
+        lod(list): the rows to hash - the order of the rows is significant
+
+    Returns:
+        str: the hex digest of the content
+    """
+    text = json.dumps(lod, sort_keys=True, default=str)
+    digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    return digest
+
+
+@dataclass
+class LodDelta:
+    """
+    the row level changes between two imports of a list of dicts
+
+    the rows are matched by the value of their key column - rows with
+    a missing or duplicate key value are matched by their content
+
+    Attributes:
+        key_column(str): the primary key column
+        added(list): the rows of the new import that are not in the old one
+        removed(list): the rows of the old import that are not in the new one
+        modified(list): (old row, new row) tuples of rows with the same key and a different content
+        unchanged(int): the number of unchanged rows
+        hashes(dict): the row hashes of the new import by key - to be passed as old_hashes next time
+    """
+
+    key_column: str
+    added: List[dict] = field(default_factory=list)
+    removed: List[dict] = field(default_factory=list)
+    modified: List[Tuple[dict, dict]] = field(default_factory=list)
+    unchanged: int = 0
+    hashes: Dict[Any, str] = field(default_factory=dict)
+
+    @classmethod
+    def rows_by_key(
+        cls,
+        lod: list,
+        key_column: str,
+        exclude: Iterable[str] = (),
+        hashes: dict = None,
+    ) -> Tuple[Dict[Any, dict], Dict[Any, str]]:
+        """
+        get the rows and their hashes by key
+
+        Args:
+            lod(list): the rows
+            key_column(str): the primary key column
+            exclude(Iterable[str]): columns to ignore for the hashes
+            hashes(dict): known hashes by key - only the missing ones are calculated
+
+        Returns:
+            tuple: the rows by key and the row hashes by key
+        """
+        rows = {}
+        row_hashes = {}
+        for row in lod:
+            key = row.get(key_column, None)
+            if key is None or key == "" or key in rows:
+                # content key - see LodDelta
+                content_hash = row_hash(row, exclude)
+                key = ("#", content_hash)
+                row_hashes[key] = content_hash
+            elif hashes is not None and key in hashes:
+                row_hashes[key] = hashes[key]
+            else:
+                row_hashes[key] = row_hash(row, exclude)
+            rows[key] = row
+        return rows, row_hashes
+
+    @classmethod
+    def of(
+        cls,
+        old_lod: list,
+        new_lod: list,
+        key_column: str,
+        exclude: Iterable[str] = (),
+        old_hashes: Dict[Any, str] = None,
+    ) -> "LodDelta":
+        """
+        get the changes between the given imports
+
+        Args:
+            old_lod(list): the rows of the previous import
+            new_lod(list): the rows of the new import
+            key_column(str): the primary key column
+            exclude(Iterable[str]): columns to ignore e.g. the lodRowIndex
+            old_hashes(dict): the hashes of the previous delta to avoid hashing the old rows again
+
+        Returns:
+            LodDelta: the changes
+        """
+        exclude = set(exclude)
+        old_rows, old_row_hashes = cls.rows_by_key(
+            old_lod, key_column, exclude, old_hashes
+        )
+        new_rows, new_row_hashes = cls.rows_by_key(new_lod, key_column, exclude)
+        delta = cls(key_column=key_column, hashes=new_row_hashes)
+        for key, new_row in new_rows.items():
+            old_row = old_rows.get(key, None)
+            if old_row is None:
+                delta.added.append(new_row)
+            elif old_row_hashes[key] != new_row_hashes[key]:
+                delta.modified.append((old_row, new_row))
+            else:
+                delta.unchanged += 1
+        for key, old_row in old_rows.items():
+            if key not in new_rows:
+                delta.removed.append(old_row)
+        return delta
+
+    def apply(self, lod: list) -> list:
+        """
+        apply my changes to the given rows of the old import
+
+        Args:
+            lod(list): the rows of the old import
+
+        Returns:
+            list: the rows of the new import in the order of the old rows - added rows last
+        """
+        replaced = {id(old_row): new_row for old_row, new_row in self.modified}
+        removed = {id(old_row) for old_row in self.removed}
+        rows = [replaced.get(id(row), row) for row in lod if id(row) not in removed]
+        rows.extend(self.added)
+        return rows
+
+    def is_empty(self) -> bool:
+        return len(self) == 0
+
+    def changed_keys(self) -> list:
+        """
+        get the key values of the added and modified rows
+        """
+        rows = chain(self.added, (new_row for _old_row, new_row in self.modified))
+        keys = [row.get(self.key_column) for row in rows]
+        return keys
+
+    def __len__(self) -> int:
+        return len(self.added) + len(self.removed) + len(self.modified)
+
+    def __str__(self) -> str:
+        text = f"{len(self.added)} added, {len(self.removed)} removed, {len(self.modified)} modified, {self.unchanged} unchanged"
+        return text
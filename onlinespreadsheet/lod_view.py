@@ -0,0 +1,430 @@
+"""
+Created on 2026-10-18
+
+@author: wf
+"""
+
+import datetime
+import typing
+from collections.abc import MutableMapping
+
+
+class LodView:
+    """
+    lazy copy-on-write view of a list of dicts for display
+
+    the source list of dicts is not copied - None values and datetimes
+    are converted when a cell is accessed and modifications of the view
+    are kept as per cell overrides
+    """
+
+    def __init__(self, lod: list, nonValue: str = "-"):
+        """
+        constructor
+
+        Args:
+            lod(list): the source list of dicts
+            nonValue(str): the string to show for "None" values
+        """
+        self.lod = lod
+        self.nonValue = nonValue
+        # overridden cell values by row index
+        self.overrides = {}
+        # indices of the rows changed since the last pop_dirty
+        self.dirty = set()
+        # (sort/filter key, row order) of the last block request
+        self.order_cache = None
+
+    def __len__(self) -> int:
+        return len(self.lod)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            rows = [self.get_row(i) for i in range(*index.indices(len(self)))]
+            return rows
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(f"row index {index} out of range")
+        return ViewRow(self, index)
+
+    def __iter__(self) -> typing.Iterator["ViewRow"]:
+        for index in range(len(self)):
+            yield ViewRow(self, index)
+
+    def convert(self, value: typing.Any) -> typing.Any:
+        """
+        convert the given source value for display
+
+        Args:
+            value: the source value
+
+        Returns:
+            the display value
+        """
+        if value is None:
+            value = self.nonValue
+        elif type(value) is datetime.datetime:
+            value = str(value)
+        return value
+
+    def get_value(self, index: int, key: str) -> typing.Any:
+        """
+        get the display value of the given cell
+
+        Args:
+            index(int): the row index
+            key(str): the column
+
+        Returns:
+            the display value
+        """
+        row_overrides = self.overrides.get(index, None)
+        if row_overrides is not None and key in row_overrides:
+            value = row_overrides[key]
+        else:
+            value = self.convert(self.lod[index][key])
+        return value
+
+    def set_value(self, index: int, key: str, value: typing.Any):
+        """
+        override the display value of the given cell
+
+        Args:
+            index(int): the row index
+            key(str): the column
+            value: the display value
+        """
+        self.overrides.setdefault(index, {})[key] = value
+        self.dirty.add(index)
+        self.order_cache = None
+
+    def reset_row(self, index: int):
+        """
+        drop the overrides of the given row e.g. after its source row changed
+
+        Args:
+            index(int): the row index
+        """
+        self.overrides.pop(index, None)
+        self.dirty.add(index)
+        self.order_cache = None
+
+    def pop_dirty(self) -> typing.List[int]:
+        """
+        get and reset the indices of the rows changed since the last call
+
+        Returns:
+            list: the sorted row indices
+        """
+        dirty = sorted(self.dirty)
+        self.dirty.clear()
+        return dirty
+
+    def get_row(self, index: int) -> dict:
+        """
+        get the display record of the given row e.g. to send it to the grid
+
+        Args:
+            index(int): the row index
+
+        Returns:
+            dict: a new dict with the display values of the row
+        """
+        row = {key: self.convert(value) for key, value in self.lod[index].items()}
+        row_overrides = self.overrides.get(index, None)
+        if row_overrides:
+            row.update(row_overrides)
+        return row
+
+    def sort_key(self, value: typing.Any) -> tuple:
+        """
+        get a key to sort the given display value with values of other types
+
+        Args:
+            value: the display value
+
+        Returns:
+            tuple: the sort key - non values first, then numbers then strings
+        """
+        if value is None or value == self.nonValue:
+            key = (0, 0)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            key = (1, value)
+        else:
+            key = (2, str(value).lower())
+        return key
+
+    def matches(self, value: typing.Any, condition: dict) -> bool:
+        """
+        check whether the given display value matches the given
+        AG Grid filter condition
+
+        Args:
+            value: the display value
+            condition(dict): the filter condition e.g. {"filterType": "text", "type": "contains", "filter": "abc"}
+
+        Returns:
+            bool: True if the value matches
+        """
+        if "operator" in condition:
+            results = [self.matches(value, c) for c in condition["conditions"]]
+            return all(results) if condition["operator"] == "AND" else any(results)
+        op = condition.get("type", "contains")
+        blank = value is None or value == self.nonValue or value == ""
+        if op == "blank":
+            return blank
+        if op == "notBlank":
+            return not blank
+        if condition.get("filterType") == "number":
+            operand = condition.get("filter")
+            if operand is None or (
+                op == "inRange" and condition.get("filterTo") is None
+            ):
+                # incomplete conditions do not filter out any rows
+                return True
+            if blank:
+                return False
+            try:
+                number = float(value)
+            except (TypeError, ValueError):
+                return False
+            checks = {
+                "equals": lambda: number == operand,
+                "notEqual": lambda: number != operand,
+                "lessThan": lambda: number < operand,
+                "lessThanOrEqual": lambda: number <= operand,
+                "greaterThan": lambda: number > operand,
+                "greaterThanOrEqual": lambda: number >= operand,
+                "inRange": lambda: operand <= number <= condition.get("filterTo"),
+            }
+        else:
+            text = "" if blank else str(value).lower()
+            operand = str(condition.get("filter", "")).lower()
+            checks = {
+                "equals": lambda: text == operand,
+                "notEqual": lambda: text != operand,
+                "contains": lambda: operand in text,
+                "notContains": lambda: operand not in text,
+                "startsWith": lambda: text.startswith(operand),
+                "endsWith": lambda: text.endswith(operand),
+            }
+        check = checks.get(op, None)
+        if check is None:
+            # unsupported filter types do not filter out any rows
+            return True
+        return check()
+
+    def get_order(
+        self, sort_model: list = None, filter_model: dict = None
+    ) -> typing.List[int]:
+        """
+        get the row indices of the rows matching the given filter model
+        in the order of the given sort model - the order of the last request
+        is cached so that consecutive block requests do not sort again
+
+        Args:
+            sort_model(list): AG Grid sort model e.g. [{"colId": "label", "sort": "asc"}]
+            filter_model(dict): AG Grid filter model by column
+
+        Returns:
+            list: the row indices
+        """
+        sort_model = sort_model or []
+        filter_model = filter_model or {}
+        cache_key = repr((sort_model, sorted(filter_model.items())))
+        if self.order_cache is not None and self.order_cache[0] == cache_key:
+            return self.order_cache[1]
+        order = list(range(len(self)))
+        for column, condition in filter_model.items():
+            order = [
+                index
+                for index in order
+                if self.matches(ViewRow(self, index).get(column), condition)
+            ]
+        # stable sort - least significant column first
+        for sort in reversed(sort_model):
+            column = sort["colId"]
+            order.sort(
+                key=lambda index: self.sort_key(ViewRow(self, index).get(column)),
+                reverse=sort.get("sort") == "desc",
+            )
+        self.order_cache = (cache_key, order)
+        return order
+
+    def get_block(
+        self,
+        start_row: int,
+        end_row: int,
+        sort_model: list = None,
+        filter_model: dict = None,
+    ) -> typing.Tuple[list, int]:
+        """
+        get a block of display records e.g. for the AG Grid infinite row model
+
+        Args:
+            start_row(int): the first row of the block
+            end_row(int): the row after the last row of the block
+            sort_model(list): AG Grid sort model
+            filter_model(dict): AG Grid filter model
+
+        Returns:
+            (list, int): the display records of the block and the total number
+            of rows matching the filter model
+        """
+        order = self.get_order(sort_model, filter_model)
+        rows = [self.get_row(index) for index in order[start_row:end_row]]
+        return rows, len(order)
+
+    def to_lod(self) -> list:
+        """
+        get the display records of all rows
+        """
+        lod = [self.get_row(index) for index in range(len(self))]
+        return lod
+
+
+class ViewRow(MutableMapping):
+    """
+    a row of a LodView - reading converts source values, writing adds overrides
+    """
+
+    def __init__(self, view: LodView, index: int):
+        self.view = view
+        self.index = index
+
+    def __getitem__(self, key: str) -> typing.Any:
+        row_overrides = self.view.overrides.get(self.index, None)
+        if key not in self.view.lod[self.index] and not (
+            row_overrides and key in row_overrides
+        ):
+            raise KeyError(key)
+        return self.view.get_value(self.index, key)
+
+    def __setitem__(self, key: str, value: typing.Any):
+        self.view.set_value(self.index, key, value)
+
+    def __delitem__(self, key: str):
+        """
+        remove the override of the given cell - reverting to the source value
+        """
+        del self.view.overrides[self.index][key]
+        self.view.dirty.add(self.index)
+        self.view.order_cache = None
+
+    def __iter__(self) -> typing.Iterator[str]:
+        source = self.view.lod[self.index]
+        yield from source
+        for key in self.view.overrides.get(self.index, {}):
+            if key not in source:
+                yield key
+
+    def __len__(self) -> int:
+        return sum(1 for _key in self)
+
+    def __repr__(self) -> str:
+        return repr(self.view.get_row(self.index))
+
+
+class RowIndex:
+    """
+    lookup of the rows of a list of dicts by the value of a column
+
+    like LOD.getLookup the first row with a value wins and later rows with
+    the same value are kept as duplicates - the index is built once and
+    maintained on row inserts and updates
+    """
+
+    def __init__(self, lod: list, column: str):
+        """
+        constructor
+
+        Args:
+            lod(list): the list of dicts to index
+            column(str): the column to index by
+        """
+        self.column = column
+        self.lookup = {}
+        self.duplicates = []
+        self.rows = 0
+        self.missing = 0
+        for row in lod:
+            self.add(row)
+
+    def values_of(self, row: dict) -> list:
+        """
+        get the index values of the given row
+        """
+        value = row.get(self.column, None)
+        if value is None:
+            values = []
+        elif isinstance(value, list):
+            values = value
+        else:
+            values = [value]
+        return values
+
+    def add(self, row: dict):
+        """
+        add the given row to the index
+
+        Args:
+            row(dict): the row to add
+        """
+        self.rows += 1
+        values = self.values_of(row)
+        if not values:
+            self.missing += 1
+        for value in values:
+            if value in self.lookup:
+                self.duplicates.append(row)
+            else:
+                self.lookup[value] = row
+
+    def remove(self, row: dict):
+        """
+        remove the given row from the index - a duplicate row with the
+        same value takes its place
+
+        Args:
+            row(dict): the row to remove
+        """
+        self.rows -= 1
+        values = self.values_of(row)
+        if not values:
+            self.missing -= 1
+        self.duplicates = [dup for dup in self.duplicates if dup is not row]
+        for value in values:
+            if self.lookup.get(value, None) is row:
+                del self.lookup[value]
+                for dup in self.duplicates:
+                    if value in self.values_of(dup):
+                        self.duplicates.remove(dup)
+                        self.lookup[value] = dup
+                        break
+
+    @property
+    def is_unique(self) -> bool:
+        """
+        check whether every row has exactly one value and no value is duplicated
+        """
+        unique = self.missing == 0 and len(self.lookup) == self.rows
+        return unique
+
+    def get(self, value, default=None):
+        return self.lookup.get(value, default)
+
+    def keys(self):
+        return self.lookup.keys()
+
+    def items(self):
+        return self.lookup.items()
+
+    def __getitem__(self, value) -> dict:
+        return self.lookup[value]
+
+    def __contains__(self, value) -> bool:
+        return value in self.lookup
+
+    def __len__(self) -> int:
+        return len(self.lookup)
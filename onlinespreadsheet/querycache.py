@@ -0,0 +1,307 @@
+"""
+Created on 2026-10-18
+
+@author: wf
+"""
+
+import datetime
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from decimal import Decimal
+from pathlib import Path
+from typing import Any, Optional
+
+
+class QueryCache:
+    """
+    persistent on-disk cache for query results
+
+    the results are keyed by query language, source and normalized query text
+    and stored in a SQLite database - entries expire after their time to live
+    and the least recently used entries are evicted when the cache exceeds
+    its size bounds
+    """
+
+    # SPARQL string literals - the long quotes first
+    LITERAL_PATTERN = re.compile(
+        r'"""(?:[^"\\]|\\.|"(?!""))*"""'
+        r"|'''(?:[^'\\]|\\.|'(?!''))*'''"
+        r'|"(?:[^"\\\n]|\\.)*"'
+        r"|'(?:[^'\\\n]|\\.)*'"
+    )
+
+    def __init__(
+        self,
+        db_path: str = None,
+        ttl: float = 24 * 3600,
+        max_entries: int = 1000,
+        max_bytes: int = 256 * 1024 * 1024,
+        debug: bool = False,
+    ):
+        """
+        constructor
+
+        Args:
+            db_path(str): the path of the SQLite database - default: ~/.ose/queryCache.db
+            ttl(float): the default time to live of an entry in seconds
+            max_entries(int): the maximum number of entries to keep
+            max_bytes(int): the maximum total size of the cached results in bytes
+            debug(bool): if True show debug information
+        """
+        if db_path is None:
+            db_path = QueryCache.get_db_path()
+        self.db_path = db_path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.debug = debug
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        with self.lock, closing(sqlite3.connect(self.db_path)) as conn, conn:
+            conn.execute("""CREATE TABLE IF NOT EXISTS query_result (
+  key TEXT PRIMARY KEY,
+  lang TEXT,
+  source TEXT,
+  query TEXT,
+  result TEXT,
+  size INTEGER,
+  created REAL,
+  accessed REAL
+)""")
+
+    @classmethod
+    def get_db_path(cls) -> str:
+        """
+        get the default path of the cache database next to the edit configurations
+        """
+        home = str(Path.home())
+        db_path = f"{home}/.ose/queryCache.db"
+        return db_path
+
+    @classmethod
+    def normalize(cls, query: str) -> str:
+        """
+        normalize the given query text by collapsing whitespace
+        outside of string literals
+
+        Args:
+            query(str): the query text
+
+        Returns:
+            str: the normalized query text
+        """
+        parts = []
+        pos = 0
+        for match in cls.LITERAL_PATTERN.finditer(query):
+            parts.append(re.sub(r"\s+", " ", query[pos : match.start()]))
+            parts.append(match.group(0))
+            pos = match.end()
+        parts.append(re.sub(r"\s+", " ", query[pos:]))
+        normalized = "".join(parts).strip()
+        return normalized
+
+    @staticmethod
+    def encode_value(value: Any) -> Any:
+        """
+        JSON encoding of the values of a query result that are not JSON types
+        as a JSON object with a single key tagging the type - the keys of
+        the query result starting with $ are escaped by escape_keys
+
+        Args:
+            value: the value to encode
+
+        Returns:
+            the encoded value
+
+        Raises:
+            TypeError: if the value has a type that can not be stored
+        """
+        if isinstance(value, datetime.datetime):
+            return {"$datetime": value.isoformat()}
+        if isinstance(value, datetime.date):
+            return {"$date": value.isoformat()}
+        if isinstance(value, Decimal):
+            return {"$decimal": str(value)}
+        raise TypeError(f"{type(value).__name__} value {value!r} can not be cached")
+
+    @classmethod
+    def escape_keys(cls, value: Any) -> Any:
+        """
+        escape the keys starting with $ of the JSON objects in the given value
+        by doubling the $ so that they can not be mistaken for the type tags
+        of encode_value e.g. in MongoDB extended JSON results
+
+        Args:
+            value: the query result or a part of it
+
+        Returns:
+            the value with escaped keys
+        """
+        if isinstance(value, dict):
+            escaped = {}
+            for key, item in value.items():
+                if isinstance(key, str) and key.startswith("$"):
+                    key = f"${key}"
+                escaped[key] = cls.escape_keys(item)
+        elif isinstance(value, (list, tuple)):
+            escaped = [cls.escape_keys(item) for item in value]
+        else:
+            escaped = value
+        return escaped
+
+    @staticmethod
+    def decode_value(record: dict) -> Any:
+        """
+        decode a value encoded by encode_value and unescape the keys
+        escaped by escape_keys
+
+        Args:
+            record(dict): the JSON object to decode
+
+        Returns:
+            the decoded value or the record itself
+        """
+        if len(record) == 1:
+            key, value = next(iter(record.items()))
+            if key == "$datetime":
+                return datetime.datetime.fromisoformat(value)
+            if key == "$date":
+                return datetime.date.fromisoformat(value)
+            if key == "$decimal":
+                return Decimal(value)
+        # all other keys starting with $ have been escaped
+        if any(key.startswith("$") for key in record):
+            record = {
+                (key[1:] if key.startswith("$") else key): value
+                for key, value in record.items()
+            }
+        return record
+
+    @classmethod
+    def get_key(cls, lang: str, source: str, query: str) -> str:
+        """
+        get the cache key for the given query
+
+        Args:
+            lang(str): the language of the query e.g. sparql
+            source(str): the endpoint url or wikiId the query is run against
+            query(str): the query text
+
+        Returns:
+            str: the key
+        """
+        text = f"{lang.lower()}\n{source}\n{cls.normalize(query)}"
+        key = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        return key
+
+    def get(
+        self, lang: str, source: str, query: str, ttl: Optional[float] = None
+    ) -> Any:
+        """
+        get the cached result for the given query
+
+        Args:
+            lang(str): the language of the query e.g. sparql
+            source(str): the endpoint url or wikiId the query is run against
+            query(str): the query text
+            ttl(float): the time to live of the entry in seconds - default: my ttl
+
+        Returns:
+            the cached result or None if there is no valid entry
+        """
+        if ttl is None:
+            ttl = self.ttl
+        key = self.get_key(lang, source, query)
+        now = time.time()
+        result = None
+        with self.lock, closing(sqlite3.connect(self.db_path)) as conn, conn:
+            row = conn.execute(
+                "SELECT result, created FROM query_result WHERE key=?", (key,)
+            ).fetchone()
+            if row is not None:
+                text, created = row
+                if now - created <= ttl:
+                    try:
+                        result = json.loads(text, object_hook=self.decode_value)
+                        conn.execute(
+                            "UPDATE query_result SET accessed=? WHERE key=?",
+                            (now, key),
+                        )
+                    except (TypeError, ValueError):
+                        # not readable e.g. written by an older version
+                        conn.execute("DELETE FROM query_result WHERE key=?", (key,))
+        if self.debug:
+            status = "hit" if result is not None else "miss"
+            print(f"query cache {status} for {lang} query on {source}")
+        return result
+
+    def put(self, lang: str, source: str, query: str, result: Any):
+        """
+        store the given result for the given query
+
+        Args:
+            lang(str): the language of the query e.g. sparql
+            source(str): the endpoint url or wikiId the query is run against
+            query(str): the query text
+            result: the query result to store
+
+        Raises:
+            TypeError: if the result contains values that can not be stored
+        """
+        key = self.get_key(lang, source, query)
+        text = json.dumps(self.escape_keys(result), default=self.encode_value)
+        now = time.time()
+        with self.lock, closing(sqlite3.connect(self.db_path)) as conn, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO query_result VALUES (?,?,?,?,?,?,?,?)",
+                (key, lang.lower(), source, query, text, len(text), now, now),
+            )
+            self.evict(conn)
+
+    def evict(self, conn: sqlite3.Connection):
+        """
+        evict the least recently used entries until my size bounds are met
+
+        Args:
+            conn(sqlite3.Connection): the connection to use
+        """
+        count, total = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size),0) FROM query_result"
+        ).fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+        rows = conn.execute(
+            "SELECT key, size FROM query_result ORDER BY accessed ASC"
+        ).fetchall()
+        evicted = []
+        for key, size in rows:
+            # keep at least the most recent entry
+            if (count <= self.max_entries and total <= self.max_bytes) or count <= 1:
+                break
+            evicted.append((key,))
+            count -= 1
+            total -= size
+        conn.executemany("DELETE FROM query_result WHERE key=?", evicted)
+        if self.debug:
+            print(f"query cache evicted {len(evicted)} entries")
+
+    def size(self) -> int:
+        """
+        get the number of cached entries
+        """
+        with self.lock, closing(sqlite3.connect(self.db_path)) as conn:
+            count = conn.execute("SELECT COUNT(*) FROM query_result").fetchone()[0]
+        return count
+
+    def clear(self):
+        """
+        remove all entries
+        """
+        with self.lock, closing(sqlite3.connect(self.db_path)) as conn, conn:
+            conn.execute("DELETE FROM query_result")
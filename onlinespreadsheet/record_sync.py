@@ -5,9 +5,14 @@ separating ui and functional concerns
 @author: wf
 """
 
+import datetime
+import re
 import typing
 from dataclasses import dataclass
 from enum import Enum
+from itertools import chain
+
+import numpy as np
 
 
 class SyncStatus(Enum):
@@ -18,6 +23,20 @@ class SyncStatus(Enum):
     SYNC_POSSIBLE = ""
     OUT_SYNC = "❌"
 
+    @property
+    def code(self) -> int:
+        """
+        small integer code of this status
+        """
+        return SyncStatus._codes[self]
+
+    @classmethod
+    def of_code(cls, code: int) -> "SyncStatus":
+        """
+        get the status for the given small integer code
+        """
+        return cls._by_code[code]
+
 
 class SyncAction(Enum):
     """
@@ -31,25 +50,318 @@ class SyncAction(Enum):
     def __missing__(self, _key):
         return self.NOTHING
 
+    @property
+    def code(self) -> int:
+        """
+        small integer code of this action
+        """
+        return SyncAction._codes[self]
+
+    @classmethod
+    def of_code(cls, code: int) -> "SyncAction":
+        """
+        get the action for the given small integer code
+        """
+        return cls._by_code[code]
+
+
+# the code lookups are precomputed once instead of listing the members per call
+SyncStatus._by_code = tuple(SyncStatus)
+SyncStatus._codes = {status: code for code, status in enumerate(SyncStatus)}
+SyncAction._by_code = tuple(SyncAction)
+SyncAction._codes = {action: code for code, action in enumerate(SyncAction)}
+
+
+class ValueNormalizer:
+    """
+    registry of normalizers by property type to canonicalize values for comparison
+
+    e.g. "2024-01-01" and datetime(2024, 1, 1), " Q42" and
+    http://www.wikidata.org/entity/Q42 get the same comparison key -
+    the keys of hashable values are memoized
+    """
+
+    _instance = None
+
+    ENTITY_URL = re.compile(
+        r"^https?://www\.wikidata\.org/(?:entity|wiki)/([QPL][0-9]+)$"
+    )
+    MIDNIGHT_DATE = re.compile(
+        r"^([0-9]{4}-[0-9]{2}-[0-9]{2})(?:[T ]00:00(?::00(?:\.0+)?)?(?:Z|\+00:00)?)?$"
+    )
+
+    def __init__(self, cache_size: int = 100000):
+        """
+        constructor
+        Args:
+            cache_size: the maximum number of memoized comparison keys
+        """
+        self.cache_size = cache_size
+        self.cache = dict()
+        self.normalizers = dict()
+        for prop_type in ["string", "text", "extid"]:
+            self.register(prop_type, ValueNormalizer.normalize_text)
+        self.register("url", ValueNormalizer.normalize_url)
+        for prop_type in ["item", "itemid"]:
+            self.register(prop_type, ValueNormalizer.normalize_default)
+        for prop_type in ["date", "time"]:
+            self.register(prop_type, ValueNormalizer.normalize_date)
+
+    @classmethod
+    def get_instance(cls) -> "ValueNormalizer":
+        """
+        get the shared default ValueNormalizer
+        """
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    def register(
+        self, prop_type: str, normalizer: typing.Callable[[typing.Any], typing.Any]
+    ):
+        """
+        register the given normalizer for the given property type
+
+        Args:
+            prop_type: the property type e.g. extid
+            normalizer: function to get the comparison key of a value that is not None
+        """
+        self.normalizers[prop_type] = normalizer
+        self.cache.clear()
+
+    def normalize(self, value: typing.Any, prop_type: str = None) -> typing.Any:
+        """
+        get the comparison key of the given value
+
+        Args:
+            value: the value to normalize
+            prop_type: the property type of the value (if known)
+
+        Returns:
+            the hashable comparison key - None for None values
+        """
+        if value is None:
+            return None
+        try:
+            cache_key = (prop_type, type(value), value)
+            key = self.cache.get(cache_key, None)
+        except TypeError:
+            # unhashable values are not memoized
+            cache_key = None
+            key = None
+        if key is None:
+            normalizer = self.normalizers.get(
+                prop_type, ValueNormalizer.normalize_default
+            )
+            if isinstance(value, (list, tuple)):
+                key = tuple(self.normalize(item, prop_type) for item in value)
+                if len(key) == 1:
+                    key = key[0]
+            else:
+                key = normalizer(value)
+            if cache_key is not None:
+                if len(self.cache) >= self.cache_size:
+                    self.cache.clear()
+                self.cache[cache_key] = key
+        return key
+
+    @classmethod
+    def normalize_default(cls, value: typing.Any) -> typing.Any:
+        """
+        type independent normalization of dates, Wikidata items and entity URLs
+        """
+        if isinstance(value, (datetime.date, datetime.datetime)):
+            key = cls.normalize_date(value)
+        elif isinstance(getattr(value, "qid", None), str):
+            key = value.qid
+        elif isinstance(value, str):
+            key = value.strip()
+            match = cls.ENTITY_URL.match(key) or cls.MIDNIGHT_DATE.match(key)
+            if match:
+                key = match.group(1)
+        else:
+            key = str(value)
+        return key
+
+    @classmethod
+    def normalize_text(cls, value: typing.Any) -> str:
+        """
+        normalize text by stripping leading and trailing whitespace
+        """
+        key = str(value).strip()
+        return key
+
+    @classmethod
+    def normalize_url(cls, value: typing.Any) -> str:
+        """
+        normalize an url by stripping whitespace and trailing slashes
+        """
+        key = str(value).strip().rstrip("/")
+        return key
+
+    @classmethod
+    def normalize_date(cls, value: typing.Any) -> str:
+        """
+        normalize dates and datetimes at midnight to an ISO date
+        """
+        if isinstance(value, datetime.datetime):
+            if value.time() == datetime.time(0, 0):
+                key = value.date().isoformat()
+            else:
+                key = value.isoformat(sep=" ")
+        elif isinstance(value, datetime.date):
+            key = value.isoformat()
+        else:
+            key = str(value).strip()
+            match = cls.MIDNIGHT_DATE.match(key)
+            if match:
+                key = match.group(1)
+        return key
+
 
-@dataclass
 class ComparisonData:
     """
     Stores the property name and the values to compare
+
+    slotted with the sync status and the chosen sync action encoded as
+    small integer codes to keep the memory footprint per compared cell low
     """
-    property_name: str
-    left_value: typing.Any
-    right_value: typing.Any
-    chosen_sync_option: SyncAction = None
 
-    def get_sync_status(self):
+    __slots__ = (
+        "property_name",
+        "prop_type",
+        "_left_value",
+        "_right_value",
+        "_status_code",
+        "_chosen_code",
+        "_owner",
+    )
+
+    NO_CODE = -1
+
+    def __init__(
+        self,
+        property_name: str,
+        left_value: typing.Any,
+        right_value: typing.Any,
+        chosen_sync_option: SyncAction = None,
+        prop_type: str = None,
+    ):
+        """
+        constructor
+        Args:
+            property_name: name of the compared property
+            left_value: value to compare
+            right_value: value to compare
+            chosen_sync_option: the sync action chosen for the property (if any)
+            prop_type: the property type of the values (if known)
+        """
+        self.property_name = property_name
+        self.prop_type = prop_type
+        # the ComparisonRecord to notify about changes of the values
+        # and the chosen sync option
+        self._owner = None
+        self.left_value = left_value
+        self.right_value = right_value
+        self.chosen_sync_option = chosen_sync_option
+
+    @property
+    def left_value(self) -> typing.Any:
+        """
+        the left value to compare
+        """
+        return self._left_value
+
+    @left_value.setter
+    def left_value(self, value: typing.Any):
+        self._left_value = value
+        self.invalidate()
+
+    @property
+    def right_value(self) -> typing.Any:
+        """
+        the right value to compare
+        """
+        return self._right_value
+
+    @right_value.setter
+    def right_value(self, value: typing.Any):
+        self._right_value = value
+        self.invalidate()
+
+    def invalidate(self):
+        """
+        forget the computed sync status after a change of the values
+        """
+        self._status_code = ComparisonData.NO_CODE
+        if self._owner is not None:
+            self._owner.invalidate()
+
+    @property
+    def chosen_sync_option(self) -> typing.Optional[SyncAction]:
+        """
+        the sync action chosen for the property (if any)
+        """
+        action = None
+        if self._chosen_code != ComparisonData.NO_CODE:
+            action = SyncAction.of_code(self._chosen_code)
+        return action
+
+    @chosen_sync_option.setter
+    def chosen_sync_option(self, action: typing.Optional[SyncAction]):
+        self._chosen_code = ComparisonData.NO_CODE if action is None else action.code
+        if self._owner is not None:
+            self._owner.invalidate()
+
+    def __repr__(self) -> str:
+        text = (
+            f"ComparisonData(property_name={self.property_name!r}, "
+            f"left_value={self.left_value!r}, right_value={self.right_value!r}, "
+            f"chosen_sync_option={self.chosen_sync_option})"
+        )
+        return text
+
+    def __eq__(self, other) -> bool:
+        same = isinstance(other, ComparisonData) and (
+            self.property_name,
+            self.left_value,
+            self.right_value,
+            self._chosen_code,
+        ) == (
+            other.property_name,
+            other.left_value,
+            other.right_value,
+            other._chosen_code,
+        )
+        return same
+
+    def get_sync_status(self) -> SyncStatus:
         """
         compare the left and right value and return their sync status
+        - the status is computed once
         """
-        status = None
-        if str(self.left_value) == str(self.right_value):
+        if self._status_code == ComparisonData.NO_CODE:
+            if self._owner is not None:
+                normalizer = self._owner.normalizer
+            else:
+                normalizer = ValueNormalizer.get_instance()
+            status = ComparisonData.sync_status_of(
+                normalizer.normalize(self.left_value, self.prop_type),
+                normalizer.normalize(self.right_value, self.prop_type),
+            )
+            self._status_code = status.code
+        else:
+            status = SyncStatus.of_code(self._status_code)
+        return status
+
+    @staticmethod
+    def sync_status_of(left_key: typing.Any, right_key: typing.Any) -> SyncStatus:
+        """
+        get the sync status of the given normalized comparison keys
+        """
+        if left_key == right_key:
             status = SyncStatus.IN_SYNC
-        elif self.left_value is None or self.right_value is None:
+        elif left_key is None or right_key is None:
             status = SyncStatus.SYNC_POSSIBLE
         else:
             status = SyncStatus.OUT_SYNC
@@ -82,6 +394,41 @@ class ComparisonData:
         return action
 
 
+class PropertySchema:
+    """
+    ordered property names to be shared by the comparisons of the records of a sheet
+    """
+
+    def __init__(self, property_names: typing.Iterable[str]):
+        """
+        constructor
+        Args:
+            property_names: the property names - duplicates are ignored
+        """
+        self.property_names = tuple(dict.fromkeys(property_names))
+        self.index = {name: i for i, name in enumerate(self.property_names)}
+
+    @classmethod
+    def of_records(cls, *record_lists: typing.List[dict]) -> "PropertySchema":
+        """
+        get the schema of the keys of all records of the given lists of records
+        in the order of their first occurrence
+        """
+        property_names = dict()
+        for records in record_lists:
+            for record in records or []:
+                property_names.update(dict.fromkeys(record.keys()))
+        schema = cls(property_names)
+        return schema
+
+    def covers(self, record: dict) -> bool:
+        """
+        check whether all keys of the given record are part of this schema
+        """
+        covered = all(key in self.index for key in record)
+        return covered
+
+
 class ComparisonRecord:
     """
     Compares two dicts
@@ -93,12 +440,20 @@ class ComparisonRecord:
         left_record: dict,
         right_source_name: str,
         right_record: dict,
+        schema: PropertySchema = None,
+        property_types: typing.Dict[str, str] = None,
+        normalizer: ValueNormalizer = None,
     ):
         """
         constructor
         Args:
             left_record: record to compare
             right_record: record to compare
+            schema: the property order - shared by the records of a sheet.
+                If not given or not covering the records the keys of both records
+                are compared in the order of their occurrence
+            property_types: the types of the properties by property name (if known)
+            normalizer: the normalizer for the values - default: the shared ValueNormalizer
         """
         self.left_source_name = left_source_name
         self.right_source_name = right_source_name
@@ -107,36 +462,72 @@ class ComparisonRecord:
         if right_record is None:
             right_record = dict()
         self.comparison_data = dict()
-        property_names = []
-        for p in list(left_record.keys()) + list(right_record.keys()):
-            if p not in property_names:
-                property_names.append(p)
+        # only the keys of the records are compared - in schema order if covered
+        if (
+            schema is not None
+            and schema.covers(left_record)
+            and schema.covers(right_record)
+        ):
+            property_names = [
+                name
+                for name in schema.property_names
+                if name in left_record or name in right_record
+            ]
+        else:
+            property_names = dict.fromkeys(chain(left_record, right_record))
+        if property_types is None:
+            property_types = dict()
+        if normalizer is None:
+            normalizer = ValueNormalizer.get_instance()
+        # the values are normalized again after a change of a value
+        self.normalizer = normalizer
         for property_name in property_names:
+            prop_type = property_types.get(property_name, None)
             cd = ComparisonData(
                 property_name=property_name,
                 left_value=left_record.get(property_name, None),
                 right_value=right_record.get(property_name, None),
+                prop_type=prop_type,
             )
+            # canonicalize the values once to get the sync status
+            status = ComparisonData.sync_status_of(
+                normalizer.normalize(cd.left_value, prop_type),
+                normalizer.normalize(cd.right_value, prop_type),
+            )
+            cd._status_code = status.code
+            cd._owner = self
             self.comparison_data[property_name] = cd
+        self._update_records = None
+
+    def invalidate(self):
+        """
+        invalidate the cached update records e.g. after a chosen sync option changed
+        """
+        self._update_records = None
 
     def get_update_records(self) -> typing.Tuple[dict, dict]:
         """
-        Get the update records for both sides
+        Get the update records for both sides - the records are computed once
+        and recomputed only after a chosen sync option changed
 
         Returns:
             (dict, dict): updates that should be applied to both sides
         """
-        update_left = dict()
-        update_right = dict()
-        for cd in self.comparison_data.values():
-            action = cd.get_chosen_sync_option()
-            if action is SyncAction.LEFT_SYNC:
-                # right to left
-                update_left[cd.property_name] = cd.right_value
-            elif action is SyncAction.RIGHT_SYNC:
-                # left to right
-                update_right[cd.property_name] = cd.left_value
-        return update_left, update_right
+        if self._update_records is None:
+            update_left = dict()
+            update_right = dict()
+            for cd in self.comparison_data.values():
+                action = cd.get_chosen_sync_option()
+                if action is SyncAction.LEFT_SYNC:
+                    # right to left
+                    update_left[cd.property_name] = cd.right_value
+                elif action is SyncAction.RIGHT_SYNC:
+                    # left to right
+                    update_right[cd.property_name] = cd.left_value
+            self._update_records = (update_left, update_right)
+        update_left, update_right = self._update_records
+        # callers may modify the update records
+        return dict(update_left), dict(update_right)
 
     def get_update_record_of(self, source_name: str) -> dict:
         """
@@ -161,5 +552,189 @@ class SyncRequest:
     """
     Synchronization request containing the sync action to apply and the corresponding data
     """
+
     action: SyncAction
     data: ComparisonRecord
+
+
+class ComparisonMatrix:
+    """
+    Compares two lists of records column wise
+
+    the records are aligned by a key column and the sync status and
+    suggested sync action of all cells are computed at once and stored
+    as small integer codes (see SyncStatus.code and SyncAction.code)
+    in a rows x properties matrix
+    """
+
+    def __init__(
+        self,
+        left_source_name: str,
+        left_records: typing.List[dict],
+        right_source_name: str,
+        right_records: typing.List[dict],
+        key: str,
+        schema: PropertySchema = None,
+        property_types: typing.Dict[str, str] = None,
+        normalizer: ValueNormalizer = None,
+    ):
+        """
+        constructor
+        Args:
+            left_source_name: name of the left source
+            left_records: records to compare
+            right_source_name: name of the right source
+            right_records: records to compare
+            key: the column to align the records by - records without key are ignored
+            schema: the properties to compare - default: all keys of the records
+            property_types: the types of the properties by property name (if known)
+            normalizer: the normalizer for the values - default: the shared ValueNormalizer
+        """
+        self.left_source_name = left_source_name
+        self.right_source_name = right_source_name
+        self.key = key
+        left_by_key = self.get_lookup(left_records)
+        right_by_key = self.get_lookup(right_records)
+        self.keys = list(dict.fromkeys([*left_by_key.keys(), *right_by_key.keys()]))
+        self.row_index = {key_value: i for i, key_value in enumerate(self.keys)}
+        if schema is None:
+            schema = PropertySchema.of_records(left_records, right_records)
+        self.schema = schema
+        self.property_names = list(schema.property_names)
+        self.property_types = property_types if property_types is not None else dict()
+        if normalizer is None:
+            normalizer = ValueNormalizer.get_instance()
+        self.normalizer = normalizer
+        self.left_values = self.as_matrix(left_by_key)
+        self.right_values = self.as_matrix(right_by_key)
+        self.status, self.action = self.compare(
+            self.as_keys(self.left_values), self.as_keys(self.right_values)
+        )
+
+    def get_lookup(self, records: typing.List[dict]) -> typing.Dict[typing.Any, dict]:
+        """
+        get the given records by my key
+        """
+        lookup = dict()
+        for record in records or []:
+            key_value = record.get(self.key, None)
+            if key_value is not None:
+                lookup[key_value] = record
+        return lookup
+
+    def as_matrix(self, records_by_key: typing.Dict[typing.Any, dict]) -> np.ndarray:
+        """
+        get the values of the given records as rows x properties object matrix
+        with None for missing records and values
+        """
+        rows = len(self.keys)
+        matrix = np.empty((len(self.property_names), rows), dtype=object)
+        records = [records_by_key.get(key_value, None) for key_value in self.keys]
+        for col, property_name in enumerate(self.property_names):
+            values = (
+                record.get(property_name, None) if record is not None else None
+                for record in records
+            )
+            matrix[col] = np.fromiter(values, dtype=object, count=rows)
+        return matrix.T
+
+    def as_keys(self, values: np.ndarray) -> np.ndarray:
+        """
+        get the normalized comparison keys of the given value matrix
+        """
+        keys = np.empty(values.T.shape, dtype=object)
+        for col, property_name in enumerate(self.property_names):
+            prop_type = self.property_types.get(property_name, None)
+            column_keys = (
+                self.normalizer.normalize(value, prop_type) for value in values[:, col]
+            )
+            keys[col] = np.fromiter(column_keys, dtype=object, count=values.shape[0])
+        return keys.T
+
+    @staticmethod
+    def compare(
+        left_keys: np.ndarray, right_keys: np.ndarray
+    ) -> typing.Tuple[np.ndarray, np.ndarray]:
+        """
+        compare the given normalized comparison key matrices with the semantics of
+        ComparisonData.get_sync_status and ComparisonData.suggested_sync_action
+
+        Returns:
+            (np.ndarray, np.ndarray): the status and action code matrices
+        """
+        is_none = np.frompyfunc(lambda key: key is None, 1, 1)
+        left_none = is_none(left_keys).astype(bool)
+        right_none = is_none(right_keys).astype(bool)
+        equal = np.equal(left_keys, right_keys).astype(bool)
+        possible = ~equal & (left_none | right_none)
+        status = np.full(left_keys.shape, SyncStatus.OUT_SYNC.code, dtype=np.int8)
+        status[possible] = SyncStatus.SYNC_POSSIBLE.code
+        status[equal] = SyncStatus.IN_SYNC.code
+        action = np.full(left_keys.shape, SyncAction.NOTHING.code, dtype=np.int8)
+        action[possible & left_none] = SyncAction.LEFT_SYNC.code
+        action[possible & ~left_none] = SyncAction.RIGHT_SYNC.code
+        return status, action
+
+    def row_mask(self, status: SyncStatus) -> np.ndarray:
+        """
+        get a boolean mask of the rows that have at least one cell with the given status
+        """
+        mask = (self.status == status.code).any(axis=1)
+        return mask
+
+    def keys_with_status(self, status: SyncStatus) -> list:
+        """
+        get the keys of the rows that have at least one cell with the given status
+        """
+        keys = [self.keys[i] for i in np.flatnonzero(self.row_mask(status))]
+        return keys
+
+    def get_comparison_record(self, key_value) -> ComparisonRecord:
+        """
+        get a ComparisonRecord for the row with the given key value
+        """
+        i = self.row_index[key_value]
+        left_record = self.as_record(self.left_values[i])
+        right_record = self.as_record(self.right_values[i])
+        cr = ComparisonRecord(
+            self.left_source_name,
+            left_record,
+            self.right_source_name,
+            right_record,
+            schema=self.schema,
+            property_types=self.property_types,
+            normalizer=self.normalizer,
+        )
+        return cr
+
+    def as_record(self, values: np.ndarray) -> dict:
+        """
+        get the given row values as a record without the missing values
+        """
+        record = {
+            property_name: value
+            for property_name, value in zip(self.property_names, values)
+            if value is not None
+        }
+        return record
+
+    def get_update_records(
+        self,
+    ) -> typing.Tuple[typing.Dict[typing.Any, dict], typing.Dict[typing.Any, dict]]:
+        """
+        Get the update records for both sides based on the suggested sync actions
+
+        Returns:
+            (dict, dict): updates by key that should be applied to both sides
+        """
+        update_left = dict()
+        update_right = dict()
+        for updates, action, values in [
+            (update_left, SyncAction.LEFT_SYNC, self.right_values),
+            (update_right, SyncAction.RIGHT_SYNC, self.left_values),
+        ]:
+            rows, cols = np.nonzero(self.action == action.code)
+            for row, col in zip(rows, cols):
+                record = updates.setdefault(self.keys[row], dict())
+                record[self.property_names[col]] = values[row, col]
+        return update_left, update_right
@@ -0,0 +1,184 @@
+"""
+Created on 2026-10-18
+
+@author: wf
+"""
+
+import copy
+import threading
+from collections import OrderedDict
+from typing import Any, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+class RestSession:
+    """
+    pooled HTTP session for RESTful queries
+
+    keeps connections alive, limits the pool size per host and retries
+    with exponential backoff on 429 and 5xx responses - JSON results are
+    revalidated with their ETag / Last-Modified validators
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(
+        self,
+        pool_connections: int = 10,
+        pool_maxsize: int = 10,
+        retries: int = 3,
+        backoff_factor: float = 0.5,
+        timeout: tuple = (10, 60),
+        max_entries: int = 256,
+        max_bytes: int = 64 * 1024 * 1024,
+        debug: bool = False,
+    ):
+        """
+        constructor
+
+        Args:
+            pool_connections(int): the number of hosts to keep connection pools for
+            pool_maxsize(int): the maximum number of connections per host
+            retries(int): the number of retries on failed requests
+            backoff_factor(float): the backoff factor for the retries
+            timeout(tuple): the default (connect, read) timeout in seconds
+            max_entries(int): the maximum number of revalidatable responses to keep
+            max_bytes(int): the maximum total size of the kept responses in bytes
+            debug(bool): if True show debug information
+        """
+        self.timeout = timeout
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.debug = debug
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset(["GET", "HEAD"]),
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            max_retries=retry,
+        )
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({"Accept-Encoding": "gzip, deflate"})
+        # (etag, last_modified, parsed content, size) by url in least recently used order
+        self.validators = OrderedDict()
+        self.cached_bytes = 0
+        self.lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls) -> "RestSession":
+        """
+        get the shared RestSession instance
+        """
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+        return cls._instance
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        """
+        GET the given url
+
+        Args:
+            url(str): the url to get
+            **kwargs: further arguments for requests
+
+        Returns:
+            requests.Response: the response
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        response = self.session.get(url, **kwargs)
+        if self.debug:
+            print(f"GET {url}: {response.status_code}")
+        return response
+
+    def get_json(self, url: str) -> Tuple[int, Any]:
+        """
+        GET the JSON content of the given url - if the content has been
+        retrieved before a conditional request is sent and a copy of the
+        previously parsed content is returned on a 304 Not Modified response
+        so that callers always get their own copy
+
+        Args:
+            url(str): the url to get
+
+        Returns:
+            (int, Any): the status code and the parsed JSON content or None
+            if the request failed
+        """
+        with self.lock:
+            cached = self.validators.get(url, None)
+            if cached is not None:
+                self.validators.move_to_end(url)
+        headers = {}
+        if cached is not None:
+            etag, last_modified, _content, _size = cached
+            if etag:
+                headers["If-None-Match"] = etag
+            if last_modified:
+                headers["If-Modified-Since"] = last_modified
+        response = self.get(url, headers=headers)
+        content = None
+        if response.status_code == 304 and cached is not None:
+            content = copy.deepcopy(cached[2])
+        elif response.status_code == 200:
+            content = response.json()
+            etag = response.headers.get("ETag")
+            last_modified = response.headers.get("Last-Modified")
+            if etag or last_modified:
+                self.put_validators(
+                    url,
+                    etag,
+                    last_modified,
+                    copy.deepcopy(content),
+                    len(response.content),
+                )
+        return response.status_code, content
+
+    def put_validators(
+        self, url: str, etag: str, last_modified: str, content: Any, size: int
+    ):
+        """
+        keep the validators and the parsed content of the given url and evict
+        the least recently used entries exceeding my size bounds
+
+        Args:
+            url(str): the url
+            etag(str): the ETag of the response
+            last_modified(str): the Last-Modified date of the response
+            content(Any): the parsed JSON content of the response
+            size(int): the size of the raw content of the response in bytes
+        """
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            old = self.validators.pop(url, None)
+            if old is not None:
+                self.cached_bytes -= old[3]
+            self.validators[url] = (etag, last_modified, content, size)
+            self.cached_bytes += size
+            while (
+                len(self.validators) > self.max_entries
+                or self.cached_bytes > self.max_bytes
+            ):
+                _url, (_etag, _last_modified, _content, evicted) = (
+                    self.validators.popitem(last=False)
+                )
+                self.cached_bytes -= evicted
+
+    def close(self):
+        """
+        close all pooled connections
+        """
+        self.session.close()
@@ -0,0 +1,591 @@
+"""
+Created on 2026-10-18
+
+@author: wf
+"""
+
+import csv
+import io
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import gspread
+from ez_wikidata.wbquery import WikibaseQuery
+from gspread.utils import fill_gaps, numericise_all, to_records
+from spreadsheet.googlesheet import GoogleSheet
+
+from onlinespreadsheet.lod_delta import lod_hash
+from onlinespreadsheet.snapshot_store import SnapshotStore
+
+
+class GoogleSheetFetcher:
+    """
+    fetch the sheets of google spreadsheets with batched value requests
+    """
+
+    DRIVE_SCOPE = "https://www.googleapis.com/auth/drive.metadata.readonly"
+    EXPORT_URL = (
+        "https://docs.google.com/spreadsheets/d/{id}/export?format=csv&gid={gid}"
+    )
+
+    def __init__(self, debug: bool = False):
+        """
+        constructor
+
+        Args:
+            debug(bool): if True show debug information
+        """
+        self.debug = debug
+        # (GoogleSheet, gspread Spreadsheet) by url
+        self.spreadsheets = {}
+        # worksheet id by (url, sheet name)
+        self.gids = {}
+        self.lock = threading.Lock()
+
+    def open(self, url: str):
+        """
+        open the spreadsheet with the given url - the spreadsheet
+        metadata is only read once per url
+
+        Returns:
+            tuple: the GoogleSheet and the gspread Spreadsheet
+        """
+        with self.lock:
+            opened = self.spreadsheets.get(url, None)
+            if opened is None:
+                gs = GoogleSheet(url)
+                if not gs.credentials:
+                    raise Exception("Credentials not found.")
+                # the revision is only available via the Drive API
+                credentials = gs.credentials.with_scopes(gs.scopes + [self.DRIVE_SCOPE])
+                gc = gspread.authorize(credentials)
+                sh = gs.safe_api_call(gc.open_by_url, url)
+                opened = (gs, sh)
+                self.spreadsheets[url] = opened
+        return opened
+
+    def get_revision(self, url: str) -> Optional[str]:
+        """
+        get the revision of the spreadsheet with the given url
+
+        Returns:
+            str: the modification time of the spreadsheet or None if it is not available
+        """
+        gs, sh = self.open(url)
+        try:
+            revision = gs.safe_api_call(sh.get_lastUpdateTime)
+        except Exception as ex:
+            if self.debug:
+                print(f"revision of {url} not available: {ex}")
+            revision = None
+        return revision
+
+    @classmethod
+    def to_records(cls, values: List[list]) -> List[dict]:
+        """
+        convert the given cell values with a header row to records
+        the way gspread's get_all_records does
+        """
+        if not values:
+            return []
+        values = fill_gaps(values)
+        headers = values[0]
+        rows = [numericise_all(row) for row in values[1:]]
+        records = to_records(headers, rows)
+        return records
+
+    @classmethod
+    def iter_records(
+        cls, csv_file: Iterable[str], chunk_size: int = 1000
+    ) -> Iterator[List[dict]]:
+        """
+        parse the given CSV with a header row incrementally
+
+        Args:
+            csv_file(Iterable): the CSV text e.g. a text stream opened with newline=""
+            chunk_size(int): the number of records per chunk
+
+        Yields:
+            list: the next chunk of records converted like to_records does
+        """
+        reader = csv.reader(csv_file)
+        headers = next(reader, None)
+        if headers is None:
+            return
+        chunk = []
+        for row in reader:
+            if len(row) < len(headers):
+                row.extend([""] * (len(headers) - len(row)))
+            chunk.append(dict(zip(headers, numericise_all(row))))
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def stream_sheet(
+        self, url: str, sheet_name: str, chunk_size: int = 1000
+    ) -> Iterator[List[dict]]:
+        """
+        stream the given sheet as CSV export
+
+        Args:
+            url(str): the url of the spreadsheet
+            sheet_name(str): the name of the sheet
+            chunk_size(int): the number of records per chunk
+
+        Yields:
+            list: the next chunk of records
+        """
+        gs, sh = self.open(url)
+        key = (url, sheet_name)
+        gid = self.gids.get(key, None)
+        if gid is None:
+            worksheet = gs.safe_api_call(sh.worksheet, sheet_name)
+            gid = worksheet.id
+            self.gids[key] = gid
+        export_url = self.EXPORT_URL.format(id=sh.id, gid=gid)
+        with sh.client.session.get(export_url, stream=True) as response:
+            response.raise_for_status()
+            response.raw.decode_content = True
+            csv_file = io.TextIOWrapper(response.raw, encoding="utf-8", newline="")
+            yield from self.iter_records(csv_file, chunk_size)
+
+    def fetch_sheets(self, url: str, sheet_names: List[str]) -> Dict[str, List[dict]]:
+        """
+        fetch the given sheets with a single request
+
+        Args:
+            url(str): the url of the spreadsheet
+            sheet_names(list): the names of the sheets to fetch
+
+        Returns:
+            dict: the list of dicts by sheet name
+        """
+        gs, sh = self.open(url)
+        ranges = [
+            "'" + sheet_name.replace("'", "''") + "'" for sheet_name in sheet_names
+        ]
+        result = gs.safe_api_call(sh.values_batch_get, ranges)
+        sheets = {}
+        for sheet_name, value_range in zip(sheet_names, result.get("valueRanges", [])):
+            sheets[sheet_name] = self.to_records(value_range.get("values", []))
+        return sheets
+
+
+@dataclass
+class SpreadsheetEntry:
+    """
+    the cached sheets and wikibase queries of a spreadsheet
+
+    Attributes:
+        url(str): the url of the spreadsheet
+        revision(str): the revision the sheets were fetched at
+        fetched(float): the monotonic time the entry was created at
+        sheets(dict): the list of dicts by sheet name
+        mapping_hash(str): the content hash of the mapping sheet
+        wbQueries(dict): the wikibase queries parsed from the mapping sheet
+    """
+
+    url: str
+    revision: Optional[str] = None
+    fetched: float = field(default_factory=time.monotonic)
+    sheets: Dict[str, List[dict]] = field(default_factory=dict)
+    mapping_hash: Optional[str] = None
+    wbQueries: Optional[Dict[str, WikibaseQuery]] = None
+
+
+class SheetCache:
+    """
+    cache of google spreadsheets
+
+    the sheets of a spreadsheet are fetched in a single batch and kept
+    until the revision of the spreadsheet changes - if the revision is
+    not available the sheets are kept for a time to live - the mapping
+    sheet and the data sheets are fetched concurrently and the mapping
+    is only parsed again if its content changed
+
+    the number of cached rows is bounded - the least recently used
+    sheets are evicted first
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(
+        self,
+        fetcher=None,
+        revision_ttl: float = 5.0,
+        ttl: float = 60.0,
+        snapshot_store: SnapshotStore = None,
+        max_rows: int = 1000000,
+        max_workers: int = 4,
+        debug: bool = False,
+    ):
+        """
+        constructor
+
+        Args:
+            fetcher: the fetcher to use - default: a GoogleSheetFetcher
+            revision_ttl(float): the number of seconds a revision check stays valid
+            ttl(float): the number of seconds sheets without revision stay valid
+            snapshot_store(SnapshotStore): the store to take snapshots of fetched sheets in (if any)
+            max_rows(int): the maximum number of rows to keep in memory
+            max_workers(int): the number of workers to preload sheets with
+            debug(bool): if True show debug information
+        """
+        self.fetcher = fetcher if fetcher is not None else GoogleSheetFetcher(debug)
+        self.revision_ttl = revision_ttl
+        self.ttl = ttl
+        self.snapshot_store = snapshot_store
+        self.max_rows = max_rows
+        self.debug = debug
+        # SpreadsheetEntry by url
+        self.entries = {}
+        # (revision, time of the check) by url
+        self.revisions = {}
+        # number of rows by (url, sheet name) in least recently used order
+        self.usage = OrderedDict()
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="sheet-preload"
+        )
+        # pending preloads by (url, sheet name)
+        self.preloads = {}
+        self.lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls) -> "SheetCache":
+        """
+        get the shared SheetCache instance
+        """
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls(snapshot_store=SnapshotStore())
+        return cls._instance
+
+    def take_snapshots(self, url: str, sheets: Dict[str, List[dict]], revision: str):
+        """
+        take snapshots of the given fetched sheets if I have a snapshot store
+        """
+        if self.snapshot_store is not None:
+            for sheet_name, lod in sheets.items():
+                self.snapshot_store.put(url, sheet_name, lod, revision)
+
+    def get_revision(self, url: str) -> Optional[str]:
+        """
+        get the revision of the given spreadsheet - the result of a recent
+        check is reused so that the sheets of a reload need a single check
+
+        a revision that is not available is not asked for again within my ttl
+        """
+        with self.lock:
+            revision, checked = self.revisions.get(url, (None, None))
+        ttl = self.revision_ttl if revision is not None else self.ttl
+        if checked is None or time.monotonic() - checked > ttl:
+            revision = self.fetcher.get_revision(url)
+            with self.lock:
+                self.revisions[url] = (revision, time.monotonic())
+        return revision
+
+    def get_valid_entry(self, url: str, revision: str) -> Optional[SpreadsheetEntry]:
+        """
+        get the cached entry of the given url if it has the given revision
+        or - without revision - if it is younger than my ttl
+        """
+        with self.lock:
+            entry = self.entries.get(url, None)
+        if not self.is_valid(entry, revision):
+            entry = None
+        return entry
+
+    def is_valid(self, entry: Optional[SpreadsheetEntry], revision: str) -> bool:
+        """
+        check whether the given entry is valid for the given revision
+        """
+        if entry is None:
+            return False
+        if revision is None:
+            age = time.monotonic() - entry.fetched
+            valid = entry.revision is None and age <= self.ttl
+        else:
+            valid = entry.revision == revision
+        return valid
+
+    def get_lod(self, url: str, sheet_name: str) -> Optional[List[dict]]:
+        """
+        get the cached list of dicts of the given sheet without any network access
+
+        Returns:
+            list: the rows of the sheet or None if the sheet is not cached
+        """
+        with self.lock:
+            entry = self.entries.get(url, None)
+            lod = entry.sheets.get(sheet_name, None) if entry else None
+            if lod is not None:
+                self.usage.move_to_end((url, sheet_name))
+        return lod
+
+    def put_sheet(
+        self, url: str, revision: Optional[str], sheet_name: str, lod: List[dict]
+    ) -> SpreadsheetEntry:
+        """
+        cache the given rows of a sheet fetched at the given revision
+
+        Returns:
+            SpreadsheetEntry: the entry the sheet has been added to
+        """
+        entry = self.get_valid_entry(url, revision)
+        if entry is None:
+            entry = self.put_entry(SpreadsheetEntry(url=url, revision=revision))
+        self.add_sheet(entry, sheet_name, lod)
+        return entry
+
+    def add_sheet(self, entry: SpreadsheetEntry, sheet_name: str, lod: List[dict]):
+        """
+        add the given rows of a sheet to the given entry
+        """
+        key = (entry.url, sheet_name)
+        with self.lock:
+            entry.sheets[sheet_name] = lod
+            self.usage[key] = len(lod)
+            self.usage.move_to_end(key)
+            self.evict()
+
+    def put_entry(
+        self, entry: SpreadsheetEntry, replace: bool = False
+    ) -> SpreadsheetEntry:
+        """
+        cache the given entry unless an entry for the same revision has
+        been cached concurrently e.g. by a stream of the same spreadsheet
+
+        Args:
+            entry(SpreadsheetEntry): the new entry
+            replace(bool): if True replace a valid entry as well
+
+        Returns:
+            SpreadsheetEntry: the cached entry
+        """
+        with self.lock:
+            current = self.entries.get(entry.url, None)
+            if not replace and self.is_valid(current, entry.revision):
+                return current
+            self.entries[entry.url] = entry
+            for key in [key for key in self.usage if key[0] == entry.url]:
+                del self.usage[key]
+        return entry
+
+    def evict(self):
+        """
+        evict the least recently used sheets until at most max_rows rows
+        are cached - the most recently used sheet is always kept
+        """
+        total = sum(self.usage.values())
+        while total > self.max_rows and len(self.usage) > 1:
+            (url, sheet_name), rows = self.usage.popitem(last=False)
+            entry = self.entries.get(url, None)
+            if entry is not None:
+                entry.sheets.pop(sheet_name, None)
+            total -= rows
+            if self.debug:
+                print(f"evicted {sheet_name} with {rows} rows")
+
+    def invalidate(self, url: str):
+        """
+        forget the cached sheets of the given url
+        """
+        with self.lock:
+            self.entries.pop(url, None)
+            for key in [key for key in self.usage if key[0] == url]:
+                del self.usage[key]
+
+    def load(
+        self,
+        url: str,
+        sheet_names: List[str],
+        mapping_sheet_name: str = "WikidataMapping",
+        force: bool = False,
+    ) -> SpreadsheetEntry:
+        """
+        load the given sheets and the wikibase queries of the given spreadsheet
+
+        Args:
+            url(str): the url of the spreadsheet
+            sheet_names(list): the names of the sheets to load
+            mapping_sheet_name(str): the name of the sheet with the Wikidata mapping
+            force(bool): if True fetch again even if the revision did not change
+
+        Returns:
+            SpreadsheetEntry: the entry with the loaded sheets
+        """
+        revision = self.get_revision(url)
+        with self.lock:
+            cached = self.entries.get(url, None)
+        entry = self.get_valid_entry(url, revision)
+        if entry is None or force:
+            entry = SpreadsheetEntry(url=url, revision=revision)
+            entry = self.put_entry(entry, replace=force)
+        missing = [name for name in sheet_names if name not in entry.sheets]
+        fetch_mapping = entry.wbQueries is None
+        if missing or fetch_mapping:
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                sheets_future = None
+                mapping_future = None
+                if missing:
+                    sheets_future = executor.submit(
+                        self.fetcher.fetch_sheets, url, missing
+                    )
+                if fetch_mapping:
+                    mapping_future = executor.submit(
+                        self.fetcher.fetch_sheets, url, [mapping_sheet_name]
+                    )
+                fetched = {}
+                if mapping_future is not None:
+                    fetched.update(mapping_future.result())
+                    mapping_rows = fetched.get(mapping_sheet_name, [])
+                    self.set_mapping(entry, cached, mapping_rows)
+                if sheets_future is not None:
+                    sheets = sheets_future.result()
+                    for sheet_name, lod in sheets.items():
+                        self.add_sheet(entry, sheet_name, lod)
+                    fetched.update(sheets)
+            self.take_snapshots(url, fetched, revision)
+            if self.debug:
+                print(f"fetched {missing} of {url} at revision {revision}")
+        return entry
+
+    def load_sheet(self, url: str, sheet_name: str) -> List[dict]:
+        """
+        get the given sheet from the cache if the revision did not change
+        otherwise fetch it
+
+        Args:
+            url(str): the url of the spreadsheet
+            sheet_name(str): the name of the sheet
+
+        Returns:
+            list: the rows of the sheet
+        """
+        lod = self.load_sheets(url, [sheet_name])[sheet_name]
+        return lod
+
+    def load_sheets(self, url: str, sheet_names: List[str]) -> Dict[str, List[dict]]:
+        """
+        get the given sheets from the cache if the revision did not change -
+        the sheets that are not cached are fetched with a single request
+
+        Args:
+            url(str): the url of the spreadsheet
+            sheet_names(list): the names of the sheets
+
+        Returns:
+            dict: the rows by sheet name
+        """
+        revision = self.get_revision(url)
+        entry = self.get_valid_entry(url, revision)
+        lods = {}
+        missing = []
+        for sheet_name in sheet_names:
+            lod = self.get_lod(url, sheet_name) if entry is not None else None
+            if lod is None:
+                missing.append(sheet_name)
+            else:
+                lods[sheet_name] = lod
+        if missing:
+            fetched = self.fetcher.fetch_sheets(url, missing)
+            for sheet_name, lod in fetched.items():
+                self.put_sheet(url, revision, sheet_name, lod)
+            self.take_snapshots(url, fetched, revision)
+            lods.update(fetched)
+        return lods
+
+    def preload(self, url: str, sheet_names: List[str]) -> Dict[str, Future]:
+        """
+        fetch and parse the given sheets in the background - the sheets
+        without pending preload are fetched together in a single batch
+
+        Args:
+            url(str): the url of the spreadsheet
+            sheet_names(list): the names of the sheets to preload
+
+        Returns:
+            dict: the future of the rows by sheet name - pending preloads are shared
+        """
+        futures = {}
+        batch = {}
+        with self.lock:
+            for sheet_name in sheet_names:
+                key = (url, sheet_name)
+                future = self.preloads.get(key, None)
+                if future is None or future.done():
+                    future = Future()
+                    self.preloads[key] = future
+                    batch[sheet_name] = future
+                futures[sheet_name] = future
+        if batch:
+            self.executor.submit(self.run_preload, url, batch)
+        return futures
+
+    def run_preload(self, url: str, futures: Dict[str, Future]):
+        """
+        load the given sheets and resolve their preload futures
+        """
+        try:
+            lods = self.load_sheets(url, list(futures))
+            for sheet_name, future in futures.items():
+                future.set_result(lods[sheet_name])
+        except Exception as ex:
+            for future in futures.values():
+                if not future.done():
+                    future.set_exception(ex)
+
+    def set_mapping(
+        self,
+        entry: SpreadsheetEntry,
+        cached: Optional[SpreadsheetEntry],
+        mapping_rows: List[dict],
+    ):
+        """
+        set the wikibase queries of the given entry from the given mapping rows
+        reusing the queries of the cached entry if the mapping did not change
+        """
+        mapping_hash = lod_hash(mapping_rows)
+        if cached is not None and cached.mapping_hash == mapping_hash:
+            wbQueries = cached.wbQueries
+        else:
+            wbQueries = WikibaseQuery.ofMapRows(mapping_rows, debug=self.debug)
+        entry.mapping_hash = mapping_hash
+        entry.wbQueries = wbQueries
+
+    def stream_lod(
+        self, url: str, sheet_name: str, chunk_size: int = 1000
+    ) -> Iterator[List[dict]]:
+        """
+        stream the given sheet in chunks - from the cache if the revision
+        did not change otherwise from the CSV export which is cached when
+        it has been read completely
+
+        Args:
+            url(str): the url of the spreadsheet
+            sheet_name(str): the name of the sheet
+            chunk_size(int): the number of records per chunk
+
+        Yields:
+            list: the next chunk of records
+        """
+        revision = self.get_revision(url)
+        entry = self.get_valid_entry(url, revision)
+        lod = self.get_lod(url, sheet_name) if entry is not None else None
+        if lod is not None:
+            for start in range(0, len(lod), chunk_size):
+                yield lod[start : start + chunk_size]
+            return
+        lod = []
+        for chunk in self.fetcher.stream_sheet(url, sheet_name, chunk_size):
+            lod.extend(chunk)
+            yield chunk
+        self.put_sheet(url, revision, sheet_name, lod)
+        self.take_snapshots(url, {sheet_name: lod}, revision)
@@ -0,0 +1,216 @@
+"""
+Created on 2026-10-18
+
+@author: wf
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from contextlib import closing
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Optional
+
+
+@dataclass
+class Snapshot:
+    """
+    a version of an imported sheet
+
+    Attributes:
+        url(str): the url of the spreadsheet
+        sheet_name(str): the name of the sheet
+        content_hash(str): the content hash of the rows - see lod_hash
+        revision(str): the revision of the spreadsheet (if known)
+        rows(int): the number of rows
+        created(float): the time the snapshot was taken
+    """
+
+    url: str
+    sheet_name: str
+    content_hash: str
+    revision: Optional[str]
+    rows: int
+    created: float
+
+
+class SnapshotStore:
+    """
+    local store of the imported sheets
+
+    the rows are stored as compressed JSON in a SQLite database keyed
+    by their content hash - a snapshot of a sheet refers to its content so
+    that unchanged imports do not take any additional space and the
+    latest import is available without network access
+    """
+
+    def __init__(
+        self,
+        db_path: str = None,
+        max_versions: int = 10,
+        debug: bool = False,
+    ):
+        """
+        constructor
+
+        Args:
+            db_path(str): the path of the SQLite database - default: ~/.ose/snapshots.db
+            max_versions(int): the maximum number of snapshots to keep per sheet
+            debug(bool): if True show debug information
+        """
+        if db_path is None:
+            db_path = SnapshotStore.get_db_path()
+        self.db_path = db_path
+        self.max_versions = max_versions
+        self.debug = debug
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        with self.lock, closing(sqlite3.connect(self.db_path)) as conn, conn:
+            conn.execute("""CREATE TABLE IF NOT EXISTS content (
+  content_hash TEXT PRIMARY KEY,
+  data BLOB,
+  rows INTEGER,
+  size INTEGER
+)""")
+            conn.execute("""CREATE TABLE IF NOT EXISTS snapshot (
+  url TEXT,
+  sheet_name TEXT,
+  content_hash TEXT,
+  revision TEXT,
+  rows INTEGER,
+  created REAL
+)""")
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS snapshot_sheet ON snapshot (url, sheet_name, created)"
+            )
+
+    @classmethod
+    def get_db_path(cls) -> str:
+        """
+        get the default path of the snapshot database next to the edit configurations
+        """
+        home = str(Path.home())
+        db_path = f"{home}/.ose/snapshots.db"
+        return db_path
+
+    def put(
+        self, url: str, sheet_name: str, lod: list, revision: str = None
+    ) -> Snapshot:
+        """
+        take a snapshot of the given rows
+
+        Args:
+            url(str): the url of the spreadsheet
+            sheet_name(str): the name of the sheet
+            lod(list): the rows of the sheet
+            revision(str): the revision of the spreadsheet (if known)
+
+        Returns:
+            Snapshot: the new snapshot or the latest one if the content did not change
+        """
+        # same serialization as lod_hash so that the text is only created once
+        text = json.dumps(lod, sort_keys=True, default=str).encode("utf-8")
+        content_hash = hashlib.sha256(text).hexdigest()
+        latest = self.latest(url, sheet_name)
+        if latest is not None and latest.content_hash == content_hash:
+            return latest
+        data = zlib.compress(text)
+        snapshot = Snapshot(
+            url, sheet_name, content_hash, revision, len(lod), time.time()
+        )
+        with self.lock, closing(sqlite3.connect(self.db_path)) as conn, conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO content VALUES (?,?,?,?)",
+                (content_hash, data, len(lod), len(data)),
+            )
+            conn.execute(
+                "INSERT INTO snapshot VALUES (?,?,?,?,?,?)",
+                (url, sheet_name, content_hash, revision, len(lod), snapshot.created),
+            )
+            self.prune(conn, url, sheet_name)
+        if self.debug:
+            print(
+                f"snapshot of {sheet_name} with {len(lod)} rows: {len(data)} bytes {content_hash[:12]}"
+            )
+        return snapshot
+
+    def prune(self, conn: sqlite3.Connection, url: str, sheet_name: str):
+        """
+        remove the snapshots of the given sheet exceeding max_versions and
+        the content that is not referenced any more
+
+        Args:
+            conn(sqlite3.Connection): the connection to use
+            url(str): the url of the spreadsheet
+            sheet_name(str): the name of the sheet
+        """
+        conn.execute(
+            """DELETE FROM snapshot WHERE url=? AND sheet_name=? AND rowid NOT IN (
+  SELECT rowid FROM snapshot WHERE url=? AND sheet_name=?
+  ORDER BY created DESC, rowid DESC LIMIT ?
+)""",
+            (url, sheet_name, url, sheet_name, self.max_versions),
+        )
+        conn.execute(
+            "DELETE FROM content WHERE content_hash NOT IN (SELECT content_hash FROM snapshot)"
+        )
+
+    def history(self, url: str, sheet_name: str) -> List[Snapshot]:
+        """
+        get the snapshots of the given sheet
+
+        Returns:
+            list: the snapshots - the latest first
+        """
+        with self.lock, closing(sqlite3.connect(self.db_path)) as conn:
+            rows = conn.execute(
+                "SELECT * FROM snapshot WHERE url=? AND sheet_name=? ORDER BY created DESC, rowid DESC",
+                (url, sheet_name),
+            ).fetchall()
+        snapshots = [Snapshot(*row) for row in rows]
+        return snapshots
+
+    def latest(self, url: str, sheet_name: str) -> Optional[Snapshot]:
+        """
+        get the latest snapshot of the given sheet
+
+        Returns:
+            Snapshot: the latest snapshot or None if there is none
+        """
+        with self.lock, closing(sqlite3.connect(self.db_path)) as conn:
+            row = conn.execute(
+                "SELECT * FROM snapshot WHERE url=? AND sheet_name=? ORDER BY created DESC, rowid DESC LIMIT 1",
+                (url, sheet_name),
+            ).fetchone()
+        snapshot = Snapshot(*row) if row is not None else None
+        return snapshot
+
+    def get_lod(self, content_hash: str) -> Optional[list]:
+        """
+        get the rows with the given content hash
+
+        Returns:
+            list: the rows or None if the content is not available
+        """
+        with self.lock, closing(sqlite3.connect(self.db_path)) as conn:
+            row = conn.execute(
+                "SELECT data FROM content WHERE content_hash=?", (content_hash,)
+            ).fetchone()
+        lod = json.loads(zlib.decompress(row[0])) if row is not None else None
+        return lod
+
+    def load_latest(self, url: str, sheet_name: str) -> Optional[list]:
+        """
+        get the rows of the latest snapshot of the given sheet
+
+        Returns:
+            list: the rows or None if there is no snapshot
+        """
+        snapshot = self.latest(url, sheet_name)
+        lod = self.get_lod(snapshot.content_hash) if snapshot is not None else None
+        return lod
@@ -4,14 +4,22 @@ Created on 2024-03-19
 @author: wf
 """
 
-from typing import List
+import asyncio
+import copy
+import json
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional
 
 from ez_wikidata.wbquery import WikibaseQuery
 from lodstorage.sparql import SPARQL
 from ngwidgets.lod_grid import ListOfDictsGrid
 from ngwidgets.widgets import Link
 from nicegui import run, ui
-from spreadsheet.googlesheet import GoogleSheet
+
+from onlinespreadsheet.lod_delta import LodDelta
+from onlinespreadsheet.sheet_cache import SheetCache
+from onlinespreadsheet.snapshot_store import Snapshot
 
 # from onlinespreadsheet.wdgrid import GridSync
 
@@ -19,6 +27,9 @@ from spreadsheet.googlesheet import GoogleSheet
 class SpreadSheetView:
     """
     shows a Spreadsheet
+
+    each of the sheets is shown in a tab - the sheets that are not visible
+    are fetched and parsed in the background by the workers of the sheet cache
     """
 
     def __init__(self, solution):
@@ -34,7 +45,24 @@ class SpreadSheetView:
         self.endpoint = self.args.endpoint
         self.sparql = SPARQL(self.endpoint)
         self.lang = self.args.lang
+        self.sheet_cache = SheetCache.get_instance()
+        # number of rows pushed to the grid at once while streaming
+        self.chunk_size = 1000
+        # grid by sheet name
+        self.lod_grids = {}
+        # the cached rows each grid shows by sheet name
+        self.grid_sources = {}
+        # the column identifying the rows of each grid for row transactions by sheet name
+        self.row_id_columns = {}
+        # names of the sheets whose grid shows a snapshot instead of the downloaded sheet
+        self.snapshot_sheets = set()
+        # the changes of the last reload and the row hashes by sheet name to compare the next one with
+        self.delta = None
+        self.row_hashes = {}
+        self.wbQueries = {}
         self.setup_ui()
+        if self.args.snapshot:
+            ui.timer(0, self.warm_start, once=True)
         # self.grid_sync=GridSync()
 
     def setup_ui(self):
@@ -52,46 +80,311 @@ class SpreadSheetView:
                 on_change=self.on_change_url,
             )
             ui.button("reload", on_click=self.reload)
-        with ui.row() as self.grid_row:
-            self.lod_grid = ListOfDictsGrid()
+        with ui.tabs(value=self.sheetName, on_change=self.on_change_tab) as self.tabs:
+            for sheet_name in self.sheetNames:
+                ui.tab(sheet_name)
+        with ui.tab_panels(self.tabs, value=self.sheetName).classes(
+            "w-full"
+        ) as self.grid_row:
+            for sheet_name in self.sheetNames:
+                with ui.tab_panel(sheet_name):
+                    self.lod_grids[sheet_name] = ListOfDictsGrid()
+        self.lod_grid = self.lod_grids[self.sheetName]
 
         # ui.timer(0, self.reload, once=True)
 
-    def load_items_from_selected_sheet(self) -> List[dict]:
+    def load_items_from_selected_sheet(self, sheet_name: str = None) -> List[dict]:
         """
         Extract the records from the selected sheet and returns them as LoD
 
+        Args:
+            sheet_name(str): the name of the sheet - default: the selected sheet
+
         Returns:
             List of dicts containing the sheet content
         """
+        if sheet_name is None:
+            sheet_name = self.sheetName
+        # the mapping and the sheet are fetched concurrently - the other
+        # sheets are preloaded in the background
+        entry = self.sheet_cache.load(self.url, [sheet_name], self.mappingSheetName)
+        self.set_wb_queries(entry.wbQueries)
+        items = self.sheet_cache.get_lod(self.url, sheet_name)
+        if items is None:
+            # evicted in the meantime
+            items = self.sheet_cache.load_sheet(self.url, sheet_name)
+        wbQuery = self.wbQueries.get(sheet_name, None)
+        # self.gridSync.wbQuery = wbQuery
+        return items
 
-        self.wbQueries = GoogleSheet.toWikibaseQuery(
-            self.url, self.mappingSheetName, debug=self.debug
-        )
+    def set_wb_queries(self, wbQueries: Dict[str, WikibaseQuery]):
+        """
+        set the wikibase queries of the Wikidata mapping
+        """
+        self.wbQueries = wbQueries
         if len(self.wbQueries) == 0:
             print(
                 f"Warning Wikidata mapping sheet {self.mappingSheetName} not defined!"
             )
-        self.gs = GoogleSheet(self.url)
-        self.gs.open([self.sheetName])
-        items = self.gs.asListOfDicts(self.sheetName)
-        wbQuery = self.wbQueries.get(self.sheetName, None)
-        # self.gridSync.wbQuery = wbQuery
+
+    def load_mapping(self) -> Dict[str, WikibaseQuery]:
+        """
+        load the Wikidata mapping without any data sheet
+
+        Returns:
+            dict: the wikibase queries by sheet name
+        """
+        entry = self.sheet_cache.load(self.url, [], self.mappingSheetName)
+        self.set_wb_queries(entry.wbQueries)
+        return self.wbQueries
+
+    def stream_selected_sheet(self, sheet_name: str = None) -> List[dict]:
+        """
+        stream the selected sheet to the grid in chunks so that the
+        first rows show up before the whole sheet has been parsed
+
+        Args:
+            sheet_name(str): the name of the sheet - default: the selected sheet
+
+        Returns:
+            List of dicts containing the sheet content
+        """
+        if sheet_name is None:
+            sheet_name = self.sheetName
+        lod_grid = self.lod_grids[sheet_name]
+        items = []
+        keys = set()
+        row_id_column = None
+        self.row_hashes.pop(sheet_name, None)
+        progress = ui.notification(f"loading {sheet_name} ...", timeout=None)
+        for chunk in self.sheet_cache.stream_lod(self.url, sheet_name, self.chunk_size):
+            # the grid may change its rows - keep the cached rows intact
+            chunk = copy.deepcopy(chunk)
+            items.extend(chunk)
+            if row_id_column is not None:
+                keys.update(row.get(row_id_column, None) for row in chunk)
+            if len(items) == len(chunk):
+                row_id_column = self.set_row_id_option(sheet_name, items)
+                if row_id_column is not None:
+                    keys = {row[row_id_column] for row in items}
+                # the grid must not see the rows that are added by transactions
+                lod_grid.load_lod(list(items))
+            elif row_id_column is not None and (
+                len(keys) < len(items) or None in keys or "" in keys
+            ):
+                # the primary key does not identify the rows - push all rows once
+                row_id_column = self.set_row_id_option(sheet_name, items)
+                lod_grid.lod = list(items)
+                lod_grid.update()
+            else:
+                lod_grid.ag_grid.run_grid_method("applyTransaction", {"add": chunk})
+            progress.message = f"loaded {len(items)} rows of {sheet_name}"
+        progress.dismiss()
+        lod_grid.lod = items
+        lod_grid.update_index(lenient=lod_grid.config.lenient)
         return items
 
+    def get_pk_column(self, sheet_name: str = None) -> str:
+        """
+        get the column of the primary key property of the given sheet
+
+        Args:
+            sheet_name(str): the name of the sheet - default: the selected sheet
+
+        Returns:
+            str: the column from the Wikidata mapping or the pk argument itself
+        """
+        if sheet_name is None:
+            sheet_name = self.sheetName
+        pk_column = self.args.pk
+        wbQuery = self.wbQueries.get(sheet_name, None)
+        if wbQuery is not None and self.args.pk in wbQuery.propertiesByName:
+            pk_column = wbQuery.propertiesByName[self.args.pk]["Column"]
+        return pk_column
+
+    def get_row_id_column(self, sheet_name: str, lod: List[dict]) -> Optional[str]:
+        """
+        get the primary key column of the given sheet if it identifies the given rows
+
+        Args:
+            sheet_name(str): the name of the sheet
+            lod(list): the rows
+
+        Returns:
+            str: the primary key column or None if its values are missing or not unique
+        """
+        pk_column = self.get_pk_column(sheet_name)
+        keys = {row.get(pk_column, None) for row in lod}
+        if len(keys) < len(lod) or None in keys or "" in keys:
+            pk_column = None
+        return pk_column
+
+    def set_row_id_option(self, sheet_name: str, lod: List[dict]) -> Optional[str]:
+        """
+        identify the rows of the grid of the given sheet by their primary key
+        so that the changes of a reload can be applied as row transactions -
+        to be called before the given rows are pushed to the grid
+
+        Args:
+            sheet_name(str): the name of the sheet
+            lod(list): the rows to be shown
+
+        Returns:
+            str: the row id column or None if the rows can not be identified
+        """
+        lod_grid = self.lod_grids[sheet_name]
+        row_id_column = self.get_row_id_column(sheet_name, lod)
+        if row_id_column is None:
+            lod_grid.ag_grid.options.pop(":getRowId", None)
+        else:
+            lod_grid.ag_grid.options[":getRowId"] = (
+                f"(params) => String(params.data[{json.dumps(row_id_column)}])"
+            )
+        self.row_id_columns[sheet_name] = row_id_column
+        return row_id_column
+
+    def apply_items(self, items: List[dict], sheet_name: str = None):
+        """
+        show the given newly imported items - only the changes against the
+        rows shown are applied
+
+        Args:
+            items(list): the rows of the new import
+            sheet_name(str): the name of the sheet - default: the selected sheet
+        """
+        if sheet_name is None:
+            sheet_name = self.sheetName
+        lod_grid = self.lod_grids[sheet_name]
+        old_lod = lod_grid.lod or []
+        # the grid may change its rows - keep the cached rows intact
+        items = copy.deepcopy(items)
+        self.delta = LodDelta.of(
+            old_lod,
+            items,
+            self.get_pk_column(sheet_name),
+            old_hashes=self.row_hashes.get(sheet_name, None),
+        )
+        self.row_hashes[sheet_name] = self.delta.hashes
+        if not self.delta.is_empty():
+            lod = self.delta.apply(old_lod)
+            row_id_column = self.row_id_columns.get(sheet_name, None)
+            if row_id_column is not None and row_id_column == self.get_row_id_column(
+                sheet_name, lod
+            ):
+                transaction = {
+                    "add": self.delta.added,
+                    "update": [new_row for _old_row, new_row in self.delta.modified],
+                    "remove": self.delta.removed,
+                }
+                lod_grid.lod = lod
+                lod_grid.ag_grid.run_grid_method("applyTransaction", transaction)
+                lod_grid.update_index(lenient=lod_grid.config.lenient)
+            else:
+                # the rows can not be identified - they are pushed once
+                lod_grid.lod = lod
+                self.set_row_id_option(sheet_name, lod)
+                lod_grid.update()
+        ui.notify(f"{sheet_name}: {self.delta}")
+
+    def show_items(self, sheet_name: str, items: List[dict]):
+        """
+        show the given cached rows in the grid of the given sheet in background
+        """
+        with self.solution.content_div:
+            try:
+                lod_grid = self.lod_grids[sheet_name]
+                if lod_grid.lod:
+                    self.apply_items(items, sheet_name)
+                else:
+                    # the grid may change its rows - keep the cached rows intact
+                    lod = copy.deepcopy(items)
+                    self.set_row_id_option(sheet_name, lod)
+                    lod_grid.load_lod(lod)
+                self.grid_sources[sheet_name] = items
+            except Exception as ex:
+                self.solution.handle_exception(ex)
+
+    def load_snapshot(self, sheet_name: str = None) -> Optional[Snapshot]:
+        """
+        show the latest snapshot of the given sheet
+
+        Args:
+            sheet_name(str): the name of the sheet - default: the selected sheet
+
+        Returns:
+            Snapshot: the snapshot shown or None if there is none
+        """
+        if sheet_name is None:
+            sheet_name = self.sheetName
+        snapshot_store = self.sheet_cache.snapshot_store
+        snapshot = None
+        if snapshot_store is not None:
+            snapshot = snapshot_store.latest(self.url, sheet_name)
+        if snapshot is not None:
+            items = snapshot_store.get_lod(snapshot.content_hash)
+            self.set_row_id_option(sheet_name, items)
+            self.lod_grids[sheet_name].load_lod(items)
+            self.snapshot_sheets.add(sheet_name)
+            self.row_hashes.pop(sheet_name, None)
+            created = datetime.fromtimestamp(snapshot.created).isoformat(
+                timespec="seconds"
+            )
+            ui.notify(f"loaded {len(items)} items from the snapshot of {created}")
+        return snapshot
+
     def load_sheet(self):
         """
         load sheet in background
         """
+        # the user may switch tabs while loading
+        sheet_name = self.sheetName
+        lod_grid = self.lod_grids[sheet_name]
         with self.solution.content_div:
             try:
-                items = self.load_items_from_selected_sheet()
-                self.lod_grid.load_lod(items)
+                if sheet_name in self.snapshot_sheets or lod_grid.lod:
+                    # apply the changes instead of streaming all rows again
+                    items = self.load_items_from_selected_sheet(sheet_name)
+                    self.apply_items(items, sheet_name)
+                    self.snapshot_sheets.discard(sheet_name)
+                else:
+                    with ThreadPoolExecutor(max_workers=1) as executor:
+                        # the mapping is fetched while the sheet is streamed
+                        mapping_future = executor.submit(self.load_mapping)
+                        items = self.stream_selected_sheet(sheet_name)
+                        mapping_future.result()
+                    row_id_column = self.get_row_id_column(sheet_name, items)
+                    if row_id_column != self.row_id_columns.get(sheet_name, None):
+                        # the mapping has another primary key - the next reload pushes all rows once
+                        self.row_id_columns[sheet_name] = None
+                self.grid_sources[sheet_name] = self.sheet_cache.get_lod(
+                    self.url, sheet_name
+                )
                 ui.notify(f"loaded {len(items)} items")
-                self.lod_grid.update()
+                others = [name for name in self.sheetNames if name != sheet_name]
+                self.sheet_cache.preload(self.url, others)
+            except Exception as ex:
+                self.solution.handle_exception(ex)
+                # e.g. quota exhausted or offline
+                if not lod_grid.lod:
+                    self.load_snapshot(sheet_name)
+
+    def show_snapshot(self):
+        """
+        show the latest snapshot in background
+        """
+        with self.solution.content_div:
+            try:
+                self.load_snapshot()
             except Exception as ex:
                 self.solution.handle_exception(ex)
 
+    async def warm_start(self):
+        """
+        show the latest snapshot while the sheets are downloaded
+        """
+        await run.io_bound(self.show_snapshot)
+        await self.reload()
+
     async def reload(self):
         """
         reload my spreadsheet
@@ -105,6 +398,24 @@ class SpreadSheetView:
         except Exception as ex:
             self.solution.handle_exception(ex)
 
+    async def on_change_tab(self, args):
+        """
+        handle selection of a different sheet - the rows come from the
+        memory cache or the pending preload without blocking the event loop
+        """
+        sheet_name = args.value
+        self.sheetName = sheet_name
+        self.lod_grid = self.lod_grids[sheet_name]
+        try:
+            items = self.sheet_cache.get_lod(self.url, sheet_name)
+            if items is None:
+                future = self.sheet_cache.preload(self.url, [sheet_name])[sheet_name]
+                items = await asyncio.wrap_future(future)
+            if items is not self.grid_sources.get(sheet_name, None):
+                await run.io_bound(self.show_items, sheet_name, items)
+        except Exception as ex:
+            self.solution.handle_exception(ex)
+
     async def on_change_url(self, args):
         """
         handle selection of a different url
@@ -5,10 +5,12 @@ Created on 2021-12-09
 """
 
 import re
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from enum import Enum, auto
-from typing import Optional
+from typing import Generator, Optional
+from urllib.parse import urlparse
 
-import requests
 from lodstorage.query import Query
 from lodstorage.sparql import SPARQL
 from mwclient.errors import APIError
@@ -19,6 +21,9 @@ from wikibot3rd.smw import SMWClient
 from wikibot3rd.wikiclient import WikiClient
 from wikibot3rd.wikiuser import WikiUser
 
+from onlinespreadsheet.querycache import QueryCache
+from onlinespreadsheet.restsession import RestSession
+
 
 class SmwWikiAccess:
     """
@@ -92,15 +97,39 @@ class TableQuery(object):
     prepare a Spreadsheet editing
     """
 
-    def __init__(self, debug=False):
+    def __init__(
+        self,
+        debug=False,
+        maxWorkers: int = 8,
+        maxPerSource: int = 2,
+        cache: QueryCache = None,
+        session: RestSession = None,
+    ):
         """
         Constructor
+
+        Args:
+            debug(bool): if True show debug information
+            maxWorkers(int): the maximum number of queries to run in parallel
+            maxPerSource(int): the default maximum number of parallel queries per source
+            cache(QueryCache): the cache for query results (if any)
+            session(RestSession): the session for RESTful queries - default: the shared session
         """
         self.debug = debug
         self.wikiAccessMap = {}
         self.queries = {}
         self.tableEditing = TableEditing()
         self.errors = []
+        # guards my table editing against the pool threads adding results
+        self.lock = threading.Lock()
+        self.maxWorkers = maxWorkers
+        self.maxPerSource = maxPerSource
+        # concurrency limits for specific sources by source
+        self.sourceLimits = {}
+        self.cache = cache
+        if session is None:
+            session = RestSession.get_instance()
+        self.session = session
 
     def addQuery(self, query: Query):
         """
@@ -110,46 +139,277 @@ class TableQuery(object):
         """
         self.queries[query.name] = query
 
-    def fetchQueryResults(self):
+    def setSourceLimit(self, source: str, limit: int):
         """
-        fetch the QueryResults
+        set the maximum number of parallel queries for the given source
+
+        Args:
+            source(str): the wikiId, SPARQL endpoint url or RESTful host
+            limit(int): the maximum number of parallel queries for the source
+        """
+        self.sourceLimits[source] = limit
 
+    def getSource(self, query: Query) -> str:
         """
-        for queryName, query in self.queries.items():
-            qres = None
-            if query.lang == "ask":
-                if not hasattr(query, "wikiAccess") or query.wikiAccess is None:
-                    raise (
-                        f"wikiAccess needs to be configured for Semantic MediaWiki ask query '{query.name}'"
-                    )
-                qres = query.wikiAccess.query(query.query)
-                # workaround: undict if dict of dict is returned
-                # TODO: check whether this may be fixed upstream
-                if isinstance(qres, dict):
-                    qres = list(qres.values())
-            elif query.lang.lower() == "sparql":
-                if not hasattr(query, "endpoint") or query.endpoint is None:
-                    raise (
-                        f"endpoint needs to be configured for SPARQL query '{query.name}'"
-                    )
-                qres = query.endpoint.queryAsListOfDicts(query.query)
-            elif query.lang.lower() == "restful":
-                response = requests.request("GET", query.query)
-                if response.status_code == 200:
-                    qres = response.json()
-                else:
-                    self.errors.append(
-                        f"{query.query} failed with status {response.status_code}"
-                    )
+        get the source of the given query to apply concurrency limits for
+
+        Args:
+            query(Query): the query
+
+        Returns:
+            str: the wikiId for ask queries, the endpoint url for SPARQL queries
+            and the host for RESTful queries
+        """
+        lang = query.lang.lower()
+        source = None
+        if lang == "ask":
+            wikiAccess = getattr(query, "wikiAccess", None)
+            if wikiAccess is not None:
+                source = wikiAccess.wikiUser.wikiId
+        elif lang == "sparql":
+            endpoint = getattr(query, "endpoint", None)
+            source = getattr(endpoint, "url", endpoint)
+        elif lang == "restful":
+            source = urlparse(query.query).netloc
+        if source is None:
+            source = query.name
+        return source
+
+    def fetchQueryResult(
+        self, query: Query, forceRefresh: bool = False, lod: list = None
+    ):
+        """
+        fetch the result of the given query from my cache or by running it
+
+        Args:
+            query(Query): the query to run
+            forceRefresh(bool): if True ignore cached results
+            lod(list): if given the pages of a paged SPARQL query are appended to it as they arrive
+
+        Returns:
+            the list of dicts or dict of list of dicts result of the query
+            or None if the query failed
+        """
+        if self.cache is None:
+            return self.runQuery(query, lod=lod)
+        source = self.getSource(query)
+        ttl = getattr(query, "ttl", None)
+        qres = None
+        if not forceRefresh:
+            qres = self.cache.get(query.lang, source, query.query, ttl=ttl)
+        if qres is None:
+            qres = self.runQuery(query, lod=lod)
             if qres is not None:
+                try:
+                    self.cache.put(query.lang, source, query.query, qres)
+                except TypeError as ex:
+                    # the result is used but not cached
+                    self.errors.append(f"{query.name} not cached: {ex}")
+        return qres
+
+    def runQuery(self, query: Query, lod: list = None):
+        """
+        run the given query
+
+        Args:
+            query(Query): the query to run
+            lod(list): if given the pages of a paged SPARQL query are appended to it as they arrive
+
+        Returns:
+            the list of dicts or dict of list of dicts result of the query
+            or None if the query failed
+        """
+        qres = None
+        if query.lang == "ask":
+            if not hasattr(query, "wikiAccess") or query.wikiAccess is None:
+                raise Exception(
+                    f"wikiAccess needs to be configured for Semantic MediaWiki ask query '{query.name}'"
+                )
+            qres = query.wikiAccess.query(query.query)
+            # workaround: undict if dict of dict is returned
+            # TODO: check whether this may be fixed upstream
+            if isinstance(qres, dict):
+                qres = list(qres.values())
+        elif query.lang.lower() == "sparql":
+            if not hasattr(query, "endpoint") or query.endpoint is None:
+                raise Exception(
+                    f"endpoint needs to be configured for SPARQL query '{query.name}'"
+                )
+            pageSize = getattr(query, "pageSize", None)
+            if pageSize:
+                qres = [] if lod is None else lod
+                for page in self.iterSparqlPages(query, pageSize):
+                    with self.lock:
+                        qres.extend(page)
+            else:
+                qres = query.endpoint.queryAsListOfDicts(query.query)
+        elif query.lang.lower() == "restful":
+            status_code, qres = self.session.get_json(query.query)
+            if qres is None:
+                self.errors.append(f"{query.query} failed with status {status_code}")
+        return qres
+
+    def iterSparqlQuery(
+        self, query: Query, pageSize: int = 10000
+    ) -> Generator[dict, None, None]:
+        """
+        run the given SPARQL query page by page and yield the resulting records
+
+        Args:
+            query(Query): the SPARQL query to run
+            pageSize(int): the number of records to fetch per page
+
+        Yields:
+            dict: the records of the query result
+        """
+        for page in self.iterSparqlPages(query, pageSize):
+            yield from page
+
+    def iterSparqlPages(
+        self, query: Query, pageSize: int = 10000
+    ) -> Generator[list, None, None]:
+        """
+        run the given SPARQL query page by page using LIMIT/OFFSET
+        and yield the pages - the query should have an
+        ORDER BY clause to get a stable paging
+
+        LIMIT and OFFSET clauses at the end of the query are taken into
+        account in either order
+
+        Args:
+            query(Query): the SPARQL query to run
+            pageSize(int): the number of records to fetch per page
+
+        Yields:
+            list: the records of each page of the query result
+        """
+        queryText = query.query
+        clauses = {}
+        pattern = re.compile(r"\s+(LIMIT|OFFSET)\s+(\d+)\s*$", flags=re.IGNORECASE)
+        match = pattern.search(queryText)
+        while match and match.group(1).upper() not in clauses:
+            clauses[match.group(1).upper()] = int(match.group(2))
+            queryText = queryText[: match.start()]
+            match = pattern.search(queryText)
+        limit = clauses.get("LIMIT")
+        offset = clauses.get("OFFSET", 0)
+        count = 0
+        while limit is None or count < limit:
+            size = pageSize if limit is None else min(pageSize, limit - count)
+            pageQuery = f"{queryText}\nLIMIT {size}\nOFFSET {offset + count}"
+            if self.debug:
+                print(f"fetching {size} records of {query.name} at {offset + count}")
+            records = query.endpoint.queryAsListOfDicts(pageQuery)
+            yield records
+            count += len(records)
+            if len(records) < size:
+                break
+
+    def addQueryResult(self, queryName: str, qres):
+        """
+        add the given query result to my table editing
+
+        Args:
+            queryName(str): the name of the query
+            qres: the list of dicts or dict of list of dicts result of the query
+        """
+        if qres is not None:
+            with self.lock:
                 if isinstance(qres, list):
-                    self.tableEditing.addLoD(query.name, qres)
+                    self.tableEditing.addLoD(queryName, qres)
                 elif isinstance(qres, dict):
                     for name, lod in qres.items():
                         self.tableEditing.addLoD(f"{queryName}_{name}", lod)
 
+    def fetchQueryResultIntoTable(
+        self, queryName: str, query: Query, forceRefresh: bool = False
+    ):
+        """
+        fetch the result of the given query and add it to my table editing -
+        the pages of a paged SPARQL query are added as they arrive so that
+        no second copy of the result is held while fetching
+
+        Args:
+            queryName(str): the name of the query
+            query(Query): the query to run
+            forceRefresh(bool): if True ignore cached results
+
+        Returns:
+            the list of dicts or dict of list of dicts result of the query
+            or None if the query failed
+        """
+        lod = None
+        if query.lang.lower() == "sparql" and getattr(query, "pageSize", None):
+            lod = []
+            self.addQueryResult(queryName, lod)
+        try:
+            qres = self.fetchQueryResult(query, forceRefresh=forceRefresh, lod=lod)
+        except Exception:
+            if lod is not None:
+                # a failing page leaves no partial result behind
+                with self.lock:
+                    self.tableEditing.lods.pop(queryName, None)
+            raise
+        if qres is not lod:
+            self.addQueryResult(queryName, qres)
+        return qres
+
+    def fetchQueryResults(self, parallel: bool = False, forceRefresh: bool = False):
+        """
+        fetch the QueryResults
+
+        Args:
+            parallel(bool): if True run the queries concurrently
+            forceRefresh(bool): if True ignore cached results
+        """
+        if parallel:
+            self.fetchQueryResultsConcurrently(forceRefresh=forceRefresh)
+        else:
+            for queryName, query in self.queries.items():
+                self.fetchQueryResultIntoTable(
+                    queryName, query, forceRefresh=forceRefresh
+                )
+
+    def fetchQueryResultsConcurrently(self, forceRefresh: bool = False):
+        """
+        fetch the QueryResults with a thread pool limiting the number of
+        parallel queries per source - the results are added as they arrive
+
+        Args:
+            forceRefresh(bool): if True ignore cached results
+        """
+        semaphores = {}
+        for query in self.queries.values():
+            source = self.getSource(query)
+            if source not in semaphores:
+                limit = self.sourceLimits.get(source, self.maxPerSource)
+                semaphores[source] = threading.BoundedSemaphore(limit)
+
+        def fetch(queryName: str, query: Query):
+            with semaphores[self.getSource(query)]:
+                return self.fetchQueryResultIntoTable(
+                    queryName, query, forceRefresh=forceRefresh
+                )
+
+        with ThreadPoolExecutor(max_workers=self.maxWorkers) as executor:
+            futures = {
+                executor.submit(fetch, queryName, query): queryName
+                for queryName, query in self.queries.items()
+            }
+            for future in as_completed(futures):
+                queryName = futures[future]
+                future.result()
+                if self.debug:
+                    print(f"query {queryName} completed")
+
     def addAskQuery(
-        self, wikiId: str, name, ask: str, title: str = None, description: str = None
+        self,
+        wikiId: str,
+        name,
+        ask: str,
+        title: str = None,
+        description: str = None,
+        ttl: float = None,
     ):
         """
         add an ask query for the given wiki
@@ -160,6 +420,7 @@ class TableQuery(object):
               ask(str): the SMW ask query
               title(str): the title of the query
               description(str): the description of the query
+              ttl(float): the time to live of cached results in seconds - default: the cache ttl
         """
         if wikiId not in self.wikiAccessMap:
             self.wikiAccessMap[wikiId] = SmwWikiAccess(wikiId)
@@ -173,11 +434,24 @@ class TableQuery(object):
             debug=self.debug,
         )
         query.wikiAccess = wikiAccess
+        query.ttl = ttl
         self.addQuery(query)
 
-    def fromAskQueries(self, wikiId: str, askQueries: list, withFetch: bool = True):
+    def fromAskQueries(
+        self,
+        wikiId: str,
+        askQueries: list,
+        withFetch: bool = True,
+        parallel: bool = False,
+    ):
         """
         initialize me from the given Queries
+
+        Args:
+            wikiId(str): the id of the wiki to query
+            askQueries(list): the list of ask query records
+            withFetch(bool): if True fetch the query results
+            parallel(bool): if True fetch the query results concurrently
         """
         for askQuery in askQueries:
             name = askQuery["name"]
@@ -186,10 +460,15 @@ class TableQuery(object):
             description = askQuery["description"] if "description" in askQuery else None
             self.addAskQuery(wikiId, name, ask, title, description)
         if withFetch:
-            self.fetchQueryResults()
+            self.fetchQueryResults(parallel=parallel)
 
     def addRESTfulQuery(
-        self, name: str, url: str, title: str = None, description: str = None
+        self,
+        name: str,
+        url: str,
+        title: str = None,
+        description: str = None,
+        ttl: float = None,
     ):
         """
         add RESTFful query to the queries
@@ -199,6 +478,7 @@ class TableQuery(object):
             name(str): name of the query
             title(str): title of the query
             description(str): description of the query
+            ttl(float): the time to live of cached results in seconds - default: the cache ttl
         """
         query = Query(
             name=name,
@@ -208,6 +488,7 @@ class TableQuery(object):
             description=description,
             debug=self.debug,
         )
+        query.ttl = ttl
         self.addQuery(query)
 
     def addSparqlQuery(
@@ -217,6 +498,8 @@ class TableQuery(object):
         endpointUrl: str = "https://query.wikidata.org/sparql",
         title: str = None,
         description: str = None,
+        ttl: float = None,
+        pageSize: int = None,
     ):
         """
         add SPARQL query to the queries
@@ -227,6 +510,8 @@ class TableQuery(object):
             endpointUrl(str): the url of the endpoint to use
             title(str): title of the query
             description(str): description of the query
+            ttl(float): the time to live of cached results in seconds - default: the cache ttl
+            pageSize(int): if set fetch the results in pages of the given size
         """
         query = Query(
             name=name,
@@ -237,6 +522,8 @@ class TableQuery(object):
             debug=self.debug,
         )
         query.endpoint = SPARQL(endpointUrl)
+        query.ttl = ttl
+        query.pageSize = pageSize
         self.addQuery(query)
 
     @staticmethod
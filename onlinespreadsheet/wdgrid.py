@@ -5,29 +5,43 @@ Created on 2023-01-11
 """
 
 import asyncio
-import copy
 import datetime
 import json
 import pprint
+import queue
 import re
+import threading
+import time
 import typing
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dataclasses import dataclass
+from itertools import chain
 from typing import Callable
 
 from ez_wikidata.wbquery import WikibaseQuery
 from ez_wikidata.wdproperty import PropertyMapping
-from ez_wikidata.wikidata import Wikidata, WikidataItem
+from ez_wikidata.wikidata import WikidataItem
 
 # from jpwidgets.bt5widgets import Alert, App, IconButton, Spinner, Switch
 # from jpwidgets.widgets import LodGrid, QPasswordDialog
 # from justpy import Br, Button, Div, Link, Span, WebPage
-from lodstorage.lod import LOD
 from lodstorage.sparql import SPARQL
 from markupsafe import Markup
 from ngwidgets.lod_grid import ListOfDictsGrid
 from ngwidgets.webserver import WebSolution
+from nicegui import run, ui
+from nicegui.events import GenericEventArguments
 
-from onlinespreadsheet.record_sync import ComparisonRecord, SyncAction, SyncRequest
+from onlinespreadsheet.bulk_write import BulkWriter, BulkWriteState
+from onlinespreadsheet.entity_prefetch import PrefetchingWikidata
+from onlinespreadsheet.lod_delta import LodDelta, row_hash
+from onlinespreadsheet.lod_view import LodView, RowIndex
+from onlinespreadsheet.record_sync import (
+    ComparisonRecord,
+    PropertySchema,
+    SyncAction,
+    SyncRequest,
+)
 
 
 class WikidataGrid:
@@ -45,6 +59,8 @@ class WikidataGrid:
         additional_reload_callback: typing.Union[Callable, None] = None,
         row_selected_callback: typing.Callable = None,
         lodRowIndex_column: str = "lodRowIndex",
+        paging: bool = False,
+        blockSize: int = 100,
         debug: bool = False,
     ):
         """
@@ -57,6 +73,8 @@ class WikidataGrid:
             getLod(Callable): the function to get my list of dicts
             additional_reload_callback: Function to be called after fetching the new data and before updating aggrid
             lodRowIndex_column(str): the column/attribute to use for tracking the index in the lod
+            paging(bool): if True the grid requests blocks of sorted and filtered rows from the server instead of loading all rows
+            blockSize(int): the number of rows per block in paging mode
             debug(bool): if True show debug information
         """
         self.solution = solution
@@ -67,11 +85,15 @@ class WikidataGrid:
         self.additional_reload_callback = additional_reload_callback
         self.row_selected_callback = row_selected_callback
         self.source = source
+        self.paging = paging
+        self.blockSize = blockSize
+        # ids of the ag grids whose row requests are handled
+        self.rowRequestGridIds = set()
         self.debug = debug
         self.dryRun = True
         self.ignoreErrors = False
         # @TODO make endpoint configurable
-        self.wd = Wikidata("https://www.wikidata.org", debug=True)
+        self.wd = PrefetchingWikidata("https://www.wikidata.org", debug=True)
 
     def setEntityName(self, entityName: str, entityPluralName: str = None):
         self.entityName = entityName
@@ -107,11 +129,76 @@ class WikidataGrid:
         self.assureAgGrid()
         self.sync_dialog_div = Div(a=self.alert_div, classes="container")
 
+    def setLod(self, lod: list):
+        """
+        set my list of dicts and the view of it
+
+        Args:
+            lod(list): the list of dicts
+        """
+        self.lod = lod
+        self.setViewLod(lod)
+        # row indices by column - built on demand and maintained on changes
+        self.rowIndices = {
+            self.lodRowIndex_column: RowIndex(lod, self.lodRowIndex_column)
+        }
+
+    def getRowIndex(self, column: str = None) -> RowIndex:
+        """
+        get the index of my rows by the given column
+
+        Args:
+            column(str): the column to index by - default: the lodRowIndex column
+
+        Returns:
+            RowIndex: the (cached) row index
+        """
+        if column is None:
+            column = self.lodRowIndex_column
+        rowIndex = self.rowIndices.get(column, None)
+        if rowIndex is None:
+            rowIndex = RowIndex(self.lod, column)
+            self.rowIndices[column] = rowIndex
+        return rowIndex
+
+    def addRow(self, record: dict) -> int:
+        """
+        append the given record to my list of dicts and update my row indices
+
+        Args:
+            record(dict): the record to add
+
+        Returns:
+            int: the lodRowIndex of the new row
+        """
+        lodRowIndex = len(self.lod)
+        record[self.lodRowIndex_column] = lodRowIndex
+        self.lod.append(record)
+        for rowIndex in self.rowIndices.values():
+            rowIndex.add(record)
+        return lodRowIndex
+
+    def updateRow(self, lodRowIndex: int, record: dict):
+        """
+        update the row with the given lodRowIndex and my row indices
+
+        Args:
+            lodRowIndex(int): the lodRowIndex of the row
+            record(dict): the new values of the row
+        """
+        row = self.lod[lodRowIndex]
+        for rowIndex in self.rowIndices.values():
+            rowIndex.remove(row)
+        row.update(record)
+        for rowIndex in self.rowIndices.values():
+            rowIndex.add(row)
+
     def setViewLod(self, lod: list, nonValue: str = "-"):
         """
         add lodRowIndex column to list of dicts and
-        use a copy of the given list of dicts for the view
-        modify datetime columns to avoid problems with justpy
+        use a lazy copy-on-write view of the given list of dicts for the view
+        that converts None and datetime values to avoid problems with justpy
+        when the rows are sent to the grid
 
         Args:
             lod(list): the list of dicts
@@ -119,35 +206,193 @@ class WikidataGrid:
         """
         for index, row in enumerate(lod):
             row[self.lodRowIndex_column] = index
-        self.viewLod = copy.deepcopy(lod)
-        # fix non values
-        for record in self.viewLod:
-            for key in list(record):
-                value = record[key]
-                if value is None:
-                    record[key] = nonValue
-                vtype = type(value)
-                # fix datetime entries
-                if vtype is datetime.datetime:
-                    value = str(value)
-                    record[key] = value
-        pass
-
-    def reloadAgGrid(self, viewLod: list, showLimit: int = 10):
-        """
-        reload the agGrid with the given list of Dicts
-
-        Args:
-            viewLod(list): the list of dicts for the current view
+        self.viewLod = LodView(lod, nonValue=nonValue)
+
+    def reloadAgGrid(self, viewLod: LodView, showLimit: int = 10):
+        """
+        reload the agGrid with the given view of the list of Dicts
+
+        Args:
+            viewLod(LodView): the view of the list of dicts for the current view
             showLimit: number of rows to print when debugging
         """
         if self.agGrid is None:
             return
-        self.agGrid.load_lod(viewLod)
+        # getRowId is an initial option - it has to be set before the rows are loaded
+        self.setRowIdOption()
+        if self.paging:
+            # there are no rows to derive the column definitions from
+            self.agGrid.options["columnDefs"] = self.getColumnDefs(viewLod)
+            self.setupInfiniteRowModel()
+        else:
+            self.agGrid.load_lod(viewLod.to_lod())
+        # the full reload contains all pending changes
+        viewLod.pop_dirty()
         if self.debug:
             pprint.pprint(viewLod[:showLimit])
         self.refreshGridSettings()
 
+    def updateRows(self, lodRowIndices: typing.Iterable[int]):
+        """
+        push only the given rows of my view to the agGrid
+        as an update row transaction instead of reloading the whole grid
+
+        Args:
+            lodRowIndices(Iterable[int]): the lodRowIndex values of the rows to update
+        """
+        lodRowIndices = sorted(set(lodRowIndices))
+        # pushed rows are not pending any more
+        self.viewLod.dirty.difference_update(lodRowIndices)
+        if self.paging:
+            # the blocks in the browser cache are requested again
+            if lodRowIndices:
+                self.agGrid.ag_grid.run_grid_method("refreshInfiniteCache")
+            return
+        rows = []
+        for lodRowIndex in lodRowIndices:
+            row = self.viewLod.get_row(lodRowIndex)
+            # keep the list of dicts of the grid in sync with the transaction
+            self.agGrid.lod[lodRowIndex] = row
+            rows.append(row)
+        if rows:
+            self.agGrid.ag_grid.run_grid_method("applyTransaction", {"update": rows})
+
+    def applyCellTransaction(self, lodRowIndex: int, column: str, value):
+        """
+        set the given cell of my view and push the row to the agGrid
+
+        Args:
+            lodRowIndex(int): the lodRowIndex of the row
+            column(str): the column of the cell
+            value: the new (display) value of the cell
+        """
+        self.viewLod[lodRowIndex][column] = value
+        self.updateRows([lodRowIndex])
+
+    def pushViewChanges(self):
+        """
+        push the rows of my view that have been changed since the last push
+        """
+        self.updateRows(self.viewLod.pop_dirty())
+
+    def applyDelta(self, delta: LodDelta) -> bool:
+        """
+        apply the changes of a new import to my list of dicts and push
+        only the changed rows to the agGrid
+
+        Args:
+            delta(LodDelta): the changes between my list of dicts and the new import
+
+        Returns:
+            bool: False if the delta has removed rows - the lodRowIndex is the position of a row so the grid needs a reload
+        """
+        if delta.removed:
+            return False
+        for oldRow, newRow in delta.modified:
+            lodRowIndex = oldRow[self.lodRowIndex_column]
+            record = {
+                key: value
+                for key, value in newRow.items()
+                if key != self.lodRowIndex_column
+            }
+            self.updateRow(lodRowIndex, record)
+            self.viewLod.reset_row(lodRowIndex)
+        addedIndices = [self.addRow(dict(newRow)) for newRow in delta.added]
+        if addedIndices:
+            self.viewLod.order_cache = None
+            if self.paging:
+                self.updateRows(addedIndices)
+            else:
+                rows = [self.viewLod.get_row(index) for index in addedIndices]
+                self.agGrid.lod.extend(rows)
+                self.agGrid.ag_grid.run_grid_method("applyTransaction", {"add": rows})
+        self.pushViewChanges()
+        return True
+
+    def getColumnDefs(self, viewLod: LodView) -> typing.List[dict]:
+        """
+        get the column definitions for the columns of the first row of the given view
+        the way ListOfDictsGrid.load_lod derives them - with the filters my view supports
+
+        Args:
+            viewLod(LodView): the view of the list of dicts
+
+        Returns:
+            list: the column definitions
+        """
+        columnDefs = []
+        if len(viewLod) > 0:
+            for key, value in viewLod.get_row(0).items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    colFilter = "agNumberColumnFilter"
+                else:
+                    colFilter = "agTextColumnFilter"
+                columnDefs.append({"field": key, "filter": colFilter})
+        return columnDefs
+
+    def setupInfiniteRowModel(self):
+        """
+        let the agGrid request blocks of rows via the infinite row model
+        so that the browser only holds the visible rows - sorting and
+        filtering is done on the server by my view
+        """
+        gridId = self.agGrid.ag_grid.id
+        eventName = f"getRows{gridId}"
+        options = self.agGrid.ag_grid.options
+        options["rowModelType"] = "infinite"
+        options["cacheBlockSize"] = self.blockSize
+        options["maxBlocksInCache"] = 10
+        options.pop("rowData", None)
+        # keep the pending callbacks in the browser and ask the server for the rows
+        options[":datasource"] = f"""{{
+            getRows: (params) => {{
+                window.oseRowRequests = window.oseRowRequests || {{}};
+                const requestId = Math.random().toString(36).slice(2);
+                window.oseRowRequests[requestId] = params;
+                emitEvent("{eventName}", {{
+                    requestId: requestId,
+                    startRow: params.startRow,
+                    endRow: params.endRow,
+                    sortModel: params.sortModel,
+                    filterModel: params.filterModel
+                }});
+            }}
+        }}"""
+        # the event name depends on the grid - a new grid needs its own handler
+        if gridId not in self.rowRequestGridIds:
+            ui.on(eventName, self.onGetRows)
+            self.rowRequestGridIds.add(gridId)
+        self.agGrid.ag_grid.update()
+
+    def onGetRows(self, event: GenericEventArguments):
+        """
+        handle a block request of the agGrid infinite row model
+
+        Args:
+            event(GenericEventArguments): the request with startRow, endRow, sortModel and filterModel
+        """
+        args = event.args
+        requestId = json.dumps(args["requestId"])
+        # the pending request in the browser is always resolved
+        callback = "params.failCallback();"
+        try:
+            rows, lastRow = self.viewLod.get_block(
+                args["startRow"],
+                args["endRow"],
+                sort_model=args.get("sortModel"),
+                filter_model=args.get("filterModel"),
+            )
+            rowsJson = json.dumps(rows, default=str)
+            callback = f"params.successCallback({rowsJson}, {lastRow});"
+        except Exception as ex:
+            self.app.handleException(ex)
+        finally:
+            ui.run_javascript(f"""
+                const params = window.oseRowRequests[{requestId}];
+                delete window.oseRowRequests[{requestId}];
+                {callback}
+                """)
+
     def setDefaultColDef(self, agGrid):
         """
         set the default column definitions
@@ -158,8 +403,10 @@ class WikidataGrid:
         defaultColDef.resizable = True
         defaultColDef.sortable = True
         # https://www.ag-grid.com/javascript-data-grid/grid-size/
-        defaultColDef.wrapText = True
-        defaultColDef.autoHeight = True
+        # auto height rows need all rows to be rendered - not used for paging
+        if not self.paging:
+            defaultColDef.wrapText = True
+            defaultColDef.autoHeight = True
 
     def refreshGridSettings(self):
         """
@@ -167,14 +414,24 @@ class WikidataGrid:
         enable row selection event handler
         """
         self.agGrid.on("rowSelected", self.onRowSelected)
-        self.agGrid.options.columnDefs[0].checkboxSelection = True
+        columnDefs = self.agGrid.options.get("columnDefs", [])
+        if columnDefs:
+            columnDefs[0]["checkboxSelection"] = True
 
-    def linkWikidataItems(self, viewLod, itemColumn: str = "item"):
+    def setRowIdOption(self):
+        """
+        identify the rows of my agGrid by lodRowIndex for row transactions
+        """
+        self.agGrid.options[":getRowId"] = (
+            f"(params) => String(params.data.{self.lodRowIndex_column})"
+        )
+
+    def linkWikidataItems(self, viewLod: LodView, itemColumn: str = "item"):
         """
         link the wikidata entries in the given item column if containing Q values
 
         Args:
-            viewLod(list): the list of dicts for the view
+            viewLod(LodView): the view of the list of dicts
             itemColumn(str): the name of the column to handle
         """
         for row in viewLod:
@@ -210,7 +467,7 @@ class WikidataGrid:
             _alert = Alert(a=self.alert_div, text=msg)
             await self.app.wp.update()
             if self.debug:
-                print(json.dumps(self.viewLod, indent=2, default=str))
+                print(json.dumps(self.viewLod.to_lod(), indent=2, default=str))
             if callable(self.additional_reload_callback):
                 self.additional_reload_callback()
             self.reloadAgGrid(self.viewLod)
@@ -251,9 +508,8 @@ class WikidataGrid:
         self.app.clearErrors()
         if msg.selected:
             self.rowSelected = msg.rowIndex
-            # check whether a lodeRowIndex Index is available
-            lodByRowIndex, _dup = LOD.getLookup(self.lod, self.lodRowIndex_column)
-            if len(lodByRowIndex) == len(self.lod):
+            # check whether a lodRowIndex Index is available
+            if self.getRowIndex().is_unique:
                 lodRowIndex = msg.data[self.lodRowIndex_column]
             else:
                 lodRowIndex = self.rowSelected
@@ -277,17 +533,99 @@ class WikidataGrid:
                 self.app.handleException(ex)
 
 
+@dataclass
+class PropertyDispatch:
+    """
+    precompiled handling of a SPARQL result variable of a wikibase query
+    """
+
+    propVarname: str
+    column: str
+    propType: str
+    labelVarname: str
+    urlVarname: str
+    # (wbRow, value) -> (value, propLabel, propUrl)
+    handler: Callable
+
+    ENTITY_PREFIX = "http://www.wikidata.org/entity/"
+
+    @classmethod
+    def compile(cls, wbQuery: WikibaseQuery) -> typing.Dict[str, "PropertyDispatch"]:
+        """
+        compile the dispatch table for the given wikibase query
+
+        Args:
+            wbQuery(WikibaseQuery): the query to compile the table for
+
+        Returns:
+            dict: the PropertyDispatch by SPARQL variable name
+        """
+        table = {}
+        for propVarname, propRow in wbQuery.propertiesByVarname.items():
+            propType = propRow["Type"]
+            dispatch = cls(
+                propVarname=propVarname,
+                column=propRow["Column"],
+                propType=propType,
+                labelVarname=f"{propVarname}Label",
+                urlVarname=f"{propVarname}Url",
+                handler=None,
+            )
+            if not propType:
+                handler = dispatch.itemValue
+            elif propType == "extid":
+                handler = dispatch.extidValue
+            elif propType == "url":
+                handler = dispatch.urlValue
+            else:
+                handler = dispatch.plainValue
+            dispatch.handler = handler
+            table[propVarname] = dispatch
+        return table
+
+    def linkedValue(self, wbRow: dict, value, propLabel: str, propUrl: str) -> tuple:
+        """
+        use the label of entity values that have one
+        """
+        if (
+            type(value) == str
+            and value.startswith(self.ENTITY_PREFIX)
+            and self.labelVarname in wbRow
+        ):
+            propUrl = value
+            propLabel = wbRow[self.labelVarname]
+            value = propLabel
+        return value, propLabel, propUrl
+
+    def itemValue(self, wbRow: dict, value) -> tuple:
+        return self.linkedValue(wbRow, value, wbRow[self.labelVarname], "")
+
+    def extidValue(self, wbRow: dict, value) -> tuple:
+        return self.linkedValue(wbRow, value, "", wbRow[self.urlVarname])
+
+    def urlValue(self, wbRow: dict, value) -> tuple:
+        return self.linkedValue(wbRow, value, "", wbRow[self.propVarname])
+
+    def plainValue(self, wbRow: dict, value) -> tuple:
+        return self.linkedValue(wbRow, value, "", "")
+
+
 class GridSync:
     """
     allow syncing the grid with data from wikibase
     """
 
+    entityPattern = re.compile(r"http://www.wikidata.org/entity/(Q[0-9]+)")
+
     def __init__(
         self,
         wdgrid: WikidataGrid,
         entityName: str,
         pk: str,
         sparql: SPARQL,
+        batchSize: int = 250,
+        maxWorkers: int = 4,
+        ttl: float = 24 * 3600,
         debug: bool = False,
     ):
         """
@@ -298,6 +636,9 @@ class GridSync:
             entityName: name of the sheet
             pk: primary key
             sparql(SPARQL): the sparql endpoint access to use
+            batchSize(int): the maximum number of primary key values per query
+            maxWorkers(int): the maximum number of concurrent queries
+            ttl(float): the time to live of the query results per primary key in seconds
             debug(bool): if True show debug information
         """
         self.wdgrid = wdgrid
@@ -305,7 +646,14 @@ class GridSync:
         self.entityName = entityName
         self.pk = pk
         self.sparql = sparql
+        self.batchSize = batchSize
+        self.maxWorkers = maxWorkers
+        self.ttl = ttl
         self.debug = debug
+        # (row hash, fetch time, wbRows) by primary key value
+        self.wbRowsByPk = {}
+        # called with (done, total) batches while querying
+        self.progress_callback = None
         self.wdgrid.additional_reload_callback = self.setup_aggrid_post_reload
         self.wdgrid.row_selected_callback = self.handle_row_selected
         self.wbQuery = None
@@ -314,7 +662,7 @@ class GridSync:
         # we assume the grid has already been loaded here
         self.itemRows = self.wdgrid.lod
         self.pkColumn, self.pkType, self.pkProp = self.getColumnTypeAndVarname(self.pk)
-        self.itemsByPk, _dup = LOD.getLookup(self.itemRows, self.pkColumn)
+        self.itemsByPk = self.wdgrid.getRowIndex(self.pkColumn)
         if self.debug:
             print(f"{self.entityName} by {self.pkColumn}:{list(self.itemsByPk.keys())}")
             pass
@@ -378,6 +726,33 @@ class GridSync:
                     self.pkSelect.add(
                         self.app.jp.Option(value=propertyName, text=columnName)
                     )
+        self.prefetchEntities()
+
+    def prefetchEntities(self, itemColumn: str = "item") -> threading.Thread:
+        """
+        fetch the wikidata entities of all items of the grid in the background
+        so that the sync dialog of a row does not need to wait for the network
+
+        Args:
+            itemColumn(str): the column with the QIDs
+
+        Returns:
+            threading.Thread: the thread doing the prefetch
+        """
+        values = [row.get(itemColumn, None) for row in self.wdgrid.lod]
+        thread = threading.Thread(
+            target=self.wdgrid.wd.prefetcher.prefetch, args=(values,), daemon=True
+        )
+        thread.start()
+        return thread
+
+    def invalidateEntity(self, qid: str):
+        """
+        forget the prefetched entity of the given QID e.g. after an edit
+        """
+        prefetcher = getattr(self.wdgrid.wd, "prefetcher", None)
+        if prefetcher is not None and qid is not None:
+            prefetcher.cache.invalidate(qid)
 
     async def onChangePk(self, msg: dict):
         """
@@ -394,7 +769,7 @@ class GridSync:
         except Exception as ex:
             self.app.handleException(ex)
 
-    def onCheckWikidata(self, msg=None):
+    async def onCheckWikidata(self, msg=None):
         """
         check clicked - check the wikidata content
 
@@ -407,35 +782,242 @@ class GridSync:
             self.app.clearErrors()
             self.loadItems()
             # prepare syncing the table results with the wikibase query result
-            # query based on table content
-            self.query(self.sparql)
+            # query based on table content - in a worker thread that only
+            # queues its progress which is shown on the UI loop
+            progressQueue = queue.Queue()
+            self.progress_callback = lambda done, total: progressQueue.put(
+                (done, total)
+            )
+            timer = None
+            if self.solution is not None:
+                with self.solution.content_div:
+                    timer = ui.timer(0.5, lambda: self.showQueryProgress(progressQueue))
+            try:
+                await run.io_bound(self.query, self.sparql)
+            finally:
+                if timer is not None:
+                    timer.cancel()
+                self.progress_callback = None
+            self.showQueryProgress(progressQueue)
             # get the view copy to insert result as html statements
             viewLod = self.wdgrid.viewLod
             self.addHtmlMarkupToViewLod(viewLod)
-            # reload the AG Grid with the html enriched content
-            self.wdgrid.reloadAgGrid(viewLod)
+            # push the rows with html enriched content to the AG Grid
+            self.wdgrid.pushViewChanges()
         except Exception as ex:
             self.app.handleException(ex)
 
-    def query(self, sparql):
+    def getPkValue(self, wbRow: dict) -> str:
         """
-        query the wikibase instance based on the list of dict
+        get the primary key value of the given wikibase query result row
+
+        Args:
+            wbRow(dict): the query result row
+
+        Returns:
+            str: the primary key value with entity urls reduced to the Qid
+        """
+        pkValue = wbRow[self.pkProp]
+        # only entity urls need the (comparatively expensive) substitution
+        if PropertyDispatch.ENTITY_PREFIX in pkValue:
+            pkValue = self.entityPattern.sub(r"\1", pkValue)
+        return pkValue
+
+    def getStalePkValues(
+        self, rowHashes: typing.Dict[str, str], forceRefresh: bool = False
+    ) -> typing.List[str]:
+        """
+        get the primary key values that need to be queried since their
+        row changed or their cached query result expired
+
+        Args:
+            rowHashes(dict): the content hash of the row by primary key value
+            forceRefresh(bool): if True all primary key values are stale
+
+        Returns:
+            list: the stale primary key values
+        """
+        now = time.time()
+        stale = []
+        for pkValue, rowHash in rowHashes.items():
+            cached = self.wbRowsByPk.get(pkValue, None)
+            if (
+                forceRefresh
+                or cached is None
+                or cached[0] != rowHash
+                or now - cached[1] > self.ttl
+            ):
+                stale.append(pkValue)
+        return stale
+
+    def getBatchQueries(self, pkValues: typing.List[str] = None) -> typing.List[str]:
+        """
+        get the SPARQL queries for the given primary key values
+        with at most batchSize values per VALUES clause
+
+        Args:
+            pkValues(list): the primary key values - default: all of my items
+
+        Returns:
+            list: the SPARQL queries
         """
         lang = "en" if self.pkType == "text" else None
-        valuesClause = self.wbQuery.getValuesClause(
-            self.itemsByPk.keys(), self.pkProp, propType=self.pkType, lang=lang
-        )
-        self.sparqlQuery = self.wbQuery.asSparql(
-            filterClause=valuesClause,
-            orderClause=f"ORDER BY ?{self.pkProp}",
-            pk=self.pk,
-        )
+        if pkValues is None:
+            pkValues = list(self.itemsByPk.keys())
+        queries = []
+        for start in range(0, len(pkValues), self.batchSize):
+            valuesClause = self.wbQuery.getValuesClause(
+                pkValues[start : start + self.batchSize],
+                self.pkProp,
+                propType=self.pkType,
+                lang=lang,
+            )
+            sparqlQuery = self.wbQuery.asSparql(
+                filterClause=valuesClause,
+                orderClause=f"ORDER BY ?{self.pkProp}",
+                pk=self.pk,
+            )
+            queries.append(sparqlQuery)
+        return queries
+
+    def query(
+        self,
+        sparql: SPARQL,
+        forceRefresh: bool = False,
+        pkValues: typing.Optional[typing.List[str]] = None,
+    ):
+        """
+        query the wikibase instance based on the list of dict
+
+        only the primary key values of rows that changed since the last check
+        or whose results are older than my ttl are queried - in batches with a
+        bounded number of concurrent queries
+
+        Args:
+            sparql(SPARQL): the SPARQL endpoint to query
+            forceRefresh(bool): if True query all primary key values
+            pkValues(list): only consider these primary key values e.g. the changed keys of a LodDelta - default: all
+        """
+        if pkValues is None:
+            items = self.itemsByPk.items()
+        else:
+            items = [
+                (pkValue, self.itemsByPk[pkValue])
+                for pkValue in pkValues
+                if pkValue in self.itemsByPk
+            ]
+        rowHashes = {
+            pkValue: row_hash(row, exclude=[self.wdgrid.lodRowIndex_column])
+            for pkValue, row in items
+        }
+        stalePkValues = self.getStalePkValues(rowHashes, forceRefresh)
+        self.sparqlQueries = self.getBatchQueries(stalePkValues)
+        self.sparqlQuery = self.sparqlQueries[0] if self.sparqlQueries else None
         if self.debug:
-            print(self.sparqlQuery)
-        self.wbRows = sparql.queryAsListOfDicts(self.sparqlQuery)
+            for sparqlQuery in self.sparqlQueries:
+                print(sparqlQuery)
+        # SPARQL endpoints are not thread safe - use one per worker
+        local = threading.local()
+
+        def queryBatch(sparqlQuery: str) -> list:
+            endpoint = getattr(local, "endpoint", None)
+            if endpoint is None:
+                endpoint = GridSync.copySparql(sparql)
+                local.endpoint = endpoint
+            return endpoint.queryAsListOfDicts(sparqlQuery)
+
+        total = len(self.sparqlQueries)
+        batchRows = [None] * total
+        with ThreadPoolExecutor(max_workers=self.maxWorkers) as executor:
+            futures = {
+                executor.submit(queryBatch, sparqlQuery): index
+                for index, sparqlQuery in enumerate(self.sparqlQueries)
+            }
+            for done, future in enumerate(as_completed(futures), start=1):
+                batchRows[futures[future]] = future.result()
+                if callable(self.progress_callback):
+                    self.progress_callback(done, total)
+        fetched = time.time()
+        rowsByPk = {pkValue: [] for pkValue in stalePkValues}
+        for wbRow in chain.from_iterable(batchRows):
+            rowsByPk.setdefault(self.getPkValue(wbRow), []).append(wbRow)
+        for pkValue in stalePkValues:
+            self.wbRowsByPk[pkValue] = (
+                rowHashes[pkValue],
+                fetched,
+                rowsByPk[pkValue],
+            )
+        self.wbRows = list(
+            chain.from_iterable(
+                self.wbRowsByPk.get(pkValue, (None, None, []))[2]
+                for pkValue in self.itemsByPk.keys()
+            )
+        )
         if self.debug:
             pprint.pprint(self.wbRows)
 
+    def applyDelta(self, delta: LodDelta) -> typing.List[str]:
+        """
+        forget the query results of the rows removed by a new import
+
+        Args:
+            delta(LodDelta): the changes of the import keyed by my primary key column
+
+        Returns:
+            list: the primary key values of the added and modified rows - the only ones to query again
+        """
+        for row in delta.removed:
+            self.wbRowsByPk.pop(row.get(delta.key_column, None), None)
+        pkValues = [pkValue for pkValue in delta.changed_keys() if pkValue]
+        return pkValues
+
+    @staticmethod
+    def copySparql(sparql: SPARQL) -> SPARQL:
+        """
+        get a copy of the given SPARQL endpoint access with all its settings
+        e.g. for a worker thread - SPARQL endpoints are not thread safe
+
+        Args:
+            sparql(SPARQL): the SPARQL endpoint access to copy
+
+        Returns:
+            SPARQL: a new SPARQL endpoint access with the same settings
+        """
+        # the wrapper keeps the url as given - fuseki urls get the mode appended
+        url = sparql.sparql.endpoint
+        endpoint = SPARQL(
+            url,
+            mode=sparql.mode,
+            debug=sparql.debug,
+            isFuseki=sparql.url != url,
+            typedLiterals=sparql.typedLiterals,
+            profile=sparql.profile,
+            agent=sparql.sparql.agent,
+            method=sparql.method,
+            calls_per_minute=sparql.rate_limiter.calls_per_minute,
+        )
+        return endpoint
+
+    def showQueryProgress(self, progressQueue: queue.Queue):
+        """
+        show the progress of the batched query - to be called on the UI loop
+        while the query runs in a worker thread
+
+        Args:
+            progressQueue(queue.Queue): the (done, total) batches of the query
+        """
+        msg = None
+        while True:
+            try:
+                done, total = progressQueue.get_nowait()
+            except queue.Empty:
+                break
+            msg = f"batch {done}/{total}"
+            if self.debug:
+                print(msg)
+        if msg is not None:
+            ui.notify(msg, group=False)
+
     def checkCell(
         self,
         viewLodRow,
@@ -459,9 +1041,10 @@ class GridSync:
         """
         cellValue = viewLodRow[column]
         valueType = type(value)
-        print(
-            f"{column}({propVarname})={value}({propLabel}:{propUrl}:{valueType})⮂{cellValue}"
-        )
+        if self.debug:
+            print(
+                f"{column}({propVarname})={value}({propLabel}:{propUrl}:{valueType})⮂{cellValue}"
+            )
         # overwrite empty cells
         overwrite = not cellValue
         if cellValue:
@@ -481,23 +1064,33 @@ class GridSync:
                 value = value.strftime("%Y-%m-%d")
             else:
                 doadd = False
-                print(f"{valueType} not added")
+                if self.debug:
+                    print(f"{valueType} not added")
             if doadd:
                 viewLodRow[column] = value
 
-    def addHtmlMarkupToViewLod(self, viewLod: list):
+    def getDispatchTable(self) -> typing.Dict[str, PropertyDispatch]:
+        """
+        get the property dispatch table of my wikibase query
+        compiled once per query
+        """
+        cached = getattr(self, "dispatchTable", None)
+        if cached is None or cached[0] is not self.wbQuery:
+            cached = (self.wbQuery, PropertyDispatch.compile(self.wbQuery))
+            self.dispatchTable = cached
+        return cached[1]
+
+    def addHtmlMarkupToViewLod(self, viewLod: LodView):
         """
         add HtmlMarkup to the view list of dicts
-        viewLod(list): a list of dict for the mark result
+        viewLod(LodView): the view of the list of dicts for the mark result
         """
+        dispatchTable = self.getDispatchTable()
         # now check the wikibase rows retrieved in comparison
         # to the current view List of Dicts Markup
         for wbRow in self.wbRows:
             # get the primary key value
-            pkValue = wbRow[self.pkProp]
-            pkValue = re.sub(
-                r"http://www.wikidata.org/entity/(Q[0-9]+)", r"\1", pkValue
-            )
+            pkValue = self.getPkValue(wbRow)
             # if we have the primary key then we mark the whole row
             if pkValue in self.itemsByPk:
                 if self.debug:
@@ -520,39 +1113,18 @@ class GridSync:
                 # loop over the result items
                 for propVarname, value in wbRow.items():
                     # remap the property variable name to the original property description
-                    if propVarname in self.wbQuery.propertiesByVarname:
-                        propRow = self.wbQuery.propertiesByVarname[propVarname]
-                        column = propRow["Column"]
-                        propType = propRow["Type"]
-                        if not propType:
-                            propLabel = wbRow[f"{propVarname}Label"]
-                        else:
-                            propLabel = ""
-                        if propType == "extid":
-                            propUrl = wbRow[f"{propVarname}Url"]
-                        elif propType == "url":
-                            propUrl = wbRow[f"{propVarname}"]
-                        else:
-                            propUrl = ""
-                        # Linked Or
-                        if (
-                            type(value) == str
-                            and value.startswith("http://www.wikidata.org/entity/")
-                            and f"{propVarname}Label" in wbRow
-                        ):
-                            propUrl = value
-                            propLabel = wbRow[f"{propVarname}Label"]
-                            value = propLabel
-                        if column in lodRow:
-                            self.checkCell(
-                                viewLodRow,
-                                column,
-                                value,
-                                propVarname,
-                                propType,
-                                propLabel,
-                                propUrl,
-                            )
+                    dispatch = dispatchTable.get(propVarname, None)
+                    if dispatch is not None and dispatch.column in lodRow:
+                        value, propLabel, propUrl = dispatch.handler(wbRow, value)
+                        self.checkCell(
+                            viewLodRow,
+                            dispatch.column,
+                            value,
+                            propVarname,
+                            dispatch.propType,
+                            propLabel,
+                            propUrl,
+                        )
 
     def getColumnTypeAndVarname(self, propName: str):
         """
@@ -569,6 +1141,22 @@ class GridSync:
             column, propType, varName = self.wbQuery.getColumnTypeAndVarname(propName)
         return column, propType, varName
 
+    def getPropertyTypes(self) -> typing.Dict[str, str]:
+        """
+        get the types of the synced properties by column for the
+        type aware comparison of values
+
+        Returns:
+            dict: the property type by column - "item" for untyped properties
+        """
+        propertyTypes = {}
+        if self.wbQuery is not None:
+            for column, propRow in self.wbQuery.propertiesByColumn.items():
+                propertyTypes[column] = propRow["Type"] or "item"
+        for column in ["label", "description"]:
+            propertyTypes.setdefault(column, "text")
+        return propertyTypes
+
     def getHtmlColumns(self):
         """
         get the columns that have html content(links)
@@ -586,6 +1174,183 @@ class GridSync:
                         htmlColumns.append(columnIndex)
         return htmlColumns
 
+    def getRowData(self, record: dict) -> dict:
+        """
+        get the data to write to wikidata for the given record
+
+        Args:
+            record(dict): the record of the grid
+
+        Returns:
+            dict: a copy of the record without the index column
+        """
+        if not "label" in record:
+            raise Exception(f"label missing in {record}")
+        rowData = record.copy()
+        # remove index
+        if self.wdgrid.lodRowIndex_column in rowData:
+            rowData.pop(self.wdgrid.lodRowIndex_column)
+        return rowData
+
+    def getSyncPossibleRowIndices(self) -> typing.List[int]:
+        """
+        get the rows that could be added to wikidata - the rows without
+        item whose primary key had no result in the last check
+
+        Returns:
+            list: the lodRowIndex values of the rows
+        """
+        rowIndices = []
+        for pkValue, row in self.itemsByPk.items():
+            cached = self.wbRowsByPk.get(pkValue, None)
+            if cached is not None and not cached[2] and not row.get("item", None):
+                rowIndices.append(row[self.wdgrid.lodRowIndex_column])
+        return sorted(rowIndices)
+
+    def bulk_add_records_to_wikidata(
+        self,
+        rowIndices: typing.List[int] = None,
+        write: bool = False,
+        ignore_errors: bool = False,
+        name: str = None,
+        yaml_path: str = None,
+        edits_per_minute: float = 30,
+        progress_callback: Callable = None,
+    ) -> BulkWriter:
+        """
+        add the given rows to wikidata as a background job - an interrupted
+        job with the same name is resumed
+
+        Args:
+            rowIndices(list): the lodRowIndex values of the rows - default: all rows for which a sync is possible
+            write(bool): if True actually write data
+            ignore_errors(bool): if True ignore errors that might occur
+            name(str): the name of the job - default: my entityName
+            yaml_path(str): the path of the job state
+            edits_per_minute(float): the maximum number of edits per minute
+            progress_callback(Callable): called with (BulkWriteRow, done, total) after each row
+
+        Returns:
+            BulkWriter: the started writer
+
+        Raises:
+            ValueError: if the rows of a resumed job do not match my rows any more
+        """
+        if rowIndices is None:
+            rowIndices = self.getSyncPossibleRowIndices()
+        if name is None:
+            name = self.entityName
+        state = BulkWriteState.load(name, yaml_path)
+        state.write = write
+        pkColumn = getattr(self, "pkColumn", None)
+
+        def getPk(rowIndex: int) -> typing.Optional[str]:
+            if not 0 <= rowIndex < len(self.wdgrid.lod):
+                return None
+            pkValue = self.wdgrid.lod[rowIndex].get(pkColumn, None)
+            return None if pkValue is None else str(pkValue)
+
+        # a resumed job must still refer to the same rows
+        state.check_rows(getPk)
+        state.add_rows(
+            rowIndices, {rowIndex: getPk(rowIndex) for rowIndex in rowIndices}
+        )
+        mapDict = self.wbQuery.propertiesById
+
+        def write_record(rowIndex: int):
+            rowData = self.getRowData(self.wdgrid.lod[rowIndex])
+            return self.wdgrid.wd.addDict(
+                rowData, mapDict, write=write, ignoreErrors=ignore_errors
+            )
+
+        def find_record(rowIndex: int) -> typing.Optional[str]:
+            return self.findItem(getPk(rowIndex))
+
+        # the worker thread only queues its progress - the grid is updated on the UI loop
+        progressQueue = queue.Queue()
+        writer = BulkWriter(
+            write_record,
+            state,
+            yaml_path=yaml_path,
+            edits_per_minute=edits_per_minute,
+            progress_callback=lambda row, done, total: progressQueue.put(
+                (row, done, total)
+            ),
+            find_record=find_record,
+            debug=self.debug,
+        )
+        writer.start()
+        if self.solution is not None:
+
+            def poll():
+                if not self.showBulkWriteProgress(
+                    writer, progressQueue, progress_callback
+                ):
+                    timer.cancel()
+
+            with self.solution.content_div:
+                timer = ui.timer(0.5, poll)
+        return writer
+
+    def findItem(self, pkValue: typing.Optional[str]) -> typing.Optional[str]:
+        """
+        look up the item with the given primary key value e.g. after an
+        ambiguous write error
+
+        Args:
+            pkValue(str): the primary key value
+
+        Returns:
+            str: the QID of the item or None if there is none
+        """
+        if pkValue is None:
+            return None
+        sparqlQuery = self.getBatchQueries([pkValue])[0]
+        # called from the bulk write worker thread
+        endpoint = GridSync.copySparql(self.sparql)
+        for wbRow in endpoint.queryAsListOfDicts(sparqlQuery):
+            if self.getPkValue(wbRow) == pkValue and "item" in wbRow:
+                qid = wbRow["item"].rsplit("/", 1)[-1]
+                return qid
+        return None
+
+    def showBulkWriteProgress(
+        self,
+        writer: BulkWriter,
+        progressQueue: queue.Queue,
+        progress_callback: Callable = None,
+    ) -> bool:
+        """
+        show the rows written by the given bulk write job in the grid - to be
+        called on the UI loop while the job runs in its worker thread
+
+        Args:
+            writer(BulkWriter): the bulk write job
+            progressQueue(queue.Queue): the (BulkWriteRow, done, total) progress of the job
+            progress_callback(Callable): called with (BulkWriteRow, done, total) for each row
+
+        Returns:
+            bool: True if the job is still running
+        """
+        running = writer.thread is not None and writer.thread.is_alive()
+        while True:
+            try:
+                row, done, total = progressQueue.get_nowait()
+            except queue.Empty:
+                break
+            if row.status == "done":
+                label = self.wdgrid.lod[row.row_index].get("label", row.qid)
+                link = self.wdgrid.createLink(
+                    f"https://www.wikidata.org/wiki/{row.qid}", f"{label}"
+                )
+                self.wdgrid.viewLod[row.row_index]["item"] = link
+                self.wbRowsByPk.pop(row.pk, None)
+                self.invalidateEntity(row.qid)
+            if callable(progress_callback):
+                progress_callback(row, done, total)
+        self.wdgrid.pushViewChanges()
+        return running
+
     def add_record_to_wikidata(
         self,
         record: dict,
@@ -602,25 +1367,24 @@ class GridSync:
             write(bool): if True actually write data
             ignore_errors(bool): if True ignore errors that might occur
         """
-        if not "label" in record:
-            raise Exception(f"label missing in {record}")
-        label = record["label"]
+        label = record.get("label", None)
         mapDict = self.wbQuery.propertiesById
-        rowData = record.copy()
-        # remove index
-        if self.wdgrid.lodRowIndex_column in rowData:
-            rowData.pop(self.wdgrid.lodRowIndex_column)
-        qid, errors = self.wdgrid.wd.addDict(
+        rowData = self.getRowData(record)
+        result = self.wdgrid.wd.addDict(
             rowData, mapDict, write=write, ignoreErrors=ignore_errors
         )
+        qid, errors = result.qid, result.errors
         if qid is not None:
             # set item link
             link = self.wdgrid.createLink(
                 f"https://www.wikidata.org/wiki/{qid}", f"{label}"
             )
-            self.wdgrid.viewLod[row_index]["item"] = link
-            self.wdgrid.agGrid.load_lod(self.wdgrid.viewLod)
-            self.wdgrid.refreshGridSettings()
+            self.wdgrid.applyCellTransaction(row_index, "item", link)
+            if write:
+                # the wikibase content of this row has changed
+                pkValue = record.get(getattr(self, "pkColumn", None), None)
+                self.wbRowsByPk.pop(pkValue, None)
+                self.invalidateEntity(qid)
         # @TODO improve error handling
         if len(errors) > 0:
             self.wdgrid.app.errors.text = errors
@@ -633,6 +1397,19 @@ class GridSync:
             alert = Alert(text="", a=self.wdgrid.app.rowA)
             alert.contentDiv.inner_html = html
 
+    def get_property_mappings(self) -> typing.List[PropertyMapping]:
+        """
+        get the property mappings of my wikibase query including the
+        mapping of the item column
+
+        Returns:
+            list: the property mappings
+        """
+        prop_maps = self.wdgrid.wd.wpm.get_mappings_for_records(
+            self.wbQuery.propertiesByColumn
+        )
+        return prop_maps
+
     def handle_row_selected(
         self,
         record: dict,
@@ -640,6 +1417,27 @@ class GridSync:
         write: bool = False,
         ignore_errors: bool = False,
     ):
+        cr = self.getComparisonRecord(record, row_index)
+        # show SyncDialog
+        self.wdgrid.sync_dialog_div.delete_components()
+        sync_dialog = SyncDialog(
+            cr,
+            sync_callback=self._sync_callback,
+            value_enhancement_callback=self.enhance_value_display,
+            a=self.wdgrid.sync_dialog_div,
+        )
+
+    def getComparisonRecord(self, record: dict, row_index: int) -> ComparisonRecord:
+        """
+        compare the given record of a selected row with its wikibase item
+
+        Args:
+            record(dict): the record of the grid
+            row_index(int): the row index
+
+        Returns:
+            ComparisonRecord: the comparison of the record with the item
+        """
         record = record.copy()
         record = {k: v if v != "" else None for k, v in record.items()}
         prop_maps = self.get_property_mappings()
@@ -662,18 +1460,19 @@ class GridSync:
         record = self.wdgrid.wd.normalize_records(record, prop_maps)
         wd_record = self.wdgrid.wd.normalize_records(wd_record, prop_maps)
 
-        cr = ComparisonRecord(self.wdgrid.source, record, "wikidata", wd_record)
+        propertyTypes = self.getPropertyTypes()
+        cr = ComparisonRecord(
+            self.wdgrid.source,
+            record,
+            "wikidata",
+            wd_record,
+            schema=PropertySchema(propertyTypes),
+            property_types=propertyTypes,
+        )
         # save item specific attrs
         cr.lodRowIndex = row_index
         cr.qid = item_id
-        # show SyncDialog
-        self.wdgrid.sync_dialog_div.delete_components()
-        sync_dialog = SyncDialog(
-            cr,
-            sync_callback=self._sync_callback,
-            value_enhancement_callback=self.enhance_value_display,
-            a=self.wdgrid.sync_dialog_div,
-        )
+        return cr
 
     def _sync_callback(self, sync_request: SyncRequest):
         """
@@ -715,7 +1514,7 @@ class GridSync:
                     Exception(f"Updating of source {source} is not supported")
                 )
 
-    def enhance_value_display(self, row: SyncDialogRow):
+    def enhance_value_display(self, row: "SyncDialogRow"):
         """
         Enhances the displayed value
         """
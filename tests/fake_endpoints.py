@@ -0,0 +1,124 @@
+"""
+Created on 2026-10-18
+
+@author: wf
+"""
+
+import re
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class ConcurrencyCounter:
+    """
+    record the requests of a fake endpoint and count how many of them
+    are active at the same time
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = []
+        self.active = 0
+        self.max_active = 0
+
+    @contextmanager
+    def track(self, request=None, delay: float = 0.0):
+        """
+        track a request while it is active
+
+        Args:
+            request: the request to record
+            delay(float): the time to keep the request active in seconds
+        """
+        with self.lock:
+            self.requests.append(request)
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            if delay:
+                time.sleep(delay)
+            yield
+        finally:
+            with self.lock:
+                self.active -= 1
+
+
+class FakeEndpoint(ConcurrencyCounter):
+    """
+    SPARQL endpoint stand-in
+
+    answers LIMIT/OFFSET pages of the given records or a single record
+    with the url, the query and the number of queries answered so far
+    """
+
+    def __init__(
+        self, url: str = "http://endpoint/sparql", delay: float = 0.0, records=None
+    ):
+        super().__init__()
+        self.url = url
+        self.delay = delay
+        self.records = records
+
+    def queryAsListOfDicts(self, query: str):
+        with self.track(query, self.delay):
+            lod = self.answer(query)
+        return lod
+
+    def answer(self, query: str) -> list:
+        if self.records is None:
+            return [{"url": self.url, "query": query, "count": len(self.requests)}]
+        limit = re.search(r"LIMIT (\d+)", query)
+        offset = re.search(r"OFFSET (\d+)", query)
+        start = int(offset.group(1)) if offset else 0
+        end = start + int(limit.group(1)) if limit else None
+        return self.records[start:end]
+
+
+class FakeHandler(BaseHTTPRequestHandler):
+    """
+    keep-alive request handler of a FakeHttpServer
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    @property
+    def fake(self) -> "FakeHttpServer":
+        return self.server.fake
+
+    def send_body(
+        self,
+        body: bytes,
+        status: int = 200,
+        content_type: str = "application/json",
+        headers: dict = None,
+    ):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        if status != 304:
+            self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class FakeHttpServer(ConcurrencyCounter):
+    """
+    local HTTP server running the given FakeHandler in a background thread
+    """
+
+    def __init__(self, handler_class: type):
+        super().__init__()
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), handler_class)
+        self.httpd.fake = self
+        self.base_url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -0,0 +1,466 @@
+"""
+Created on 2026-10-18
+
+@author: wf
+"""
+
+import copy
+import json
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+from urllib.parse import parse_qs, urlparse
+
+from rdflib import XSD, Graph, Literal, Namespace, URIRef
+from rdflib.namespace import RDFS
+from rdflib.plugins.sparql import prepareQuery
+
+WD = Namespace("http://www.wikidata.org/entity/")
+WDT = Namespace("http://www.wikidata.org/prop/direct/")
+SCHEMA = Namespace("http://schema.org/")
+
+
+class MockWikibaseHandler(BaseHTTPRequestHandler):
+    """
+    request handler of the MockWikibase
+    """
+
+    protocol_version = "HTTP/1.1"
+    # the headers and the body are written separately
+    disable_nagle_algorithm = True
+
+    def get_params(self) -> dict:
+        """
+        get the query and form parameters of the request
+        """
+        params = parse_qs(urlparse(self.path).query)
+        if self.command == "POST":
+            length = int(self.headers.get("Content-Length", 0))
+            body = self.rfile.read(length).decode("utf-8")
+            params.update(parse_qs(body))
+        params = {key: values[0] for key, values in params.items()}
+        return params
+
+    def handle_request(self):
+        wikibase = self.server.wikibase
+        path = urlparse(self.path).path
+        params = self.get_params()
+        wikibase.count_request(path)
+        if wikibase.latency:
+            time.sleep(wikibase.latency)
+        if path == "/sparql":
+            status, content_type, body = wikibase.sparql(params.get("query", ""))
+        elif path == "/w/api.php":
+            status, content_type, body = wikibase.api(params)
+        else:
+            status, content_type, body = 404, "text/plain", b"not found"
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self.handle_request()
+
+    def do_POST(self):
+        self.handle_request()
+
+    def log_message(self, *args):
+        if self.server.wikibase.debug:
+            BaseHTTPRequestHandler.log_message(self, *args)
+
+
+class MockWikibase:
+    """
+    local stand-in for a wikibase serving a SPARQL endpoint and the
+    wbgetentities / wbeditentity API from a fixture of entities
+
+    the SPARQL queries are evaluated with rdflib on the truthy statements
+    (wdt:), labels (rdfs:label) and descriptions (schema:description) of the
+    entities - every request is delayed by the configured latency
+
+    rdflib is only part of the test dependencies: pip install .[test]
+    """
+
+    VALUES_PATTERN = re.compile(r"VALUES\s*\(?[^{]*\{(.*?)\}", re.DOTALL)
+    TERM_PATTERN = re.compile(
+        r"wd:(Q[0-9]+)|<([^>]+)>|'((?:[^'\\]|\\.)*)'(?:@([\w-]+))?"
+        r"|\"((?:[^\"\\]|\\.)*)\"(?:@([\w-]+))?|(?<![\w.])(-?[0-9]+)(?![\w.])"
+    )
+
+    def __init__(
+        self,
+        entities: Dict[str, dict] = None,
+        latency: float = 0.0,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        debug: bool = False,
+    ):
+        """
+        constructor
+
+        Args:
+            entities(dict): the entity JSON by QID as returned by wbgetentities
+            latency(float): the artificial latency per request in seconds
+            host(str): the host to bind to
+            port(int): the port to bind to - default: a free port
+            debug(bool): if True show debug information
+        """
+        self.entities = {}
+        self.latency = latency
+        self.host = host
+        self.port = port
+        self.debug = debug
+        self.graph = Graph()
+        # read only copy of the graph for queries without VALUES clause
+        self.snapshot = None
+        # reentrant - an edit holds the lock while it puts the entity
+        self.lock = threading.RLock()
+        self.parse_lock = threading.Lock()
+        self.requests = {}
+        self.server = None
+        self.next_id = 1
+        self.property_subjects = set()
+        for entity in (entities or {}).values():
+            self.put_entity(entity)
+
+    @classmethod
+    def synthetic_entities(
+        cls, count: int, offset: int = 1, pk_property: str = "P1813"
+    ) -> Dict[str, dict]:
+        """
+        get a fixture of event entities for benchmarks
+
+        Args:
+            count(int): the number of entities
+            offset(int): the number of the first QID
+            pk_property(str): the property for the english short name "EV<n>"
+
+        Returns:
+            dict: the entity JSON by QID
+        """
+        entities = {}
+        for number in range(offset, offset + count):
+            qid = f"Q{number}"
+            entities[qid] = {
+                "id": qid,
+                "type": "item",
+                "lastrevid": 1,
+                "labels": {"en": {"language": "en", "value": f"Event {number}"}},
+                "descriptions": {
+                    "en": {"language": "en", "value": f"synthetic event {number}"}
+                },
+                "claims": {
+                    "P31": [cls.claim("P31", "wikibase-item", "Q1656682")],
+                    pk_property: [
+                        cls.claim(pk_property, "monolingualtext", f"EV{number}")
+                    ],
+                    "P580": [
+                        cls.claim(
+                            "P580", "time", f"+{2000 + number % 25}-01-01T00:00:00Z"
+                        )
+                    ],
+                },
+            }
+        return entities
+
+    @classmethod
+    def claim(cls, pid: str, datatype: str, value) -> dict:
+        """
+        get the JSON of a statement with the given value
+        """
+        if datatype == "wikibase-item":
+            datavalue = {
+                "value": {
+                    "entity-type": "item",
+                    "numeric-id": int(value[1:]),
+                    "id": value,
+                },
+                "type": "wikibase-entityid",
+            }
+        elif datatype == "time":
+            datavalue = {
+                "value": {
+                    "time": value,
+                    "timezone": 0,
+                    "before": 0,
+                    "after": 0,
+                    "precision": 11,
+                    "calendarmodel": "http://www.wikidata.org/entity/Q1985727",
+                },
+                "type": "time",
+            }
+        elif datatype == "monolingualtext":
+            datavalue = {
+                "value": {"text": value, "language": "en"},
+                "type": "monolingualtext",
+            }
+        else:
+            datavalue = {"value": value, "type": "string"}
+        statement = {
+            "mainsnak": {
+                "snaktype": "value",
+                "property": pid,
+                "datavalue": datavalue,
+                "datatype": datatype,
+            },
+            "type": "statement",
+            "rank": "normal",
+        }
+        return statement
+
+    @classmethod
+    def to_rdf_value(cls, datavalue: dict):
+        """
+        get the rdflib node for the given datavalue
+        """
+        value = datavalue["value"]
+        value_type = datavalue["type"]
+        if value_type == "wikibase-entityid":
+            node = WD[value["id"]]
+        elif value_type == "time":
+            node = Literal(value["time"].lstrip("+"), datatype=XSD.dateTime)
+        elif value_type == "quantity":
+            node = Literal(value["amount"].lstrip("+"), datatype=XSD.decimal)
+        elif value_type == "monolingualtext":
+            node = Literal(value["text"], lang=value["language"])
+        else:
+            node = Literal(value)
+        return node
+
+    def put_entity(self, entity: dict):
+        """
+        add or replace the given entity and its triples
+        """
+        qid = entity["id"]
+        subject = WD[qid]
+        with self.lock:
+            self.snapshot = None
+            self.graph.remove((subject, None, None))
+            for label in entity.get("labels", {}).values():
+                self.graph.add(
+                    (
+                        subject,
+                        RDFS.label,
+                        Literal(label["value"], lang=label["language"]),
+                    )
+                )
+            for desc in entity.get("descriptions", {}).values():
+                self.graph.add(
+                    (
+                        subject,
+                        SCHEMA.description,
+                        Literal(desc["value"], lang=desc["language"]),
+                    )
+                )
+            for pid, statements in entity.get("claims", {}).items():
+                for statement in statements:
+                    # the wikibase assigns the statement ids
+                    statement.setdefault("id", f"{qid}${uuid.uuid4()}")
+                    mainsnak = statement["mainsnak"]
+                    if mainsnak.get("snaktype") == "value":
+                        node = self.to_rdf_value(mainsnak["datavalue"])
+                        self.graph.add((subject, WDT[pid], node))
+            self.entities[qid] = entity
+            if qid.startswith("P"):
+                self.property_subjects.add(subject)
+            else:
+                self.next_id = max(self.next_id, int(qid[1:]) + 1)
+
+    def get_values_nodes(self, query: str) -> Optional[list]:
+        """
+        get the nodes of the VALUES clauses of the given query
+
+        Returns:
+            list: the IRIs and literals or None if there is no VALUES clause
+        """
+        clauses = self.VALUES_PATTERN.findall(query)
+        if not clauses:
+            return None
+        nodes = []
+        for clause in clauses:
+            for term in self.TERM_PATTERN.findall(clause):
+                qid, iri, single, single_lang, double, double_lang, number = term
+                if qid:
+                    nodes.append(WD[qid])
+                elif iri:
+                    nodes.append(URIRef(iri))
+                elif single or double:
+                    text = re.sub(r"\\(.)", r"\1", single or double)
+                    lang = single_lang or double_lang or None
+                    nodes.append(Literal(text, lang=lang))
+                elif number:
+                    nodes.append(Literal(int(number)))
+        return nodes
+
+    def get_values_graph(self, query: str) -> Graph:
+        """
+        get the part of my graph that is relevant for the VALUES clauses of
+        the given query - the entities that have or are one of the values,
+        the entities they link to and all property entities
+
+        rdflib joins VALUES with a nested loop so evaluating a batch of
+        values against the whole graph would make the stand-in far slower
+        than the real endpoint
+
+        the returned graph is not modified any more so that the query can
+        be evaluated without holding my lock - to be called with my lock held
+        """
+        nodes = self.get_values_nodes(query)
+        if nodes is None:
+            if self.snapshot is None:
+                self.snapshot = Graph()
+                self.snapshot += self.graph
+            return self.snapshot
+        subjects = set()
+        for node in nodes:
+            subjects.update(self.graph.subjects(None, node))
+            if isinstance(node, URIRef):
+                subjects.add(node)
+        linked = set()
+        graph = Graph()
+        for subject in subjects:
+            for triple in self.graph.triples((subject, None, None)):
+                graph.add(triple)
+                if isinstance(triple[2], URIRef):
+                    linked.add(triple[2])
+        for subject in linked - subjects:
+            for triple in self.graph.triples((subject, None, None)):
+                graph.add(triple)
+        for subject in self.property_subjects:
+            for triple in self.graph.triples((subject, None, None)):
+                graph.add(triple)
+        return graph
+
+    def count_request(self, path: str):
+        with self.lock:
+            self.requests[path] = self.requests.get(path, 0) + 1
+
+    def sparql(self, query: str) -> tuple:
+        """
+        evaluate the given SPARQL query
+
+        Returns:
+            (int, str, bytes): the status, content type and body of the response
+        """
+        try:
+            with self.lock:
+                graph = self.get_values_graph(query)
+            # the pyparsing based parser is not thread safe
+            with self.parse_lock:
+                prepared = prepareQuery(query)
+            # concurrent queries are evaluated in parallel
+            result = graph.query(prepared)
+            body = result.serialize(format="json")
+            return 200, "application/sparql-results+json", body
+        except Exception as ex:
+            return 400, "text/plain", str(ex).encode("utf-8")
+
+    def api(self, params: dict) -> tuple:
+        """
+        handle a MediaWiki API request
+
+        Returns:
+            (int, str, bytes): the status, content type and body of the response
+        """
+        action = params.get("action", None)
+        if action == "wbgetentities":
+            entities = {}
+            with self.lock:
+                for qid in params.get("ids", "").split("|"):
+                    entity = self.entities.get(qid, None)
+                    entities[qid] = (
+                        entity if entity is not None else {"id": qid, "missing": ""}
+                    )
+                content = {"entities": entities, "success": 1}
+        elif action == "wbeditentity":
+            content = self.edit_entity(params)
+        elif action == "query" and params.get("meta", None) == "tokens":
+            # any user and password are accepted
+            tokens = {"csrftoken": "mock-csrf+\\", "logintoken": "mock-login+\\"}
+            content = {"query": {"tokens": tokens}}
+        elif action == "login":
+            lgname = params.get("lgname", "")
+            content = {"login": {"result": "Success", "lgusername": lgname}}
+        else:
+            content = {
+                "error": {"code": "badvalue", "info": f"unsupported action {action}"}
+            }
+        body = json.dumps(content).encode("utf-8")
+        return 200, "application/json", body
+
+    def edit_entity(self, params: dict) -> dict:
+        """
+        create or update an entity with the given wbeditentity parameters
+        """
+        data = json.loads(params.get("data", "{}"))
+        qid = params.get("id", None)
+        # concurrent edits of the same entity are applied one after the other
+        with self.lock:
+            if qid is None:
+                qid = f"Q{self.next_id}"
+                self.next_id += 1
+                entity = {"id": qid, "type": "item", "lastrevid": 0}
+            elif qid in self.entities:
+                entity = copy.deepcopy(self.entities[qid])
+            else:
+                return {"error": {"code": "no-such-entity", "info": qid}}
+            if params.get("clear", None):
+                for key in ["labels", "descriptions", "aliases", "claims"]:
+                    entity.pop(key, None)
+            for key in ["labels", "descriptions", "aliases", "sitelinks"]:
+                if key in data:
+                    entity.setdefault(key, {}).update(data[key])
+            claims = data.get("claims", {})
+            if isinstance(claims, list):
+                statements = claims
+            else:
+                statements = [s for values in claims.values() for s in values]
+            for statement in statements:
+                pid = statement["mainsnak"]["property"]
+                entity.setdefault("claims", {}).setdefault(pid, []).append(statement)
+            entity["lastrevid"] = entity.get("lastrevid", 0) + 1
+            self.put_entity(entity)
+            content = {"entity": copy.deepcopy(entity), "success": 1}
+        return content
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    @property
+    def sparql_url(self) -> str:
+        return f"{self.base_url}/sparql"
+
+    @property
+    def api_url(self) -> str:
+        return f"{self.base_url}/w/api.php"
+
+    def start(self) -> "MockWikibase":
+        """
+        start serving in a background thread
+        """
+        self.server = ThreadingHTTPServer((self.host, self.port), MockWikibaseHandler)
+        self.server.wikibase = self
+        self.port = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        """
+        stop serving
+        """
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def __enter__(self) -> "MockWikibase":
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
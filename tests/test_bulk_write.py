@@ -0,0 +1,249 @@
+"""
+Created on 2026-10-18
+
+@author: wf
+"""
+
+import os
+import tempfile
+import time
+from types import SimpleNamespace
+
+import requests
+from ngwidgets.basetest import Basetest
+from urllib3.exceptions import MaxRetryError, NewConnectionError
+from wikibaseintegrator.wbi_exceptions import MWApiError
+
+from onlinespreadsheet.bulk_write import BulkWriter, BulkWriteState
+
+
+class TestBulkWrite(Basetest):
+    """
+    test writing rows to a wikibase as a resumable job
+    """
+
+    def setUp(self, debug=False, profile=True):
+        Basetest.setUp(self, debug=debug, profile=profile)
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.yaml_path = os.path.join(self.tmpdir.name, "events.yaml")
+        self.calls = []
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+        Basetest.tearDown(self)
+
+    def write_record(self, row_index: int):
+        """
+        fake wikibase write - row 1 hits maxlag once, row 2 is invalid
+        """
+        self.calls.append((row_index, time.monotonic()))
+        attempts = sum(1 for index, _t in self.calls if index == row_index)
+        errors = {}
+        if row_index == 1 and attempts == 1:
+            errors["write failed"] = MWApiError(
+                {"code": "maxlag", "info": "Waiting for all: 6 seconds lagged"}
+            )
+        if row_index == 2:
+            raise Exception("label missing in {}")
+        return SimpleNamespace(qid=None if errors else f"Q{row_index}", errors=errors)
+
+    def testBulkWrite(self):
+        """
+        test rate limiting, retries and per row results
+        """
+        state = BulkWriteState.load("events", self.yaml_path)
+        state.write = True
+        state.add_rows([0, 1, 2, 3])
+        progress = []
+        writer = BulkWriter(
+            self.write_record,
+            state,
+            yaml_path=self.yaml_path,
+            edits_per_minute=1200,
+            backoff_factor=0.01,
+            progress_callback=lambda row, done, total: progress.append(
+                (row.row_index, done, total)
+            ),
+        )
+        writer.start().join(timeout=10)
+        statuses = [(row.status, row.qid, row.attempts) for row in state.rows]
+        self.assertEqual(
+            [
+                ("done", "Q0", 1),
+                ("done", "Q1", 2),
+                ("failed", None, 1),
+                ("done", "Q3", 1),
+            ],
+            statuses,
+        )
+        self.assertEqual([(0, 1, 4), (1, 2, 4), (2, 3, 4), (3, 4, 4)], progress)
+        # at most 20 edits per second
+        times = [t for _index, t in self.calls]
+        intervals = [later - earlier for earlier, later in zip(times, times[1:])]
+        self.assertTrue(min(intervals) >= 0.045)
+        saved = BulkWriteState.load("events", self.yaml_path)
+        self.assertEqual(3, saved.count("done"))
+        self.assertEqual(["label missing in {}"], saved.rows[2].errors)
+        # a resumed job tries the failed rows again
+        BulkWriter(
+            self.write_record, saved, yaml_path=self.yaml_path, edits_per_minute=0
+        ).run()
+        self.assertEqual([2], [index for index, _t in self.calls[5:]])
+        self.assertEqual(("failed", 2), (saved.rows[2].status, saved.rows[2].attempts))
+
+    def testResume(self):
+        """
+        test resuming an interrupted job
+        """
+        state = BulkWriteState.load("events", self.yaml_path)
+        state.write = True
+        state.add_rows([0, 3, 4, 5])
+        writer = BulkWriter(
+            self.write_record, state, yaml_path=self.yaml_path, edits_per_minute=1200
+        )
+        writer.progress_callback = lambda row, done, total: writer.stop()
+        writer.run()
+        self.assertEqual(1, state.count("done"))
+        # resume from the saved state - known rows are not added twice
+        state = BulkWriteState.load("events", self.yaml_path)
+        state.add_rows([0, 3, 4, 5])
+        self.assertEqual(4, len(state.rows))
+        writer = BulkWriter(
+            self.write_record, state, yaml_path=self.yaml_path, edits_per_minute=1200
+        )
+        writer.run()
+        self.assertEqual(4, state.count("done"))
+        self.assertEqual([0, 3, 4, 5], [index for index, _t in self.calls])
+
+    def testDryRun(self):
+        """
+        test that a saved dry run does not keep a later write from writing the rows
+        """
+        for write, expected in [(False, "checked"), (True, "done")]:
+            state = BulkWriteState.load("events", self.yaml_path)
+            state.write = write
+            state.add_rows([0, 3])
+            BulkWriter(
+                self.write_record,
+                state,
+                yaml_path=self.yaml_path,
+                edits_per_minute=1200,
+            ).run()
+            self.assertEqual(2, state.count(expected))
+            # the dry run is saved as well - the checked rows are written later
+            saved = BulkWriteState.load("events", self.yaml_path)
+            self.assertEqual(2, saved.count(expected))
+        self.assertEqual([0, 3, 0, 3], [index for index, _t in self.calls])
+        saved = BulkWriteState.load("events", self.yaml_path)
+        self.assertEqual(["Q0", "Q3"], [row.qid for row in saved.rows])
+        # a write without an item id is not done
+        state = BulkWriteState(name="events", write=True)
+        state.add_rows([0])
+        writer = BulkWriter(
+            lambda row_index: SimpleNamespace(qid=None, errors={}),
+            state,
+            yaml_path=self.yaml_path,
+            edits_per_minute=0,
+        )
+        writer.run()
+        self.assertEqual("failed", state.rows[0].status)
+
+    def testCheckRows(self):
+        """
+        test that a resumed job fails if its rows moved
+        """
+        state = BulkWriteState(name="events")
+        pks = {0: "E0", 1: "E1"}
+        state.add_rows([0, 1], pks)
+        state.check_rows(pks.get)
+        # a row has been inserted before row 1
+        pks = {0: "E0", 1: "new", 2: "E1"}
+        with self.assertRaises(ValueError) as context:
+            state.check_rows(pks.get)
+        self.assertIn("row 1: 'E1' != 'new'", str(context.exception))
+
+    def testIsTransient(self):
+        """
+        test classifying errors by type, API error code and HTTP status
+        """
+        writer = BulkWriter(self.write_record, BulkWriteState(name="events"))
+
+        def http_error(status_code: int) -> requests.HTTPError:
+            return requests.HTTPError(response=SimpleNamespace(status_code=status_code))
+
+        for error, expected in [
+            (MWApiError({"code": "maxlag", "info": "lagged"}), True),
+            (MWApiError({"code": "badtoken", "info": "invalid token"}), False),
+            (http_error(503), True),
+            (http_error(429), True),
+            (http_error(404), False),
+            (requests.ConnectTimeout(), True),
+            (
+                requests.ConnectionError(
+                    MaxRetryError(
+                        None, "/w/api.php", NewConnectionError(None, "refused")
+                    )
+                ),
+                True,
+            ),
+            (ConnectionRefusedError(), True),
+            # the write may have been applied
+            (requests.ConnectionError("connection reset"), False),
+            (requests.ReadTimeout(), False),
+            (TimeoutError(), False),
+            (http_error(504), False),
+            # free text does not count
+            (Exception("Q15030 has no connection to maxlag"), False),
+            (Exception("503"), False),
+        ]:
+            with self.subTest(error=error):
+                self.assertEqual(expected, writer.is_transient(error))
+        self.assertTrue(writer.is_ambiguous(requests.ReadTimeout()))
+        self.assertTrue(writer.is_ambiguous(http_error(504)))
+        self.assertFalse(writer.is_ambiguous(requests.ConnectTimeout()))
+        self.assertFalse(writer.is_ambiguous(Exception("label missing")))
+
+    def testAmbiguousError(self):
+        """
+        test that a create that timed out is not retried if the item exists
+        """
+        created = {}
+
+        def write_record(row_index: int):
+            self.calls.append((row_index, time.monotonic()))
+            # the item is created but the response times out
+            created[row_index] = f"Q{row_index}"
+            if row_index == 0:
+                raise requests.ReadTimeout()
+            return SimpleNamespace(qid=created[row_index], errors={})
+
+        for find_record, expected in [
+            (created.get, [("done", "Q0", 1), ("done", "Q1", 1)]),
+            (None, [("failed", None, 1), ("done", "Q1", 1)]),
+        ]:
+            created.clear()
+            state = BulkWriteState(name="events", write=True)
+            state.add_rows([0, 1])
+            BulkWriter(
+                write_record,
+                state,
+                yaml_path=self.yaml_path,
+                edits_per_minute=0,
+                backoff_factor=0.01,
+                find_record=find_record,
+            ).run()
+            statuses = [(row.status, row.qid, row.attempts) for row in state.rows]
+            self.assertEqual(expected, statuses)
+        # an item that has not been created is written again
+        state = BulkWriteState(name="events", write=True)
+        state.add_rows([0])
+        BulkWriter(
+            write_record,
+            state,
+            yaml_path=self.yaml_path,
+            edits_per_minute=0,
+            max_retries=1,
+            backoff_factor=0.01,
+            find_record=lambda row_index: None,
+        ).run()
+        self.assertEqual(("failed", 2), (state.rows[0].status, state.rows[0].attempts))
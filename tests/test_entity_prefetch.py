@@ -0,0 +1,136 @@
+"""
+Created on 2026-10-18
+
+@author: wf
+"""
+
+import json
+import time
+from urllib.parse import parse_qs, urlparse
+
+from ngwidgets.basetest import Basetest
+from wikibaseintegrator.wbi_exceptions import MWApiError
+
+from onlinespreadsheet.entity_prefetch import EntityCache, EntityPrefetcher
+from onlinespreadsheet.restsession import RestSession
+from tests.fake_endpoints import FakeHandler, FakeHttpServer
+
+
+class EntityHandler(FakeHandler):
+    """
+    minimal wbgetentities API - Q0 is missing and reads with maxlag fail
+    as if the replicas were lagging
+    """
+
+    def do_GET(self):
+        params = parse_qs(urlparse(self.path).query)
+        ids = params["ids"][0].split("|")
+        if "maxlag" in params:
+            error = {
+                "error": {"code": "maxlag", "info": "Waiting for all: 1 seconds lagged"}
+            }
+            self.send_body(json.dumps(error).encode())
+            return
+        with self.fake.track(ids, delay=0.02):
+            entities = {}
+            for qid in ids:
+                if qid == "Q0":
+                    entities[qid] = {"id": qid, "missing": ""}
+                else:
+                    entities[qid] = {
+                        "id": qid,
+                        "type": "item",
+                        "lastrevid": 1000 + int(qid[1:]),
+                        "labels": {"en": {"language": "en", "value": f"item {qid}"}},
+                        "claims": {},
+                    }
+            body = json.dumps({"entities": entities}).encode()
+        self.send_body(body)
+
+
+class TestEntityPrefetch(Basetest):
+    """
+    test prefetching wikidata entities in batches
+    """
+
+    def setUp(self, debug=False, profile=True):
+        Basetest.setUp(self, debug=debug, profile=profile)
+        self.server = FakeHttpServer(EntityHandler)
+        self.api_url = f"{self.server.base_url}/w/api.php"
+
+    def tearDown(self):
+        self.server.close()
+        Basetest.tearDown(self)
+
+    def testPrefetch(self):
+        """
+        test fetching the entities of a sheet in batches of 50
+        """
+        session = RestSession()
+        prefetcher = EntityPrefetcher(self.api_url, session=session, max_workers=3)
+        values = [f"Q{i}" for i in range(230)]
+        values += ["http://www.wikidata.org/entity/Q5", "", None, "no item"]
+        fetched = prefetcher.prefetch(values)
+        self.assertEqual(229, fetched)
+        self.assertEqual(
+            [30, 50, 50, 50, 50], sorted(len(ids) for ids in self.server.requests)
+        )
+        self.assertTrue(1 < self.server.max_active <= 3)
+        self.assertEqual(
+            "item Q42", prefetcher.cache.get("Q42")["labels"]["en"]["value"]
+        )
+        self.assertEqual(1042, prefetcher.cache.get("Q42", 1042)["lastrevid"])
+        self.assertIsNone(prefetcher.cache.get("Q42", 1041))
+        # cached entities are not fetched again
+        prefetcher.cache.invalidate("Q42")
+        self.assertEqual(1, prefetcher.prefetch(values))
+        self.assertEqual(["Q0", "Q42"], self.server.requests[-1])
+        session.close()
+
+    def testLRU(self):
+        """
+        test evicting the least recently used entities
+        """
+        cache = EntityCache(max_entries=2)
+        for i in range(1, 4):
+            cache.put({"id": f"Q{i}", "lastrevid": i})
+            cache.get("Q1")
+        self.assertIn("Q1", cache)
+        self.assertNotIn("Q2", cache)
+        self.assertIn("Q3", cache)
+        # a new revision replaces the least recently used old revision
+        cache.put({"id": "Q3", "lastrevid": 4})
+        self.assertEqual(4, cache.get("Q3")["lastrevid"])
+        self.assertIsNone(cache.get("Q3", 3))
+        self.assertIn("Q1", cache)
+
+    def testErrorPayload(self):
+        """
+        test that an API error returned with status 200 is recorded as error
+        """
+        session = RestSession()
+        prefetcher = EntityPrefetcher(self.api_url, session=session, maxlag=5)
+        self.assertEqual(0, prefetcher.prefetch(["Q1", "Q2"]))
+        session.close()
+        self.assertEqual(1, len(prefetcher.errors))
+        error = prefetcher.errors[0]
+        self.assertIsInstance(error, MWApiError)
+        self.assertEqual("maxlag", error.code)
+        self.assertEqual(0, len(prefetcher.cache))
+
+    def testTTL(self):
+        """
+        test that the latest known revision expires after the time to live
+        """
+        cache = EntityCache(ttl=0.05)
+        cache.put({"id": "Q1", "lastrevid": 7})
+        self.assertIn("Q1", cache)
+        self.assertEqual(7, cache.get("Q1")["lastrevid"])
+        time.sleep(0.1)
+        self.assertNotIn("Q1", cache)
+        self.assertIsNone(cache.get("Q1"))
+        # a given revision does not change
+        self.assertEqual(7, cache.get("Q1", 7)["lastrevid"])
+        # fetching the item again renews the time to live
+        cache.put({"id": "Q1", "lastrevid": 7})
+        self.assertEqual(7, cache.get("Q1")["lastrevid"])
@@ -0,0 +1,637 @@
+"""
+Created on 2026-10-18
+
+@author: wf
+"""
+
+import asyncio
+import json
+import queue
+import re
+import threading
+import time
+from types import SimpleNamespace
+from unittest.mock import patch
+from urllib.parse import parse_qs
+
+from ez_wikidata.wbquery import WikibaseQuery
+from lodstorage.sparql import SPARQL
+from ngwidgets.basetest import Basetest
+
+from onlinespreadsheet.bulk_write import BulkWriteRow
+from onlinespreadsheet.lod_delta import LodDelta
+from onlinespreadsheet.lod_view import LodView
+from onlinespreadsheet.record_sync import ComparisonRecord, PropertySchema, SyncStatus
+from onlinespreadsheet.wdgrid import GridSync, PropertyDispatch, WikidataGrid
+from tests.fake_endpoints import FakeHandler, FakeHttpServer
+
+
+class SparqlHandler(FakeHandler):
+    """
+    SPARQL endpoint returning one binding per value of the VALUES clause
+    """
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        params = parse_qs(self.rfile.read(length).decode())
+        query = params["query"][0]
+        with self.fake.track(query, delay=0.05):
+            values = re.findall(r"\( '([^']*)'@en \)", query)
+            bindings = [
+                {"short_name": {"type": "literal", "value": value}} for value in values
+            ]
+            body = json.dumps(
+                {"head": {"vars": ["short_name"]}, "results": {"bindings": bindings}}
+            ).encode()
+        self.send_body(body, content_type="application/sparql-results+json")
+
+
+class EventQuery:
+    """
+    minimal wikibase query for the short name of events
+    """
+
+    getValuesClause = WikibaseQuery.getValuesClause
+
+    def asSparql(self, filterClause: str, orderClause: str, pk: str) -> str:
+        return f"SELECT ?short_name WHERE {{ {filterClause} }} {orderClause}"
+
+
+class RecordingGrid:
+    """
+    ListOfDictsGrid stand-in recording the loads and grid method calls
+    """
+
+    def __init__(self):
+        self.options = {}
+        self.lod = None
+        self.calls = []
+        self.ag_grid = SimpleNamespace(
+            run_grid_method=lambda name, args: self.calls.append((name, args))
+        )
+
+    def load_lod(self, lod: list):
+        self.lod = lod
+        self.calls.append(("load_lod", dict(self.options)))
+
+
+class TestGridSync(Basetest):
+    """
+    test syncing the grid with wikibase query results
+    """
+
+    def setUp(self, debug=False, profile=True):
+        Basetest.setUp(self, debug=debug, profile=profile)
+        self.server = FakeHttpServer(SparqlHandler)
+        self.url = f"{self.server.base_url}/sparql"
+
+    def tearDown(self):
+        self.server.close()
+        Basetest.tearDown(self)
+
+    def testBatchedQuery(self):
+        """
+        test querying the primary keys in concurrent batches
+        """
+        gridSync = GridSync(
+            SimpleNamespace(solution=None, lodRowIndex_column="lodRowIndex"),
+            entityName="Event",
+            pk="short_name",
+            sparql=SPARQL(self.url),
+            batchSize=10,
+            maxWorkers=3,
+        )
+        gridSync.wbQuery = EventQuery()
+        keys = [f"Event {i:03d}" for i in range(95)]
+        gridSync.itemsByPk = {key: {"short_name": key} for key in keys}
+        gridSync.pkProp = "short_name"
+        gridSync.pkType = "text"
+        progress = []
+        gridSync.progress_callback = lambda done, total: progress.append(
+            f"batch {done}/{total}"
+        )
+        gridSync.query(gridSync.sparql)
+        self.assertEqual(10, len(self.server.requests))
+        self.assertTrue(1 < self.server.max_active <= 3)
+        self.assertEqual([f"batch {i}/10" for i in range(1, 11)], progress)
+        self.assertEqual(keys, [row["short_name"] for row in gridSync.wbRows])
+
+    def testCopySparql(self):
+        """
+        test that the SPARQL endpoint copies of the workers keep all settings
+        """
+        for isFuseki in [False, True]:
+            with self.subTest(isFuseki=isFuseki):
+                sparql = SPARQL(
+                    self.url,
+                    isFuseki=isFuseki,
+                    typedLiterals=True,
+                    agent="grid sync test",
+                    method="GET",
+                    calls_per_minute=30,
+                )
+                endpoint = GridSync.copySparql(sparql)
+                self.assertIsNot(sparql.sparql, endpoint.sparql)
+                self.assertEqual(sparql.url, endpoint.url)
+                self.assertEqual(sparql.sparql.endpoint, endpoint.sparql.endpoint)
+                self.assertEqual("grid sync test", endpoint.sparql.agent)
+                self.assertTrue(endpoint.typedLiterals)
+                self.assertEqual("GET", endpoint.method)
+                self.assertEqual(30, endpoint.rate_limiter.calls_per_minute)
+
+    def testCheckWikidata(self):
+        """
+        test that the check queries in a worker thread and not on the event loop
+        """
+        errors = []
+        pushed = []
+        wdgrid = SimpleNamespace(
+            solution=None,
+            lodRowIndex_column="lodRowIndex",
+            viewLod=[],
+            pushViewChanges=lambda: pushed.append(True),
+        )
+        gridSync = GridSync(
+            wdgrid, entityName="Event", pk="short_name", sparql=SPARQL(self.url)
+        )
+        gridSync.app = SimpleNamespace(
+            clearErrors=lambda: None, handleException=errors.append
+        )
+        gridSync.wbQuery = EventQuery()
+        keys = [f"Event {i:03d}" for i in range(5)]
+        gridSync.loadItems = lambda: None
+        gridSync.itemsByPk = {key: {"short_name": key} for key in keys}
+        gridSync.pkProp = "short_name"
+        gridSync.pkType = "text"
+        gridSync.addHtmlMarkupToViewLod = lambda viewLod: None
+        threads = []
+        query = gridSync.query
+
+        def recording_query(sparql: SPARQL):
+            threads.append(threading.current_thread())
+            query(sparql)
+
+        gridSync.query = recording_query
+        # the progress is shown on the loop from the queue of the worker
+        progress = []
+
+        def recording_progress(progressQueue: queue.Queue):
+            while not progressQueue.empty():
+                progress.append(progressQueue.get_nowait())
+
+        gridSync.showQueryProgress = recording_progress
+        asyncio.run(gridSync.onCheckWikidata())
+        self.assertEqual([(1, 1)], progress)
+        self.assertEqual([], errors)
+        self.assertIsNot(threading.main_thread(), threads[0])
+        self.assertEqual(keys, [row["short_name"] for row in gridSync.wbRows])
+        self.assertEqual([True], pushed)
+        self.assertIsNone(gridSync.progress_callback)
+
+    def testIncrementalQuery(self):
+        """
+        test that only changed rows and expired results are queried again
+        """
+        gridSync = GridSync(
+            SimpleNamespace(solution=None, lodRowIndex_column="lodRowIndex"),
+            entityName="Event",
+            pk="short_name",
+            sparql=SPARQL(self.url),
+            batchSize=10,
+        )
+        gridSync.wbQuery = EventQuery()
+        rows = [
+            {"lodRowIndex": i, "short_name": f"Event {i:03d}", "year": 2000}
+            for i in range(50)
+        ]
+        gridSync.itemsByPk = {row["short_name"]: row for row in rows}
+        gridSync.pkProp = "short_name"
+        gridSync.pkType = "text"
+        gridSync.query(gridSync.sparql)
+        self.assertEqual(5, len(self.server.requests))
+        self.assertEqual(50, len(gridSync.wbRows))
+        # unchanged rows are not queried again
+        gridSync.query(gridSync.sparql)
+        self.assertEqual(5, len(self.server.requests))
+        self.assertEqual([], gridSync.sparqlQueries)
+        self.assertEqual(50, len(gridSync.wbRows))
+        # three edited rows need a single query
+        for row in rows[10:13]:
+            row["year"] = 2001
+        gridSync.query(gridSync.sparql)
+        self.assertEqual(6, len(self.server.requests))
+        self.assertIn("'Event 011'@en", gridSync.sparqlQueries[0])
+        self.assertNotIn("'Event 013'@en", gridSync.sparqlQueries[0])
+        self.assertEqual(
+            [row["short_name"] for row in rows],
+            [wbRow["short_name"] for wbRow in gridSync.wbRows],
+        )
+        # expired results are queried again
+        gridSync.ttl = 0
+        time.sleep(0.01)
+        gridSync.query(gridSync.sparql)
+        self.assertEqual(11, len(self.server.requests))
+
+    def testRowTransactions(self):
+        """
+        test the row transactions pushed to the grid
+        """
+        wdgrid = WikidataGrid.__new__(WikidataGrid)
+        wdgrid.solution = None
+        wdgrid.lodRowIndex_column = "lodRowIndex"
+        wdgrid.paging = False
+        wdgrid.debug = False
+        # the row selection handling needs a browser
+        wdgrid.refreshGridSettings = lambda: None
+        wdgrid.agGrid = RecordingGrid()
+        wdgrid.setLod([{"name": f"E{i}", "year": None} for i in range(5)])
+        wdgrid.reloadAgGrid(wdgrid.viewLod)
+        # the row id is set before the rows are loaded
+        name, options = wdgrid.agGrid.calls[0]
+        self.assertEqual("load_lod", name)
+        self.assertEqual(
+            "(params) => String(params.data.lodRowIndex)", options[":getRowId"]
+        )
+        wdgrid.agGrid.calls.clear()
+        wdgrid.applyCellTransaction(3, "year", 2024)
+        wdgrid.viewLod[1]["year"] = 2025
+        wdgrid.viewLod[4]["name"] = "E4'"
+        wdgrid.pushViewChanges()
+        wdgrid.pushViewChanges()
+        newRows = [dict(row, lodRowIndex=None) for row in wdgrid.lod]
+        newRows[0]["year"] = 2000
+        newRows.append({"name": "E5", "year": 2026})
+        delta = LodDelta.of(wdgrid.lod, newRows, "name", exclude=["lodRowIndex"])
+        self.assertTrue(wdgrid.applyDelta(delta))
+        self.assertEqual(
+            [
+                (
+                    "applyTransaction",
+                    {"update": [{"name": "E3", "year": 2024, "lodRowIndex": 3}]},
+                ),
+                (
+                    "applyTransaction",
+                    {
+                        "update": [
+                            {"name": "E1", "year": 2025, "lodRowIndex": 1},
+                            {"name": "E4'", "year": "-", "lodRowIndex": 4},
+                        ]
+                    },
+                ),
+                (
+                    "applyTransaction",
+                    {"add": [{"name": "E5", "year": 2026, "lodRowIndex": 5}]},
+                ),
+                (
+                    "applyTransaction",
+                    {"update": [{"name": "E0", "year": 2000, "lodRowIndex": 0}]},
+                ),
+            ],
+            wdgrid.agGrid.calls,
+        )
+        self.assertEqual(6, len(wdgrid.agGrid.lod))
+
+    def testPagingReload(self):
+        """
+        test reloading the grid in paging mode and answering its row requests
+        """
+        wdgrid = WikidataGrid.__new__(WikidataGrid)
+        wdgrid.solution = None
+        wdgrid.lodRowIndex_column = "lodRowIndex"
+        wdgrid.paging = True
+        wdgrid.blockSize = 2
+        wdgrid.rowRequestGridIds = set()
+        wdgrid.debug = False
+        wdgrid.onRowSelected = lambda msg: None
+        handlers = {}
+        updates = []
+        wdgrid.agGrid = SimpleNamespace(
+            on=lambda event, handler: handlers.update({event: handler}),
+            ag_grid=SimpleNamespace(
+                id=7, options={"rowData": []}, update=lambda: updates.append(True)
+            ),
+        )
+        wdgrid.agGrid.options = wdgrid.agGrid.ag_grid.options
+        wdgrid.setLod([{"name": f"E{i}", "year": 2020 + i} for i in range(5)])
+        with patch("onlinespreadsheet.wdgrid.ui") as ui:
+            wdgrid.reloadAgGrid(wdgrid.viewLod)
+            options = wdgrid.agGrid.options
+            self.assertEqual("infinite", options["rowModelType"])
+            self.assertEqual(2, options["cacheBlockSize"])
+            self.assertNotIn("rowData", options)
+            self.assertIn('emitEvent("getRows7"', options[":datasource"])
+            self.assertEqual(
+                ["name", "year", "lodRowIndex"],
+                [columnDef["field"] for columnDef in options["columnDefs"]],
+            )
+            self.assertEqual("agNumberColumnFilter", options["columnDefs"][1]["filter"])
+            self.assertTrue(options["columnDefs"][0]["checkboxSelection"])
+            self.assertEqual([True], updates)
+            ui.on.assert_called_once_with("getRows7", wdgrid.onGetRows)
+            # the browser asks for the second block sorted by descending year
+            wdgrid.onGetRows(
+                SimpleNamespace(
+                    args={
+                        "requestId": "r1",
+                        "startRow": 2,
+                        "endRow": 4,
+                        "sortModel": [{"colId": "year", "sort": "desc"}],
+                        "filterModel": {},
+                    }
+                )
+            )
+            script = ui.run_javascript.call_args.args[0]
+        self.assertIn('window.oseRowRequests["r1"]', script)
+        rows = [
+            {"name": "E2", "year": 2022, "lodRowIndex": 2},
+            {"name": "E1", "year": 2021, "lodRowIndex": 1},
+        ]
+        self.assertIn(f"params.successCallback({json.dumps(rows)}, 5);", script)
+
+    def testBulkWriteProgress(self):
+        """
+        test showing the progress of a bulk write job on the UI loop
+        """
+        wdgrid = WikidataGrid.__new__(WikidataGrid)
+        wdgrid.solution = None
+        wdgrid.lodRowIndex_column = "lodRowIndex"
+        wdgrid.paging = False
+        wdgrid.createLink = lambda url, text: f"<a href='{url}'>{text}</a>"
+        wdgrid.wd = SimpleNamespace()
+        wdgrid.agGrid = RecordingGrid()
+        wdgrid.setLod([{"label": f"E{i}", "item": None} for i in range(3)])
+        wdgrid.agGrid.lod = wdgrid.viewLod.to_lod()
+        gridSync = GridSync(
+            wdgrid, entityName="Event", pk="label", sparql=SPARQL(self.url)
+        )
+        gridSync.wbRowsByPk["E2"] = (None, 0, [])
+        progressQueue = queue.Queue()
+        progress = []
+        # the worker thread queues its progress
+        progressQueue.put((BulkWriteRow(row_index=1, pk="E1", status="failed"), 1, 2))
+        progressQueue.put(
+            (BulkWriteRow(row_index=2, pk="E2", status="done", qid="Q2"), 2, 2)
+        )
+        running = gridSync.showBulkWriteProgress(
+            SimpleNamespace(thread=None),
+            progressQueue,
+            lambda row, done, total: progress.append((row.row_index, done)),
+        )
+        self.assertFalse(running)
+        self.assertEqual([(1, 1), (2, 2)], progress)
+        self.assertNotIn("E2", gridSync.wbRowsByPk)
+        self.assertEqual(
+            [
+                (
+                    "applyTransaction",
+                    {
+                        "update": [
+                            {
+                                "label": "E2",
+                                "item": "<a href='https://www.wikidata.org/wiki/Q2'>E2</a>",
+                                "lodRowIndex": 2,
+                            }
+                        ]
+                    },
+                )
+            ],
+            wdgrid.agGrid.calls,
+        )
+
+    def testDelta(self):
+        """
+        test applying the changes of a new import to the grid and
+        checking only the changed rows
+        """
+        # the grid without its user interface
+        wdgrid = WikidataGrid.__new__(WikidataGrid)
+        wdgrid.solution = None
+        wdgrid.lodRowIndex_column = "lodRowIndex"
+        wdgrid.paging = False
+        transactions = []
+        rows = [{"short_name": f"Event {i:03d}", "year": 2000} for i in range(50)]
+        wdgrid.setLod(rows)
+        wdgrid.agGrid = SimpleNamespace(
+            lod=wdgrid.viewLod.to_lod(),
+            ag_grid=SimpleNamespace(
+                run_grid_method=lambda name, args: transactions.append(args)
+            ),
+        )
+        gridSync = GridSync(
+            wdgrid,
+            entityName="Event",
+            pk="short_name",
+            sparql=SPARQL(self.url),
+            batchSize=10,
+        )
+        gridSync.wbQuery = EventQuery()
+        gridSync.pkColumn = "short_name"
+        gridSync.pkProp = "short_name"
+        gridSync.pkType = "text"
+        gridSync.itemsByPk = wdgrid.getRowIndex("short_name")
+        gridSync.query(gridSync.sparql)
+        self.assertEqual(5, len(self.server.requests))
+        # the next import changes two rows and adds one
+        newRows = [
+            {"short_name": row["short_name"], "year": row["year"]} for row in rows
+        ]
+        newRows[3]["year"] = 2001
+        newRows[7]["year"] = 2001
+        newRows.append({"short_name": "Event 050", "year": 2002})
+        delta = LodDelta.of(wdgrid.lod, newRows, "short_name", exclude=["lodRowIndex"])
+        self.assertEqual(2, len(delta.modified))
+        self.assertTrue(wdgrid.applyDelta(delta))
+        self.assertEqual(51, len(wdgrid.lod))
+        self.assertEqual(2001, wdgrid.viewLod[3]["year"])
+        self.assertEqual(
+            50, wdgrid.getRowIndex("short_name")["Event 050"]["lodRowIndex"]
+        )
+        self.assertEqual(
+            [["Event 050"], ["Event 003", "Event 007"]],
+            [
+                [
+                    row["short_name"]
+                    for row in transaction.get("add", transaction.get("update", []))
+                ]
+                for transaction in transactions
+            ],
+        )
+        self.assertEqual(51, len(wdgrid.agGrid.lod))
+        # only the changed rows are checked
+        pkValues = gridSync.applyDelta(delta)
+        self.assertEqual(["Event 050", "Event 003", "Event 007"], pkValues)
+        gridSync.query(gridSync.sparql, pkValues=pkValues)
+        self.assertEqual(6, len(self.server.requests))
+        self.assertEqual(51, len(gridSync.wbRows))
+        # removed rows need a reload of the grid
+        removal = LodDelta.of(
+            wdgrid.lod, newRows[1:], "short_name", exclude=["lodRowIndex"]
+        )
+        self.assertFalse(wdgrid.applyDelta(removal))
+        gridSync.applyDelta(removal)
+        self.assertNotIn("Event 000", gridSync.wbRowsByPk)
+
+    def getSyntheticResult(self, rows: int = 10000, cols: int = 30):
+        """
+        get a synthetic wikibase query with a result of the given size
+        """
+        types = ["", "extid", "url", "string", "date"]
+        propertiesByVarname = {}
+        for col in range(cols):
+            varname = f"p{col}"
+            propertiesByVarname[varname] = {
+                "Column": f"column {col}",
+                "Type": types[col % len(types)],
+            }
+        wbQuery = SimpleNamespace(propertiesByVarname=propertiesByVarname)
+        wbRows = []
+        for row in range(rows):
+            wbRow = {
+                "item": f"http://www.wikidata.org/entity/Q{row}",
+                "itemLabel": f"item {row}",
+                "short_name": f"Event {row}",
+            }
+            for col, (varname, propRow) in enumerate(propertiesByVarname.items()):
+                propType = propRow["Type"]
+                if propType == "":
+                    wbRow[varname] = f"http://www.wikidata.org/entity/Q{col}"
+                    wbRow[f"{varname}Label"] = f"label {col}"
+                elif propType == "extid":
+                    wbRow[varname] = f"id{row}"
+                    wbRow[f"{varname}Url"] = f"https://example.org/id{row}"
+                elif propType == "url":
+                    wbRow[varname] = f"https://example.org/{row}/{col}"
+                else:
+                    wbRow[varname] = f"value {row}/{col}"
+            wbRows.append(wbRow)
+        return wbQuery, wbRows
+
+    def legacyCellValues(self, wbQuery, wbRow: dict) -> list:
+        """
+        the per cell handling before the dispatch table was introduced
+        """
+        cells = []
+        for propVarname, value in wbRow.items():
+            if propVarname in wbQuery.propertiesByVarname:
+                propRow = wbQuery.propertiesByVarname[propVarname]
+                column = propRow["Column"]
+                propType = propRow["Type"]
+                if not propType:
+                    propLabel = wbRow[f"{propVarname}Label"]
+                else:
+                    propLabel = ""
+                if propType == "extid":
+                    propUrl = wbRow[f"{propVarname}Url"]
+                elif propType == "url":
+                    propUrl = wbRow[f"{propVarname}"]
+                else:
+                    propUrl = ""
+                if (
+                    type(value) == str
+                    and value.startswith("http://www.wikidata.org/entity/")
+                    and f"{propVarname}Label" in wbRow
+                ):
+                    propUrl = value
+                    propLabel = wbRow[f"{propVarname}Label"]
+                    value = propLabel
+                cells.append((column, value, propLabel, propUrl))
+        return cells
+
+    def testPropertyTypes(self):
+        """
+        test the type aware comparison of the synced properties
+        """
+        gridSync = GridSync(
+            SimpleNamespace(solution=None),
+            entityName="Event",
+            pk="short_name",
+            sparql=SPARQL(self.url),
+        )
+        gridSync.wbQuery = SimpleNamespace(
+            propertiesByColumn={
+                "homepage": {"Type": "url"},
+                "country": {"Type": ""},
+                "start": {"Type": "date"},
+            }
+        )
+        propertyTypes = gridSync.getPropertyTypes()
+        self.assertEqual(
+            {
+                "homepage": "url",
+                "country": "item",
+                "start": "date",
+                "label": "text",
+                "description": "text",
+            },
+            propertyTypes,
+        )
+        cr = ComparisonRecord(
+            "sheet",
+            {"homepage": "https://example.org/", "label": " Event "},
+            "wikidata",
+            {"homepage": "https://example.org", "label": "Event"},
+            schema=PropertySchema(propertyTypes),
+            property_types=propertyTypes,
+        )
+        self.assertEqual(["homepage", "label"], list(cr.comparison_data.keys()))
+        for cd in cr.comparison_data.values():
+            self.assertEqual(SyncStatus.IN_SYNC, cd.get_sync_status())
+
+    def testPropertyDispatch(self):
+        """
+        benchmark the precompiled property dispatch on a 10k x 30 result
+        """
+        wbQuery, wbRows = self.getSyntheticResult()
+        start = time.time()
+        legacy = [self.legacyCellValues(wbQuery, wbRow) for wbRow in wbRows]
+        legacyTime = time.time() - start
+        start = time.time()
+        table = PropertyDispatch.compile(wbQuery)
+        compiled = []
+        for wbRow in wbRows:
+            cells = []
+            for propVarname, value in wbRow.items():
+                dispatch = table.get(propVarname, None)
+                if dispatch is not None:
+                    cells.append((dispatch.column, *dispatch.handler(wbRow, value)))
+            compiled.append(cells)
+        compiledTime = time.time() - start
+        self.assertEqual(legacy, compiled)
+        if self.debug:
+            print(f"legacy: {legacyTime:.3f}s dispatch: {compiledTime:.3f}s")
+        # mark up a grid with the complete result
+        lod = [
+            {
+                "lodRowIndex": index,
+                "short_name": f"Event {index}",
+                "item": "",
+                "description": "",
+            }
+            for index in range(len(wbRows))
+        ]
+        for row in lod:
+            for propRow in wbQuery.propertiesByVarname.values():
+                row[propRow["Column"]] = ""
+        wdgrid = SimpleNamespace(
+            solution=None,
+            lodRowIndex_column="lodRowIndex",
+            createLink=lambda url, text: f"<a href='{url}'>{text}</a>",
+        )
+        gridSync = GridSync(
+            wdgrid, entityName="Event", pk="short_name", sparql=SPARQL(self.url)
+        )
+        gridSync.wbQuery = wbQuery
+        gridSync.pkProp = "short_name"
+        gridSync.itemsByPk = {row["short_name"]: row for row in lod}
+        gridSync.wbRows = wbRows
+        viewLod = LodView(lod)
+        start = time.time()
+        gridSync.addHtmlMarkupToViewLod(viewLod)
+        markupTime = time.time() - start
+        if self.debug:
+            print(f"markup of {len(wbRows)} rows: {markupTime:.3f}s")
+        row = viewLod[7]
+        self.assertIn(">label 0</a>", row["column 0"])
+        self.assertEqual("<a href='https://example.org/id7'>id7</a>", row["column 1"])
+        self.assertEqual("value 7/3", row["column 3"])
+        self.assertIs(gridSync.getDispatchTable(), gridSync.getDispatchTable())
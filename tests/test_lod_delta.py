@@ -0,0 +1,94 @@
+"""
+Created on 2026-10-18
+
+@author: wf
+"""
+
+import time
+
+from ngwidgets.basetest import Basetest
+
+from onlinespreadsheet.lod_delta import LodDelta, lod_hash, row_hash
+
+
+class TestLodDelta(Basetest):
+    """
+    test row level changes between imports
+    """
+
+    def testRowHash(self):
+        """
+        test that the hash does not depend on the column order
+        """
+        self.assertEqual(
+            row_hash({"a": 1, "b": 2}),
+            row_hash({"b": 2, "a": 1, "i": 7}, exclude=["i"]),
+        )
+        self.assertNotEqual(
+            lod_hash([{"a": 1}, {"a": 2}]), lod_hash([{"a": 2}, {"a": 1}])
+        )
+
+    def testDelta(self):
+        """
+        test added, removed and modified rows
+        """
+        old = [
+            {"short_name": "E1", "year": 2020},
+            {"short_name": "E2", "year": 2021},
+            {"short_name": "E3", "year": 2022},
+            {"short_name": "", "year": 1999},
+        ]
+        new = [
+            {"short_name": "E3", "year": 2022},
+            {"short_name": "E2", "year": 2023},
+            {"short_name": "E4", "year": 2024},
+            {"short_name": "", "year": 1999},
+        ]
+        delta = LodDelta.of(old, new, "short_name")
+        self.assertEqual([new[2]], delta.added)
+        self.assertEqual([old[0]], delta.removed)
+        self.assertEqual([(old[1], new[1])], delta.modified)
+        self.assertEqual(2, delta.unchanged)
+        self.assertEqual(["E4", "E2"], delta.changed_keys())
+        self.assertEqual("1 added, 1 removed, 1 modified, 2 unchanged", str(delta))
+        applied = delta.apply(old)
+        self.assertEqual([new[1], old[2], old[3], new[2]], applied)
+        # the next import is compared with the hashes of this one
+        again = LodDelta.of(
+            applied, [dict(row) for row in new], "short_name", old_hashes=delta.hashes
+        )
+        self.assertTrue(again.is_empty())
+        self.assertEqual(4, again.unchanged)
+
+    def testDuplicateKeys(self):
+        """
+        test that rows with duplicate keys are matched by their content
+        """
+        old = [{"pk": "A", "v": 1}, {"pk": "A", "v": 2}]
+        new = [{"pk": "A", "v": 1}, {"pk": "A", "v": 3}]
+        delta = LodDelta.of(old, new, "pk")
+        self.assertEqual([new[1]], delta.added)
+        self.assertEqual([old[1]], delta.removed)
+        self.assertEqual([], delta.modified)
+
+    def testLargeDelta(self):
+        """
+        test the delta of a 100k row import with 1% changes
+        """
+        rows = 100000
+        old = [
+            {"pk": f"E{i}", "year": 2000 + i % 25, "title": f"Event {i}"}
+            for i in range(rows)
+        ]
+        first = LodDelta.of([], old, "pk")
+        self.assertEqual(rows, len(first.added))
+        new = [dict(row) for row in old]
+        for i in range(0, rows, 100):
+            new[i]["year"] = 1900
+        start = time.time()
+        delta = LodDelta.of(old, new, "pk", old_hashes=first.hashes)
+        elapsed = time.time() - start
+        if self.debug:
+            print(f"delta of {rows} rows: {delta} in {elapsed:.3f}s")
+        self.assertEqual(rows // 100, len(delta.modified))
+        self.assertEqual(rows - rows // 100, delta.unchanged)
@@ -0,0 +1,143 @@
+"""
+Created on 2026-10-18
+
+@author: wf
+"""
+
+import datetime
+
+from ngwidgets.basetest import Basetest
+
+from onlinespreadsheet.lod_view import LodView, RowIndex
+
+
+class TestLodView(Basetest):
+    """
+    test the lazy copy-on-write view of a list of dicts
+    """
+
+    def testLodView(self):
+        """
+        test converting values on access and keeping modifications as overrides
+        """
+        timestamp = datetime.datetime(2024, 1, 1, 12, 0)
+        lod = [
+            {"item": "Q1", "label": "one", "date": timestamp},
+            {"item": None, "label": "two", "date": None},
+        ]
+        view = LodView(lod)
+        self.assertEqual(2, len(view))
+        self.assertEqual("2024-01-01 12:00:00", view[0]["date"])
+        self.assertEqual("-", view[1]["item"])
+        self.assertEqual([{"item": "-", "label": "two", "date": "-"}], view[1:2])
+        view[1]["item"] = "<a href='#'>new</a>"
+        view[0]["extra"] = "added"
+        # the source stays untouched
+        self.assertIsNone(lod[1]["item"])
+        self.assertNotIn("extra", lod[0])
+        self.assertEqual("<a href='#'>new</a>", view[1]["item"])
+        self.assertEqual(["item", "label", "date", "extra"], list(view[0]))
+        self.assertEqual(
+            [
+                {
+                    "item": "Q1",
+                    "label": "one",
+                    "date": "2024-01-01 12:00:00",
+                    "extra": "added",
+                },
+                {"item": "<a href='#'>new</a>", "label": "two", "date": "-"},
+            ],
+            view.to_lod(),
+        )
+        self.assertEqual([0, 1], view.pop_dirty())
+        self.assertEqual([], view.pop_dirty())
+        del view[1]["item"]
+        self.assertEqual("-", view[1]["item"])
+        self.assertEqual([1], view.pop_dirty())
+        with self.assertRaises(KeyError):
+            view[1]["missing"]
+        self.assertIsNone(view[1].get("missing"))
+
+    def testRowIndex(self):
+        """
+        test the row index maintained on inserts and updates
+        """
+        lod = [
+            {"lodRowIndex": 0, "pk": "Q1"},
+            {"lodRowIndex": 1, "pk": "Q2"},
+            {"lodRowIndex": 2, "pk": "Q1"},
+        ]
+        byIndex = RowIndex(lod, "lodRowIndex")
+        self.assertTrue(byIndex.is_unique)
+        byPk = RowIndex(lod, "pk")
+        self.assertFalse(byPk.is_unique)
+        self.assertIs(lod[0], byPk["Q1"])
+        self.assertEqual(["Q1", "Q2"], list(byPk.keys()))
+        # removing the first row promotes the duplicate
+        byPk.remove(lod[0])
+        self.assertIs(lod[2], byPk["Q1"])
+        lod[0]["pk"] = "Q3"
+        byPk.add(lod[0])
+        self.assertTrue(byPk.is_unique)
+        row = {"lodRowIndex": 3}
+        byPk.add(row)
+        self.assertFalse(byPk.is_unique)
+        self.assertNotIn(None, byPk)
+        self.assertEqual(3, len(byPk))
+
+    def testGetBlock(self):
+        """
+        test getting sorted and filtered blocks of rows
+        """
+        lod = [
+            {"lodRowIndex": i, "label": f"item {i}", "count": i % 7}
+            for i in range(1000)
+        ]
+        lod[3]["count"] = None
+        view = LodView(lod)
+        rows, total = view.get_block(0, 10)
+        self.assertEqual(1000, total)
+        self.assertEqual(list(range(10)), [row["lodRowIndex"] for row in rows])
+        sort_model = [
+            {"colId": "count", "sort": "desc"},
+            {"colId": "label", "sort": "asc"},
+        ]
+        rows, total = view.get_block(0, 3, sort_model=sort_model)
+        self.assertEqual(
+            ["item 104", "item 111", "item 118"], [row["label"] for row in rows]
+        )
+        # the non value sorts last in descending order
+        rows, _total = view.get_block(999, 1100, sort_model=sort_model)
+        self.assertEqual("-", rows[0]["count"])
+        filter_model = {
+            "label": {"filterType": "text", "type": "contains", "filter": "ITEM 9"},
+            "count": {
+                "filterType": "number",
+                "type": "inRange",
+                "filter": 2,
+                "filterTo": 3,
+            },
+        }
+        rows, total = view.get_block(0, 100, filter_model=filter_model)
+        self.assertEqual(31, total)
+        self.assertTrue(all(row["count"] in (2, 3) for row in rows))
+        # overrides take part in filtering
+        view[9]["label"] = "renamed"
+        rows, total = view.get_block(
+            0,
+            100,
+            filter_model={
+                "label": {"filterType": "text", "type": "startsWith", "filter": "ren"}
+            },
+        )
+        self.assertEqual(1, total)
+        self.assertEqual(9, rows[0]["lodRowIndex"])
+        # unsupported filter types and incomplete conditions do not filter
+        for condition in [
+            {"filterType": "set", "values": ["item 1"]},
+            {"filterType": "text", "type": "regex", "filter": "item"},
+            {"filterType": "number", "type": "inRange", "filter": 2},
+        ]:
+            with self.subTest(condition=condition):
+                rows, total = view.get_block(0, 10, filter_model={"count": condition})
+                self.assertEqual(1000, total)
@@ -0,0 +1,289 @@
+"""
+Created on 2026-10-18
+
+@author: wf
+"""
+
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import requests
+from ez_wikidata.wbquery import WikibaseQuery
+from ez_wikidata.wdproperty import WikidataPropertyManager
+from ez_wikidata.wikidata import Wikidata
+from lodstorage.sparql import SPARQL
+from ngwidgets.basetest import Basetest
+
+from onlinespreadsheet.entity_prefetch import EntityPrefetcher
+from onlinespreadsheet.lod_view import LodView
+from onlinespreadsheet.record_sync import SyncStatus
+from onlinespreadsheet.restsession import RestSession
+from onlinespreadsheet.wdgrid import GridSync
+from tests.mock_wikibase import MockWikibase
+
+
+class EventQuery:
+    """
+    wikibase query for events by their short name
+    """
+
+    getValuesClause = WikibaseQuery.getValuesClause
+
+    def __init__(self):
+        self.propertiesByVarname = {
+            "short_name": {"Column": "short_name", "Type": "text"},
+            "start_time": {"Column": "start_time", "Type": "date"},
+        }
+        # the mapping rows as read from the mapping sheet
+        self.propertiesByColumn = {
+            "short_name": {
+                "Column": "short_name",
+                "PropertyName": "short name",
+                "PropertyId": "P1813",
+                "Type": "text",
+            },
+            "start_time": {
+                "Column": "start_time",
+                "PropertyName": "start time",
+                "PropertyId": "P580",
+                "Type": "date",
+            },
+        }
+        self.propertiesById = {
+            row["PropertyId"]: row for row in self.propertiesByColumn.values()
+        }
+
+    def asSparql(self, filterClause: str, orderClause: str, pk: str) -> str:
+        return f"""PREFIX wd: <http://www.wikidata.org/entity/>
+PREFIX wdt: <http://www.wikidata.org/prop/direct/>
+PREFIX schema: <http://schema.org/>
+PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
+SELECT ?item ?itemLabel ?itemDescription ?short_name ?start_time
+WHERE {{
+  ?item rdfs:label ?itemLabel. FILTER(LANG(?itemLabel) = "en")
+  OPTIONAL {{ ?item schema:description ?itemDescription. }}
+  ?item wdt:P1813 ?short_name.
+  OPTIONAL {{ ?item wdt:P580 ?start_time. }}
+  {filterClause}
+}}
+{orderClause}"""
+
+
+class TestMockWikibase(Basetest):
+    """
+    test the local stand-in wikibase and benchmark the GridSync hot paths with it
+
+    set OSE_BENCHMARK_ROWS e.g. to 10000 or 100000 for bigger sheets
+    """
+
+    def setUp(self, debug=False, profile=True):
+        Basetest.setUp(self, debug=debug, profile=profile)
+
+    def testApi(self):
+        """
+        test the SPARQL endpoint and the wbgetentities / wbeditentity API
+        """
+        with MockWikibase(MockWikibase.synthetic_entities(3)) as wikibase:
+            sparql = SPARQL(wikibase.sparql_url)
+            query = EventQuery().asSparql(
+                filterClause="VALUES(?short_name) { ('EV2'@en) }",
+                orderClause="",
+                pk="short_name",
+            )
+            rows = sparql.queryAsListOfDicts(query)
+            self.assertEqual(1, len(rows))
+            self.assertEqual("http://www.wikidata.org/entity/Q2", rows[0]["item"])
+            self.assertEqual("Event 2", rows[0]["itemLabel"])
+            prefetcher = EntityPrefetcher(wikibase.api_url, session=RestSession())
+            self.assertEqual(3, prefetcher.prefetch(["Q1", "Q2", "Q3", "Q4"]))
+            data = {
+                "labels": {"en": {"language": "en", "value": "Event 4"}},
+                "claims": [MockWikibase.claim("P1813", "monolingualtext", "EV4")],
+            }
+            response = requests.post(
+                wikibase.api_url,
+                data={
+                    "action": "wbeditentity",
+                    "new": "item",
+                    "data": json.dumps(data),
+                },
+            )
+            entity = response.json()["entity"]
+            self.assertEqual("Q4", entity["id"])
+            self.assertEqual(1, entity["lastrevid"])
+            rows = sparql.queryAsListOfDicts(query.replace("EV2", "EV4"))
+            self.assertEqual("Event 4", rows[0]["itemLabel"])
+            self.assertEqual(2, wikibase.requests["/sparql"])
+
+    def testCheckBenchmark(self):
+        """
+        benchmark checking and preparing the sync of a sheet against the stand-in
+        """
+        rows = int(os.getenv("OSE_BENCHMARK_ROWS", "1000"))
+        entities = MockWikibase.synthetic_entities(rows)
+        lod = [
+            {
+                "lodRowIndex": index,
+                "item": "",
+                "description": "",
+                "short_name": f"EV{index + 1}",
+                "start_time": "",
+            }
+            for index in range(rows)
+        ]
+        with MockWikibase(entities, latency=0.01) as wikibase:
+            wdgrid = SimpleNamespace(
+                solution=None,
+                lod=lod,
+                lodRowIndex_column="lodRowIndex",
+                createLink=lambda url, text: f"<a href='{url}'>{text}</a>",
+            )
+            gridSync = GridSync(
+                wdgrid,
+                entityName="Event",
+                pk="short_name",
+                sparql=SPARQL(wikibase.sparql_url),
+                batchSize=50,
+            )
+            gridSync.wbQuery = EventQuery()
+            gridSync.pkColumn, gridSync.pkType, gridSync.pkProp = (
+                "short_name",
+                "text",
+                "short_name",
+            )
+            gridSync.itemsByPk = {row["short_name"]: row for row in lod}
+            start = time.time()
+            gridSync.query(gridSync.sparql)
+            queryTime = time.time() - start
+            self.assertEqual(rows, len(gridSync.wbRows))
+            viewLod = LodView(lod)
+            start = time.time()
+            gridSync.addHtmlMarkupToViewLod(viewLod)
+            markupTime = time.time() - start
+            self.assertIn("Event 1", viewLod[0]["item"])
+            prefetcher = EntityPrefetcher(wikibase.api_url, session=RestSession())
+            start = time.time()
+            prefetcher.prefetch(f"Q{index + 1}" for index in range(rows))
+            prefetchTime = time.time() - start
+            self.assertEqual(rows, len(prefetcher.cache))
+            # a re-check without changes does not query again
+            gridSync.query(gridSync.sparql)
+            self.assertEqual(-(-rows // 50), wikibase.requests["/sparql"])
+        if self.debug:
+            for name, seconds in [
+                ("query", queryTime),
+                ("markup", markupTime),
+                ("prefetch", prefetchTime),
+            ]:
+                print(
+                    f"{name} of {rows} rows: {seconds:.2f}s ({rows/seconds:.0f} rows/s)"
+                )
+
+    def testWriteBenchmark(self):
+        """
+        benchmark writing new rows with add_record_to_wikidata and with
+        a bulk write job and comparing the written rows with their items as
+        handle_row_selected does - via ez_wikidata and WikibaseIntegrator
+        against the wbeditentity and wbgetentities API of the stand-in
+        """
+        rows = int(os.getenv("OSE_BENCHMARK_ROWS", "1000")) // 10
+        lod = [
+            {
+                "lodRowIndex": index,
+                "item": "",
+                "label": f"Event {index + 1}",
+                "short_name": f"EV{index + 1}",
+            }
+            for index in range(2 * rows)
+        ]
+        with (
+            MockWikibase(MockWikibase.synthetic_entities(0), latency=0.01) as wikibase,
+            tempfile.TemporaryDirectory() as tmpdir,
+        ):
+            # the mapping has the property types - no property lookup needed
+            wd = Wikidata(
+                baseurl=wikibase.base_url,
+                wpm=WikidataPropertyManager(with_load=False),
+            )
+            wd.loginWithCredentials("Benchmark", "secret")
+            links = {}
+            wdgrid = SimpleNamespace(
+                source="Event",
+                solution=None,
+                lod=lod,
+                viewLod=LodView(lod),
+                lodRowIndex_column="lodRowIndex",
+                wd=wd,
+                createLink=lambda url, text: f"<a href='{url}'>{text}</a>",
+                applyCellTransaction=lambda row, col, value: links.update({row: value}),
+                pushViewChanges=lambda: None,
+            )
+            gridSync = GridSync(
+                wdgrid,
+                entityName="Event",
+                pk="short_name",
+                sparql=SPARQL(wikibase.sparql_url),
+                batchSize=50,
+            )
+            gridSync.wbQuery = EventQuery()
+            gridSync.pkColumn, gridSync.pkType, gridSync.pkProp = (
+                "short_name",
+                "text",
+                "short_name",
+            )
+            # rows selected one by one - written concurrently
+            start = time.time()
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                futures = [
+                    executor.submit(
+                        gridSync.add_record_to_wikidata, lod[index], index, True
+                    )
+                    for index in range(rows)
+                ]
+                for future in futures:
+                    future.result()
+            addTime = time.time() - start
+            self.assertEqual(rows, len(links))
+            # a bulk write job for the remaining rows
+            start = time.time()
+            writer = gridSync.bulk_add_records_to_wikidata(
+                list(range(rows, 2 * rows)),
+                write=True,
+                yaml_path=f"{tmpdir}/Event.yaml",
+                edits_per_minute=0,
+            )
+            writer.thread.join(timeout=60)
+            bulkTime = time.time() - start
+            self.assertEqual({"done"}, {row.status for row in writer.state.rows})
+            # every row got its own item
+            qids = {row.qid for row in writer.state.rows}
+            self.assertEqual(rows, len(qids))
+            items = [qid for qid in wikibase.entities if qid.startswith("Q")]
+            self.assertEqual(2 * rows, len(items))
+            # the written rows are found by the next check
+            gridSync.itemsByPk = {row["short_name"]: row for row in lod}
+            gridSync.query(gridSync.sparql)
+            self.assertEqual(2 * rows, len(gridSync.wbRows))
+            # compare the selected rows with their items
+            for row in writer.state.rows:
+                lod[row.row_index]["item"] = row.qid
+            start = time.time()
+            for index in range(rows, 2 * rows):
+                cr = gridSync.getComparisonRecord(lod[index], index)
+                for column in ["label", "short_name"]:
+                    status = cr.comparison_data[column].get_sync_status()
+                    self.assertEqual(SyncStatus.IN_SYNC, status, column)
+            compareTime = time.time() - start
+        if self.debug:
+            for name, seconds in [
+                ("add", addTime),
+                ("bulk write", bulkTime),
+                ("compare", compareTime),
+            ]:
+                print(
+                    f"{name} of {rows} rows: {seconds:.2f}s ({rows/seconds:.0f} rows/s)"
+                )
@@ -0,0 +1,132 @@
+"""
+Created on 2026-10-18
+
+@author: wf
+"""
+
+import datetime
+import json
+import sqlite3
+import tempfile
+import time
+from contextlib import closing
+from decimal import Decimal
+
+from lodstorage.query import Query
+from ngwidgets.basetest import Basetest
+
+from onlinespreadsheet.querycache import QueryCache
+from onlinespreadsheet.tablequery import TableQuery
+from tests.fake_endpoints import FakeEndpoint
+
+
+class TestQueryCache(Basetest):
+    """
+    test the persistent query result cache
+    """
+
+    def setUp(self, debug=False, profile=True):
+        Basetest.setUp(self, debug=debug, profile=profile)
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db_path = f"{self.tmpdir.name}/queryCache.db"
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+        Basetest.tearDown(self)
+
+    def testNormalizedKey(self):
+        """
+        test that whitespace differences map to the same key
+        """
+        key1 = QueryCache.get_key("sparql", "wd", "SELECT ?s\n  WHERE { ?s ?p ?o }")
+        key2 = QueryCache.get_key("SPARQL", "wd", " SELECT ?s WHERE {  ?s ?p ?o } ")
+        key3 = QueryCache.get_key("sparql", "other", "SELECT ?s WHERE { ?s ?p ?o }")
+        self.assertEqual(key1, key2)
+        self.assertNotEqual(key1, key3)
+        # whitespace inside of string literals is significant
+        for query1, query2 in [
+            ("SELECT ?s WHERE { ?s ?p 'a  b' }", "SELECT ?s WHERE { ?s ?p 'a b' }"),
+            ('SELECT * { ?s ?p "x\\"  y" }', 'SELECT * { ?s ?p "x\\" y" }'),
+            ("SELECT * { ?s ?p '''a\n  b''' }", "SELECT * { ?s ?p '''a\n b''' }"),
+        ]:
+            with self.subTest(query=query1):
+                self.assertNotEqual(
+                    QueryCache.get_key("sparql", "wd", query1),
+                    QueryCache.get_key("sparql", "wd", query2),
+                )
+        self.assertEqual(
+            "SELECT ?s WHERE { ?s ?p 'a  b' . }",
+            QueryCache.normalize("SELECT ?s\n WHERE {\t?s ?p 'a  b'  . }\n"),
+        )
+
+    def testJsonStorage(self):
+        """
+        test that the results are stored as JSON keeping dates and decimals
+        """
+        cache = QueryCache(self.db_path)
+        lod = [
+            {
+                "date": datetime.date(2026, 10, 18),
+                "modified": datetime.datetime(2026, 10, 18, 10, 30),
+                "amount": Decimal("1.50"),
+                "label": "x",
+                "count": 3,
+            }
+        ]
+        cache.put("sparql", "wd", "q", lod)
+        self.assertEqual(lod, cache.get("sparql", "wd", "q"))
+        with closing(sqlite3.connect(self.db_path)) as conn:
+            text = conn.execute("SELECT result FROM query_result").fetchone()[0]
+        self.assertEqual("x", json.loads(text)[0]["label"])
+        # keys that look like type tags are kept as they are
+        extended = [
+            {"$date": "2026-10-18", "$$id": 1, "nested": [{"$decimal": "1.5"}]},
+            {"date": {"$date": "2026-10-18"}, "$oid": "abc"},
+        ]
+        cache.put("mongo", "db", "q", extended)
+        self.assertEqual(extended, cache.get("mongo", "db", "q"))
+        # values that can not be stored are not silently converted
+        with self.assertRaises(TypeError):
+            cache.put("sparql", "wd", "q2", [{"value": {1, 2}}])
+        self.assertIsNone(cache.get("sparql", "wd", "q2"))
+
+    def testTTLAndEviction(self):
+        """
+        test expiry and least recently used eviction
+        """
+        cache = QueryCache(self.db_path, max_entries=2)
+        cache.put("sparql", "wd", "q1", [{"a": 1}])
+        self.assertEqual([{"a": 1}], cache.get("sparql", "wd", "q1"))
+        time.sleep(0.05)
+        self.assertIsNone(cache.get("sparql", "wd", "q1", ttl=0.01))
+        cache.put("sparql", "wd", "q2", [{"a": 2}])
+        # touch q1 so that q2 is the least recently used entry
+        cache.get("sparql", "wd", "q1")
+        cache.put("sparql", "wd", "q3", [{"a": 3}])
+        self.assertEqual(2, cache.size())
+        self.assertIsNone(cache.get("sparql", "wd", "q2"))
+        self.assertIsNotNone(cache.get("sparql", "wd", "q1"))
+
+    def testTableQueryCache(self):
+        """
+        test cached results being reused across TableQuery instances
+        """
+        endpoint = FakeEndpoint()
+        for forceRefresh, expected in [(False, 1), (False, 1), (True, 2)]:
+            tq = TableQuery(cache=QueryCache(self.db_path))
+            query = Query(name="counter", query="SELECT ?count WHERE {}")
+            query.endpoint = endpoint
+            tq.addQuery(query)
+            tq.fetchQueryResults(forceRefresh=forceRefresh)
+            self.assertEqual(expected, len(endpoint.requests))
+            self.assertEqual(expected, tq.tableEditing.lods["counter"][0]["count"])
+        # a result that can not be cached is still used
+        endpoint = FakeEndpoint(records=[{"values": {1, 2}}])
+        tq = TableQuery(cache=QueryCache(self.db_path))
+        query = Query(name="set", query="SELECT ?values WHERE {}")
+        query.endpoint = endpoint
+        tq.addQuery(query)
+        tq.fetchQueryResults()
+        self.assertEqual([{"values": {1, 2}}], tq.tableEditing.lods["set"])
+        self.assertEqual(1, len(tq.errors))
+        self.assertIn("set not cached", tq.errors[0])
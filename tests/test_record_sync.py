@@ -1,13 +1,33 @@
+import datetime
+import tracemalloc
+import typing
+from dataclasses import dataclass
+
 from ngwidgets.basetest import Basetest
 
 from onlinespreadsheet.record_sync import (
     ComparisonData,
+    ComparisonMatrix,
     ComparisonRecord,
+    PropertySchema,
     SyncAction,
     SyncStatus,
+    ValueNormalizer,
 )
 
 
+@dataclass
+class DictComparisonData:
+    """
+    the former dict based ComparisonData layout for memory comparison
+    """
+
+    property_name: str
+    left_value: typing.Any
+    right_value: typing.Any
+    chosen_sync_option: SyncAction = None
+
+
 class TestRecordSync(Basetest):
     """
     tests RecordSync
@@ -29,6 +49,18 @@ class TestRecordSync(Basetest):
                 expected, left_value, right_value = test_param
                 cd = ComparisonData("label", left_value, right_value)
                 self.assertEqual(expected, cd.get_sync_status())
+        # the status follows changes of the values
+        cd = ComparisonData("label", "world", "world")
+        self.assertEqual(SyncStatus.IN_SYNC, cd.get_sync_status())
+        cd.right_value = "Hello"
+        self.assertEqual(SyncStatus.OUT_SYNC, cd.get_sync_status())
+        cd.left_value = None
+        self.assertEqual(SyncStatus.SYNC_POSSIBLE, cd.get_sync_status())
+        # the codes are stable
+        for enum_class in (SyncStatus, SyncAction):
+            for code, member in enumerate(enum_class):
+                self.assertEqual(code, member.code)
+                self.assertIs(member, enum_class.of_code(code))
 
     def test_comparison_record_sync(self):
         """
@@ -84,3 +116,175 @@ class TestRecordSync(Basetest):
                 update_left, update_right = comparison_record.get_update_records()
                 self.assertDictEqual(expected_update_left, update_left)
                 self.assertDictEqual(expected_update_right, update_right)
+
+    def test_comparison_matrix(self):
+        """
+        tests the bulk comparison of two lists of records
+        """
+        left = [
+            {"id": "1", "name": "Alice", "email": "alice@example.com"},
+            {"id": "2", "name": "Bob", "email": None},
+            {"id": "3", "name": "Carol", "email": "carol@example.com"},
+        ]
+        right = [
+            {"id": "1", "name": "Alice", "email": "alice@example.com"},
+            {"id": "2", "name": "Bob", "email": "bob@example.com"},
+            {"id": "3", "name": "Karol"},
+            {"id": "4", "name": "Dave"},
+        ]
+        cm = ComparisonMatrix("left", left, "right", right, key="id")
+        self.assertEqual(["1", "2", "3", "4"], cm.keys)
+        self.assertEqual(["id", "name", "email"], cm.property_names)
+        self.assertEqual((4, 3), cm.status.shape)
+        self.assertEqual(["3"], cm.keys_with_status(SyncStatus.OUT_SYNC))
+        self.assertEqual(["2", "3", "4"], cm.keys_with_status(SyncStatus.SYNC_POSSIBLE))
+        update_left, update_right = cm.get_update_records()
+        self.assertEqual(
+            {"2": {"email": "bob@example.com"}, "4": {"id": "4", "name": "Dave"}},
+            update_left,
+        )
+        self.assertEqual({"3": {"email": "carol@example.com"}}, update_right)
+        # the matrix agrees with the per record comparison
+        for i, key in enumerate(cm.keys):
+            cr = cm.get_comparison_record(key)
+            for j, property_name in enumerate(cm.property_names):
+                cd = cr.comparison_data.get(
+                    property_name, ComparisonData(property_name, None, None)
+                )
+                with self.subTest(key=key, property_name=property_name):
+                    self.assertEqual(
+                        cd.get_sync_status(), SyncStatus.of_code(cm.status[i, j])
+                    )
+                    self.assertEqual(
+                        cd.suggested_sync_action(),
+                        SyncAction.of_code(cm.action[i, j]),
+                    )
+
+    def test_update_records_invalidation(self):
+        """
+        tests that cached update records follow changes of the chosen sync option
+        """
+        cr = ComparisonRecord("left", {"A": "1", "B": None}, "right", {"B": "2"})
+        self.assertEqual({"A": "1"}, cr.get_update_record_of("right"))
+        # modifying the returned record does not affect the cache
+        cr.get_update_record_of("right")["label"] = "modified"
+        self.assertEqual({"A": "1"}, cr.get_update_record_of("right"))
+        cr.comparison_data["B"].chosen_sync_option = SyncAction.RIGHT_SYNC
+        self.assertEqual({"A": "1", "B": None}, cr.get_update_record_of("right"))
+        self.assertEqual({}, cr.get_update_record_of("left"))
+        cr.comparison_data["B"].chosen_sync_option = None
+        self.assertEqual({"B": "2"}, cr.get_update_record_of("left"))
+        # as well as changes of the values
+        cr.comparison_data["A"].right_value = "1"
+        self.assertEqual({}, cr.get_update_record_of("right"))
+
+    def test_property_schema(self):
+        """
+        tests the property order and the shared property schema of ComparisonRecords
+        """
+        columns = [f"P{i}" for i in range(2000)]
+        left = {column: "x" for column in columns}
+        right = {"extra": "y", **{column: "x" for column in reversed(columns)}}
+        cr = ComparisonRecord("left", left, "right", right)
+        self.assertEqual(columns + ["extra"], list(cr.comparison_data.keys()))
+        schema = PropertySchema.of_records([left], [right])
+        self.assertEqual(tuple(columns + ["extra"]), schema.property_names)
+        for record in [{"P1": "a"}, {"extra": "c", "P1990": "b"}]:
+            cr = ComparisonRecord("left", record, "right", None, schema=schema)
+            # only the keys of the records in schema order
+            self.assertEqual(
+                sorted(record, key=schema.index.get), list(cr.comparison_data.keys())
+            )
+            _update_left, update_right = cr.get_update_records()
+            self.assertEqual(record, update_right)
+        # records not covered by the schema fall back to their own keys
+        cr = ComparisonRecord("left", {"other": 1}, "right", {}, schema=schema)
+        self.assertEqual(["other"], list(cr.comparison_data.keys()))
+
+    def test_value_normalizer(self):
+        """
+        tests the canonicalization of equivalent values
+        """
+        normalizer = ValueNormalizer()
+        test_params = [  # (left, right, prop_type, equal)
+            ("2024-01-01", datetime.datetime(2024, 1, 1), None, True),
+            ("2024-01-01T00:00:00Z", datetime.date(2024, 1, 1), "date", True),
+            ("2024-01-01", datetime.datetime(2024, 1, 1, 12, 30), None, False),
+            ("Alice ", "Alice", None, True),
+            ("Q42", "http://www.wikidata.org/entity/Q42", "itemid", True),
+            ("Q42", "https://www.wikidata.org/wiki/Q42", None, True),
+            ("Q42", "Q43", None, False),
+            ("https://example.org/", "https://example.org", "url", True),
+            (["Q1", "Q2"], ("Q1", "http://www.wikidata.org/entity/Q2"), None, True),
+            (["Q1"], "Q1", None, True),
+            (1, "1", None, True),
+        ]
+        for left, right, prop_type, equal in test_params:
+            with self.subTest(left=left, right=right, prop_type=prop_type):
+                left_key = normalizer.normalize(left, prop_type)
+                right_key = normalizer.normalize(right, prop_type)
+                self.assertEqual(equal, left_key == right_key)
+                # memoized keys are stable
+                self.assertEqual(left_key, normalizer.normalize(left, prop_type))
+        normalizer.register("extid", lambda value: str(value).strip().upper())
+        self.assertEqual("ABC", normalizer.normalize(" abc", "extid"))
+        # a changed value is compared again with the property type and normalizer
+        cr = ComparisonRecord(
+            "left",
+            {"id": "abc"},
+            "right",
+            {"id": "ABC"},
+            property_types={"id": "extid"},
+            normalizer=normalizer,
+        )
+        cd = cr.comparison_data["id"]
+        self.assertEqual(SyncStatus.IN_SYNC, cd.get_sync_status())
+        cd.left_value = " abc "
+        self.assertEqual(SyncStatus.IN_SYNC, cd.get_sync_status())
+        cd.left_value = "abd"
+        self.assertEqual(SyncStatus.OUT_SYNC, cd.get_sync_status())
+
+    def test_normalized_comparison(self):
+        """
+        tests comparisons based on the normalized values
+        """
+        left = [{"id": "1", "date": "2024-01-01", "items": ["Q1", "Q2"]}]
+        right = [
+            {
+                "id": "1",
+                "date": datetime.datetime(2024, 1, 1),
+                "items": ["http://www.wikidata.org/entity/Q1", "Q2"],
+            }
+        ]
+        cm = ComparisonMatrix("left", left, "right", right, key="id")
+        self.assertTrue((cm.status == SyncStatus.IN_SYNC.code).all())
+        cr = ComparisonRecord("left", left[0], "right", right[0])
+        for cd in cr.comparison_data.values():
+            self.assertEqual(SyncStatus.IN_SYNC, cd.get_sync_status())
+
+    def get_bytes_per_cell(self, cls, cells: int = 30000) -> float:
+        """
+        get the traced memory per compared cell for the given ComparisonData class
+        """
+        names = [f"P{i}" for i in range(30)]
+        values = [f"value {i}" for i in range(100)]
+        tracemalloc.start()
+        before, _peak = tracemalloc.get_traced_memory()
+        cds = [
+            cls(names[i % 30], values[i % 100], values[(i + 1) % 100])
+            for i in range(cells)
+        ]
+        after, _peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        bytes_per_cell = (after - before) / len(cds)
+        return bytes_per_cell
+
+    def test_memory_per_cell(self):
+        """
+        benchmark the memory needed per compared cell
+        """
+        before = self.get_bytes_per_cell(DictComparisonData)
+        after = self.get_bytes_per_cell(ComparisonData)
+        if self.debug:
+            print(f"bytes per compared cell: {before:.0f} → {after:.0f}")
+        self.assertLess(after, before)
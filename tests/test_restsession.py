@@ -0,0 +1,109 @@
+"""
+Created on 2026-10-18
+
+@author: wf
+"""
+
+import json
+
+from ngwidgets.basetest import Basetest
+
+from onlinespreadsheet.restsession import RestSession
+from onlinespreadsheet.tablequery import TableQuery
+from tests.fake_endpoints import FakeHandler, FakeHttpServer
+
+
+class JsonHandler(FakeHandler):
+    """
+    JSON handler failing the first request to /flaky
+    and supporting conditional requests for /etag...
+    """
+
+    def do_GET(self):
+        fake = self.fake
+        fake.clients.append(self.client_address)
+        headers = {}
+        if self.path == "/flaky" and not fake.failed:
+            fake.failed = True
+            status, body = 503, b"unavailable"
+        elif self.path.startswith("/etag"):
+            headers["ETag"] = '"v1"'
+            if self.headers.get("If-None-Match") == '"v1"':
+                status, body = 304, b""
+            else:
+                status = 200
+                body = json.dumps([{"path": self.path}]).encode()
+                fake.bodies += 1
+        else:
+            status = 200
+            body = json.dumps([{"path": self.path}]).encode()
+        self.send_body(body, status, headers=headers)
+
+
+class TestRestSession(Basetest):
+    """
+    test the pooled session for RESTful queries
+    """
+
+    def setUp(self, debug=False, profile=True):
+        Basetest.setUp(self, debug=debug, profile=profile)
+        self.server = FakeHttpServer(JsonHandler)
+        self.server.clients = []
+        self.server.failed = False
+        self.server.bodies = 0
+        self.base_url = self.server.base_url
+
+    def tearDown(self):
+        self.server.close()
+        Basetest.tearDown(self)
+
+    def testKeepAliveAndRetry(self):
+        """
+        test that connections are reused and 503 responses are retried
+        """
+        session = RestSession(backoff_factor=0.01)
+        tq = TableQuery(session=session)
+        for name in ["a", "b", "flaky"]:
+            tq.addRESTfulQuery(name=name, url=f"{self.base_url}/{name}")
+        tq.fetchQueryResults()
+        session.close()
+        self.assertEqual([], tq.errors)
+        self.assertEqual([{"path": "/flaky"}], tq.tableEditing.lods["flaky"])
+        # 3 queries + 1 retry over a single kept alive connection
+        self.assertEqual(4, len(self.server.clients))
+        self.assertEqual(1, len(set(self.server.clients)))
+
+    def testConditionalRequests(self):
+        """
+        test that unchanged content is revalidated and reused
+        """
+        session = RestSession()
+        for _i in range(3):
+            tq = TableQuery(session=session)
+            tq.addRESTfulQuery(name="etag", url=f"{self.base_url}/etag")
+            tq.fetchQueryResults()
+            self.assertEqual([], tq.errors)
+            self.assertEqual([{"path": "/etag"}], tq.tableEditing.lods["etag"])
+            # the callers get their own copy of the content
+            tq.tableEditing.lods["etag"][0]["path"] = "modified"
+        session.close()
+        self.assertEqual(3, len(self.server.clients))
+        self.assertEqual(1, self.server.bodies)
+
+    def testValidatorsLRU(self):
+        """
+        test that the kept responses are bounded
+        """
+        session = RestSession(max_entries=2)
+        for path in ["/etag1", "/etag2", "/etag1", "/etag3", "/etag1", "/etag2"]:
+            status_code, content = session.get_json(f"{self.base_url}{path}")
+            self.assertEqual([{"path": path}], content)
+        session.close()
+        # etag2 is evicted by etag3 and needs to be fetched again
+        self.assertEqual(4, self.server.bodies)
+        urls = [f"{self.base_url}/etag1", f"{self.base_url}/etag2"]
+        self.assertEqual(urls, list(session.validators.keys()))
+        # the parsed content is kept with the size of the raw content
+        size = len(json.dumps([{"path": "/etag1"}]).encode())
+        self.assertEqual([{"path": "/etag1"}], session.validators[urls[0]][2])
+        self.assertEqual(2 * size, session.cached_bytes)
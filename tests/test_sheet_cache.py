@@ -0,0 +1,249 @@
+"""
+Created on 2026-10-18
+
+@author: wf
+"""
+
+import csv
+import io
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from ngwidgets.basetest import Basetest
+
+from onlinespreadsheet.sheet_cache import GoogleSheetFetcher, SheetCache
+from tests.fake_endpoints import ConcurrencyCounter
+
+
+class FakeFetcher(ConcurrencyCounter):
+    """
+    fetcher for an in memory spreadsheet recording its requests
+    """
+
+    def __init__(self, sheets: dict):
+        super().__init__()
+        self.sheets = sheets
+        self.revision = "2026-10-18T10:00:00.000Z"
+        self.revision_checks = 0
+
+    def get_revision(self, url: str) -> str:
+        self.revision_checks += 1
+        return self.revision
+
+    def fetch_sheets(self, url: str, sheet_names: list) -> dict:
+        with self.track(list(sheet_names), delay=0.05):
+            sheets = {
+                name: [dict(row) for row in self.sheets[name]] for name in sheet_names
+            }
+        return sheets
+
+    def stream_sheet(self, url: str, sheet_name: str, chunk_size: int = 1000):
+        with self.track(sheet_name):
+            lod = self.sheets[sheet_name]
+            text = io.StringIO()
+            writer = csv.DictWriter(text, fieldnames=list(lod[0].keys()))
+            writer.writeheader()
+            writer.writerows(lod)
+            text.seek(0)
+        yield from GoogleSheetFetcher.iter_records(text, chunk_size)
+
+
+class TestSheetCache(Basetest):
+    """
+    test caching google spreadsheets
+    """
+
+    def setUp(self, debug=False, profile=True):
+        Basetest.setUp(self, debug=debug, profile=profile)
+        self.url = "https://docs.google.com/spreadsheets/d/test"
+        # parsing entity rows needs the Wikidata property list which is
+        # not available offline
+        mapping = [{"Comment": "mapping of the test spreadsheet"}]
+        self.fetcher = FakeFetcher(
+            {
+                "WikidataMapping": mapping,
+                "Event": [{"short_name": "E1"}, {"short_name": "E2"}],
+                "Series": [{"acronym": "S1"}],
+            }
+        )
+        self.cache = SheetCache(self.fetcher, revision_ttl=0)
+
+    def testLoad(self):
+        """
+        test batched and concurrent loading with a revision check
+        """
+        entry = self.cache.load(self.url, ["Event", "Series"])
+        # the mapping and the data sheets are fetched concurrently
+        self.assertEqual(2, len(self.fetcher.requests))
+        self.assertIn(["Event", "Series"], self.fetcher.requests)
+        self.assertEqual(2, self.fetcher.max_active)
+        self.assertEqual({}, entry.wbQueries)
+        self.assertEqual(1, len(self.cache.get_lod(self.url, "Series")))
+        # unchanged revision - no fetch at all
+        wbQueries = entry.wbQueries
+        entry = self.cache.load(self.url, ["Series", "Event"])
+        self.assertEqual(2, len(self.fetcher.requests))
+        # changed revision - the unchanged mapping is not parsed again
+        self.fetcher.revision = "2026-10-18T11:00:00.000Z"
+        self.fetcher.sheets["Event"].append({"short_name": "E3"})
+        entry = self.cache.load(self.url, ["Event", "Series"])
+        self.assertEqual(4, len(self.fetcher.requests))
+        self.assertIs(wbQueries, entry.wbQueries)
+        self.assertEqual(3, len(entry.sheets["Event"]))
+        # forced reload
+        self.cache.load(self.url, ["Event"], force=True)
+        self.assertEqual(6, len(self.fetcher.requests))
+        self.assertIsNone(self.cache.get_lod(self.url, "Series"))
+
+    def testUnknownRevision(self):
+        """
+        test that sheets without revision are kept for the time to live
+        """
+        self.fetcher.revision = None
+        entry = self.cache.load(self.url, ["Event"])
+        self.assertIs(entry, self.cache.load(self.url, ["Event"]))
+        self.assertEqual(2, len(self.fetcher.requests))
+        self.assertEqual(
+            ["E1", "E2"],
+            [row["short_name"] for row in self.cache.load_sheet(self.url, "Event")],
+        )
+        # the missing revision is not asked for again
+        self.assertEqual(1, self.fetcher.revision_checks)
+        # expired sheets are fetched again - the unchanged mapping is reused
+        self.cache.ttl = 0
+        self.assertIsNot(entry, self.cache.load(self.url, ["Event"]))
+        self.assertEqual(4, len(self.fetcher.requests))
+        self.assertIs(entry.wbQueries, self.cache.entries[self.url].wbQueries)
+
+    def testToRecords(self):
+        """
+        test converting batched cell values to records
+        """
+        values = [["name", "year", "note"], ["E1", "2024"], ["E2", "2025", "x"]]
+        records = GoogleSheetFetcher.to_records(values)
+        self.assertEqual(
+            [
+                {"name": "E1", "year": 2024, "note": ""},
+                {"name": "E2", "year": 2025, "note": "x"},
+            ],
+            records,
+        )
+        self.assertEqual([], GoogleSheetFetcher.to_records([]))
+
+    def testIterRecords(self):
+        """
+        test incremental CSV parsing
+        """
+        text = io.StringIO('name,note\r\nE1,"two\nlines"\r\nE2\r\n3,x\r\n', newline="")
+        chunks = list(GoogleSheetFetcher.iter_records(text, chunk_size=2))
+        self.assertEqual(
+            [
+                [{"name": "E1", "note": "two\nlines"}, {"name": "E2", "note": ""}],
+                [{"name": 3, "note": "x"}],
+            ],
+            chunks,
+        )
+
+    def testStreamLod(self):
+        """
+        test streaming a large sheet in chunks
+        """
+        rows = 100000
+        self.fetcher.sheets["Big"] = [
+            {"short_name": f"E{i}", "year": 2000 + i % 25, "title": f"Event {i}"}
+            for i in range(rows)
+        ]
+        start = time.time()
+        chunks = self.cache.stream_lod(self.url, "Big", chunk_size=1000)
+        first = next(chunks)
+        first_paint = time.time() - start
+        self.assertEqual(1000, len(first))
+        self.assertEqual(
+            {"short_name": "E0", "year": 2000, "title": "Event 0"}, first[0]
+        )
+        self.assertTrue(first_paint < 1.0)
+        total = len(first) + sum(len(chunk) for chunk in chunks)
+        if self.debug:
+            print(f"first chunk after {first_paint:.3f}s of {time.time()-start:.3f}s")
+        self.assertEqual(rows, total)
+        # the streamed sheet is cached for the same revision
+        self.assertEqual(rows, len(self.cache.get_lod(self.url, "Big")))
+        chunks = list(self.cache.stream_lod(self.url, "Big", chunk_size=30000))
+        self.assertEqual([30000, 30000, 30000, 10000], [len(chunk) for chunk in chunks])
+        self.assertEqual(["Big"], self.fetcher.requests)
+        # the mapping and the other sheets still need to be fetched
+        entry = self.cache.load(self.url, ["Big", "Event"])
+        self.assertEqual(
+            [["Event"], ["WikidataMapping"]], sorted(self.fetcher.requests[1:])
+        )
+        self.assertEqual(rows, len(entry.sheets["Big"]))
+
+    def testStreamWithMapping(self):
+        """
+        test streaming a sheet while the mapping is loaded concurrently
+        without revision
+        """
+        self.fetcher.revision = None
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            future = executor.submit(self.cache.load, self.url, [])
+            lod = [
+                row
+                for chunk in self.cache.stream_lod(self.url, "Event", chunk_size=1)
+                for row in chunk
+            ]
+            self.assertEqual({}, future.result().wbQueries)
+        # the streamed sheet is not downloaded again
+        entry = self.cache.load(self.url, ["Event"])
+        self.assertEqual(lod, entry.sheets["Event"])
+        self.assertEqual({}, entry.wbQueries)
+        self.assertEqual(
+            sorted([["WikidataMapping"], "Event"], key=str),
+            sorted(self.fetcher.requests, key=str),
+        )
+
+    def testPreload(self):
+        """
+        test preloading sheets in the background
+        """
+        for sheet_name in ["A", "B", "C"]:
+            self.fetcher.sheets[sheet_name] = [
+                {"name": f"{sheet_name}{i}"} for i in range(10)
+            ]
+        futures = self.cache.preload(self.url, ["A", "B", "C"])
+        # pending preloads are shared
+        self.assertIs(futures["B"], self.cache.preload(self.url, ["B"])["B"])
+        lods = {name: future.result(timeout=5) for name, future in futures.items()}
+        # a single batched request
+        self.assertEqual([["A", "B", "C"]], self.fetcher.requests)
+        self.assertIs(lods["C"], self.cache.get_lod(self.url, "C"))
+        # a done preload of an unchanged sheet does not fetch again
+        lod = self.cache.preload(self.url, ["A"])["A"].result(timeout=5)
+        self.assertIs(lods["A"], lod)
+        self.assertEqual(1, len(self.fetcher.requests))
+        # a failing preload fails the futures of all sheets of its batch
+        futures = self.cache.preload(self.url, ["D", "E"])
+        for future in futures.values():
+            with self.assertRaises(KeyError):
+                future.result(timeout=5)
+
+    def testEviction(self):
+        """
+        test that the least recently used sheets are evicted
+        """
+        cache = SheetCache(self.fetcher, revision_ttl=60, max_rows=25)
+        for sheet_name in ["A", "B", "C"]:
+            self.fetcher.sheets[sheet_name] = [
+                {"name": f"{sheet_name}{i}"} for i in range(10)
+            ]
+        cache.load_sheet(self.url, "A")
+        cache.load_sheet(self.url, "B")
+        # A is used more recently than B
+        self.assertIsNotNone(cache.get_lod(self.url, "A"))
+        cache.load_sheet(self.url, "C")
+        self.assertIsNone(cache.get_lod(self.url, "B"))
+        self.assertIsNotNone(cache.get_lod(self.url, "A"))
+        self.assertIsNotNone(cache.get_lod(self.url, "C"))
+        self.assertEqual(20, sum(cache.usage.values()))
+        # an evicted sheet is fetched again
+        cache.load_sheet(self.url, "B")
+        self.assertEqual([["A"], ["B"], ["C"], ["B"]], self.fetcher.requests)
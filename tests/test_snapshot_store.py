@@ -0,0 +1,80 @@
+"""
+Created on 2026-10-18
+
+@author: wf
+"""
+
+import tempfile
+
+from ngwidgets.basetest import Basetest
+
+from onlinespreadsheet.lod_delta import lod_hash
+from onlinespreadsheet.sheet_cache import SheetCache
+from onlinespreadsheet.snapshot_store import SnapshotStore
+from tests.test_sheet_cache import FakeFetcher
+
+
+class TestSnapshotStore(Basetest):
+    """
+    test the local store of imported sheets
+    """
+
+    def setUp(self, debug=False, profile=True):
+        Basetest.setUp(self, debug=debug, profile=profile)
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db_path = f"{self.tmpdir.name}/snapshots.db"
+        self.url = "https://docs.google.com/spreadsheets/d/test"
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+        Basetest.tearDown(self)
+
+    def testSnapshots(self):
+        """
+        test content addressed versions of a sheet
+        """
+        store = SnapshotStore(self.db_path, max_versions=2)
+        self.assertIsNone(store.load_latest(self.url, "Event"))
+        lod = [{"short_name": f"E{i}", "year": 2000 + i} for i in range(1000)]
+        first = store.put(self.url, "Event", lod, revision="r1")
+        self.assertEqual(lod_hash(lod), first.content_hash)
+        self.assertEqual(lod, store.load_latest(self.url, "Event"))
+        # unchanged content is not stored again
+        self.assertEqual(first, store.put(self.url, "Event", list(lod), revision="r2"))
+        self.assertEqual(1, len(store.history(self.url, "Event")))
+        lod[7]["year"] = 1999
+        second = store.put(self.url, "Event", lod, revision="r3")
+        self.assertNotEqual(first.content_hash, second.content_hash)
+        lod.append({"short_name": "E1000", "year": 3000})
+        third = store.put(self.url, "Event", lod, revision="r4")
+        history = store.history(self.url, "Event")
+        self.assertEqual([third, second], history)
+        # the pruned content is gone
+        self.assertIsNone(store.get_lod(first.content_hash))
+        self.assertEqual(1999, store.get_lod(second.content_hash)[7]["year"])
+        self.assertEqual(1001, store.latest(self.url, "Event").rows)
+
+    def testSheetCacheSnapshots(self):
+        """
+        test that the sheet cache takes snapshots of fetched sheets
+        """
+        store = SnapshotStore(self.db_path)
+        fetcher = FakeFetcher(
+            {
+                "WikidataMapping": [{"Comment": "empty mapping"}],
+                "Event": [{"short_name": "E1"}, {"short_name": "E2"}],
+                "Series": [{"acronym": "S1"}],
+            }
+        )
+        cache = SheetCache(fetcher, revision_ttl=0, snapshot_store=store)
+        cache.load(self.url, ["Event"])
+        self.assertEqual(
+            [{"short_name": "E1"}, {"short_name": "E2"}],
+            store.load_latest(self.url, "Event"),
+        )
+        self.assertEqual(
+            "2026-10-18T10:00:00.000Z", store.latest(self.url, "Event").revision
+        )
+        self.assertIsNotNone(store.latest(self.url, "WikidataMapping"))
+        list(cache.stream_lod(self.url, "Series"))
+        self.assertEqual([{"acronym": "S1"}], store.load_latest(self.url, "Series"))
@@ -0,0 +1,87 @@
+"""
+Created on 2026-10-18
+
+@author: wf
+"""
+
+from contextlib import nullcontext
+from types import SimpleNamespace
+
+from ngwidgets.basetest import Basetest
+
+from onlinespreadsheet.spreadsheet_view import SpreadSheetView
+
+
+class ViewGrid:
+    """
+    ListOfDictsGrid stand-in recording the updates and grid method calls
+    """
+
+    def __init__(self):
+        self.lod = None
+        self.calls = []
+        self.config = SimpleNamespace(lenient=False)
+        self.ag_grid = SimpleNamespace(
+            options={},
+            run_grid_method=lambda name, args: self.calls.append((name, args)),
+        )
+
+    def load_lod(self, lod: list):
+        self.lod = lod
+        self.calls.append(("load_lod", dict(self.ag_grid.options)))
+
+    def update(self):
+        self.calls.append(("update", dict(self.ag_grid.options)))
+
+    def update_index(self, lenient: bool = False):
+        pass
+
+
+class TestSpreadSheetView(Basetest):
+    """
+    test showing the changes of a sheet import in its grid
+    """
+
+    def setUp(self, debug=False, profile=True):
+        Basetest.setUp(self, debug=debug, profile=profile)
+        self.view = SpreadSheetView.__new__(SpreadSheetView)
+        self.view.solution = SimpleNamespace(content_div=nullcontext())
+        self.view.args = SimpleNamespace(pk="short_name")
+        self.view.sheetName = "Event"
+        self.view.wbQueries = {}
+        self.view.lod_grids = {"Event": ViewGrid()}
+        self.view.grid_sources = {}
+        self.view.row_hashes = {}
+        self.view.row_id_columns = {}
+        self.view.delta = None
+
+    def testApplyItems(self):
+        """
+        test that the changes of a reload are applied as row transactions
+        """
+        grid = self.view.lod_grids["Event"]
+        cached = [{"short_name": f"E{i}", "year": 2020 + i} for i in range(3)]
+        self.view.show_items("Event", cached)
+        self.assertIn(":getRowId", grid.calls[0][1])
+        # the grid rows are copies of the cached rows
+        grid.lod[2]["year"] = 1999
+        self.assertEqual(2022, cached[2]["year"])
+        items = [
+            {"short_name": "E0", "year": 2020},
+            {"short_name": "E1", "year": 2000},
+            {"short_name": "E3", "year": 2023},
+        ]
+        self.view.apply_items(items, "Event")
+        name, transaction = grid.calls[-1]
+        self.assertEqual("applyTransaction", name)
+        self.assertEqual([items[2]], transaction["add"])
+        self.assertEqual([items[1]], transaction["update"])
+        self.assertEqual(["E2"], [row["short_name"] for row in transaction["remove"]])
+        self.assertEqual(items, grid.lod)
+        self.assertIsNot(items[1], grid.lod[1])
+        # rows with a duplicate primary key are pushed once without row ids
+        self.view.apply_items(items + [{"short_name": "E3", "year": 2024}], "Event")
+        name, options = grid.calls[-1]
+        self.assertEqual("update", name)
+        self.assertNotIn(":getRowId", options)
+        self.assertIsNone(self.view.row_id_columns["Event"])
@@ -7,6 +7,7 @@ Created on 09.12.2021
 import copy
 import getpass
 import os
+import time
 
 from lodstorage.lod import LOD
 from lodstorage.query import Query
@@ -16,6 +17,7 @@ from spreadsheet.tableediting import SpreadSheetType
 from wikibot3rd.wikiuser import WikiUser
 
 from onlinespreadsheet.tablequery import QueryType, TableQuery
+from tests.fake_endpoints import FakeEndpoint
 
 
 class TestTableQuery(Basetest):
@@ -273,6 +275,91 @@ LIMIT 7
         self.assertTrue("WEBIST_confref" in tq.tableEditing.lods)
         self.assertTrue(len(tq.tableEditing.lods["WEBIST_confref"]) > 15)
 
+    def testConcurrentFetch(self):
+        """
+        test fetching query results concurrently with per source limits
+        """
+        endpoint1 = FakeEndpoint("http://endpoint1/sparql", delay=0.3)
+        endpoint2 = FakeEndpoint("http://endpoint2/sparql", delay=0.3)
+        tq = TableQuery(maxPerSource=2)
+        tq.setSourceLimit(endpoint2.url, 1)
+        for i, endpoint in enumerate([endpoint1] * 4 + [endpoint2] * 2):
+            query = Query(name=f"q{i}", query=f"SELECT * WHERE {{ ?s ?p {i} }}")
+            query.endpoint = endpoint
+            tq.addQuery(query)
+        start = time.time()
+        tq.fetchQueryResults(parallel=True)
+        elapsed = time.time() - start
+        if self.debug:
+            print(f"fetched {len(tq.queries)} queries in {elapsed:.2f} s")
+        self.assertEqual(6, len(tq.tableEditing.lods))
+        self.assertEqual(2, endpoint1.max_active)
+        self.assertEqual(1, endpoint2.max_active)
+        # sequential would take 6 x 0.3 s
+        self.assertLess(elapsed, 1.2)
+
+    def testPagedSparqlQuery(self):
+        """
+        test fetching a SPARQL query result page by page
+        """
+        queryText = "SELECT ?index WHERE { ?s ?p ?index } ORDER BY ?index"
+        for suffix, pageSize, expected, pages in [
+            ("", 10, list(range(25)), 3),
+            ("", 5, list(range(25)), 6),
+            ("\nLIMIT 12", 5, list(range(12)), 3),
+            ("\nLIMIT 8 OFFSET 20", 5, list(range(20, 25)), 2),
+            ("\nOFFSET 10 LIMIT 8", 5, list(range(10, 18)), 2),
+            ("\noffset 20", 10, list(range(20, 25)), 1),
+        ]:
+            for parallel in [False, True]:
+                with self.subTest(suffix=suffix, pageSize=pageSize, parallel=parallel):
+                    endpoint = FakeEndpoint(records=[{"index": i} for i in range(25)])
+                    tq = TableQuery()
+                    query = Query(name="paged", query=queryText + suffix)
+                    query.endpoint = endpoint
+                    query.pageSize = pageSize
+                    tq.addQuery(query)
+                    tq.fetchQueryResults(parallel=parallel)
+                    lod = tq.tableEditing.lods["paged"]
+                    self.assertEqual(expected, [record["index"] for record in lod])
+                    self.assertEqual(pages, len(endpoint.requests))
+        # the pages are added to the table as they arrive
+        endpoint = FakeEndpoint(records=[{"index": i} for i in range(25)])
+        answer = endpoint.answer
+        tq = TableQuery()
+        tableSizes = []
+
+        def recording_answer(query: str):
+            tableSizes.append(len(tq.tableEditing.lods["paged"]))
+            return answer(query)
+
+        endpoint.answer = recording_answer
+        query = Query(name="paged", query=queryText)
+        query.endpoint = endpoint
+        query.pageSize = 10
+        tq.addQuery(query)
+        tq.fetchQueryResults()
+        self.assertEqual([0, 10, 20], tableSizes)
+        self.assertEqual(25, len(tq.tableEditing.lods["paged"]))
+        # a failing page leaves no partial result behind
+        endpoint = FakeEndpoint(records=[{"index": i} for i in range(25)])
+        answer = endpoint.answer
+
+        def failing_answer(query: str):
+            if "OFFSET 0" not in query:
+                raise Exception("page failed")
+            return answer(query)
+
+        endpoint.answer = failing_answer
+        tq = TableQuery()
+        query = Query(name="paged", query=queryText)
+        query.endpoint = endpoint
+        query.pageSize = 10
+        tq.addQuery(query)
+        with self.assertRaises(Exception):
+            tq.fetchQueryResults()
+        self.assertNotIn("paged", tq.tableEditing.lods)
+
     def testGuessQueryType(self):
         """
         tests guessing the query type